@@ -0,0 +1,141 @@
+"""
+This library maintains the aiobotocore clients used by the asyncio backend: `async_query_aws`, `async_query_aws_pages`,
+and `AwsTask.async_method`. aiobotocore sends requests with aiohttp, so thousands of requests may be in flight on one
+event loop without holding a thread each. It is an optional dependency which is installed with the `async` extra:
+
+    pip install CloudHarvestPluginAws[async]
+
+The connections of an aiobotocore client belong to the event loop which created it, so clients are pooled per event loop.
+Like the clients in `CloudHarvestPluginAws.clients`, they are created with botocore's own retries disabled. Call
+`close_clients()` before the event loop is closed.
+
+Configuration:
+- platforms.aws.async.max_pool_connections: The number of connections each client may open at once. Defaults to 1000.
+- platforms.aws.async.max_concurrency: The number of `fan_out` items in flight at once. Defaults to 256.
+- platforms.aws.client_pool.max_clients: The maximum number of clients kept for each event loop. Defaults to 256.
+"""
+from collections import OrderedDict
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+DEFAULT_MAX_POOL_CONNECTIONS = 1000
+DEFAULT_MAX_CONCURRENCY = 256
+
+
+class CachedAioClients:
+    clients = {}        # event loop -> OrderedDict of client key -> asyncio.Task which creates the client
+    lock = Lock()
+    session = None
+
+
+async def get_client(service: str, region: str = None, credentials: dict = None, config: dict = None):
+    """
+    Retrieves an aiobotocore client for the running event loop, creating it when it does not exist yet. The least
+    recently used client is closed once the loop holds more than `platforms.aws.client_pool.max_clients` clients.
+
+    Arguments
+        service (str): The AWS service (e.g., 's3', 'ec2').
+        region (str, optional): The AWS region. None is supported as not all AWS services require a region.
+        credentials (dict, optional): The AWS credentials in the format accepted by the boto3 Session. When not provided, botocore will attempt to use the default credentials.
+        config (dict, optional): Keyword arguments for an aiobotocore `AioConfig` object, merged over `DEFAULT_CONFIG` in `CloudHarvestPluginAws.clients`.
+
+    Returns
+        aiobotocore.client.AioBaseClient: A client for the service.
+    """
+    from asyncio import get_running_loop, shield
+    from CloudHarvestCoreTasks.environment import Environment
+    from CloudHarvestPluginAws.clients import DEFAULT_MAX_CLIENTS, credentials_identity, merge_config
+
+    credentials = credentials or {}
+    config = merge_config({'max_pool_connections': _setting('max_pool_connections', DEFAULT_MAX_POOL_CONNECTIONS)} | (config or {}))
+    max_clients = int(Environment.get('platforms.aws.client_pool.max_clients') or DEFAULT_MAX_CLIENTS)
+
+    key = (credentials_identity(credentials), service, region, repr(sorted(config.items())))
+    loop = get_running_loop()
+    evicted = []
+
+    with CachedAioClients.lock:
+        clients = CachedAioClients.clients.setdefault(loop, OrderedDict())
+        task = clients.get(key)
+
+        if task is None:
+            # Concurrent requests for the same client wait for the task instead of creating their own client
+            task = clients[key] = loop.create_task(_create_client(service, region, credentials, config))
+
+            while len(clients) > max_clients:
+                evicted.append(clients.popitem(last=False)[1])
+
+        else:
+            clients.move_to_end(key)
+
+    for evicted_task in evicted:
+        await _close(evicted_task)
+
+    try:
+        return await shield(task)
+
+    except Exception:
+        # A client which could not be created is not kept, so the next request tries again
+        with CachedAioClients.lock:
+            if clients.get(key) is task:
+                del clients[key]
+
+        raise
+
+
+async def close_clients() -> None:
+    """
+    Closes every client created by the running event loop.
+    """
+    from asyncio import get_running_loop
+
+    with CachedAioClients.lock:
+        clients = CachedAioClients.clients.pop(get_running_loop(), None) or {}
+
+    for task in clients.values():
+        await _close(task)
+
+
+async def _create_client(service: str, region: str, credentials: dict, config: dict):
+    try:
+        from aiobotocore.config import AioConfig
+        from aiobotocore.session import get_session
+
+    except ImportError:
+        from CloudHarvestPluginAws.exceptions import HarvestAwsException
+        raise HarvestAwsException('The asyncio backend requires the `aiobotocore` package, which is installed with '
+                                  'the `async` extra')
+
+    # Clients are made from the same session, which lets them share the loaded service models
+    with CachedAioClients.lock:
+        if CachedAioClients.session is None:
+            CachedAioClients.session = get_session()
+
+        session = CachedAioClients.session
+
+    client = await session.create_client(service_name=service,
+                                         region_name=region,
+                                         config=AioConfig(**config),
+                                         **{k: v for k, v in credentials.items() if v}).__aenter__()
+
+    logger.debug(f'created asyncio {service}:{region} client')
+
+    return client
+
+
+async def _close(task) -> None:
+    try:
+        client = await task
+
+    # The client was never created, so there is nothing to close
+    except Exception:
+        return
+
+    await client.__aexit__(None, None, None)
+
+
+def _setting(name: str, default):
+    from CloudHarvestCoreTasks.environment import Environment
+    return type(default)(Environment.get(f'platforms.aws.async.{name}') or default)
@@ -1 +1,3 @@
+from CloudHarvestPluginAws.api.blueprints.metrics.routes import metrics_bp
+from CloudHarvestPluginAws.api.blueprints.reports.routes import reports_bp
 from CloudHarvestPluginAws.api.blueprints.test.routes import test_pb
@@ -0,0 +1,24 @@
+from CloudHarvestCoreTasks.blueprints import HarvestApiBlueprint
+from flask import jsonify, request
+
+
+metrics_bp = HarvestApiBlueprint(
+    'aws_metrics_bp', __name__
+)
+
+
+@metrics_bp.route('/aws/metrics')
+def get_metrics():
+    """
+    Returns the aggregated telemetry of AWS calls and credential acquisition.
+
+    Query parameters
+        kind (str, optional): Only return metrics of this kind, such as 'call' or 'get_profile'.
+        sort (str, optional): The metric to sort by, descending. Defaults to 'seconds'.
+        limit (int, optional): The maximum number of metrics to return.
+    """
+    from CloudHarvestPluginAws.telemetry import snapshot
+
+    return jsonify(snapshot(kind=request.args.get('kind'),
+                            sort=request.args.get('sort') or 'seconds',
+                            limit=request.args.get('limit', type=int)))
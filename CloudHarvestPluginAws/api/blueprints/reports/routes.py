@@ -0,0 +1,46 @@
+from CloudHarvestCoreTasks.blueprints import HarvestApiBlueprint
+from flask import Response, request
+
+
+reports_bp = HarvestApiBlueprint(
+    'aws_reports_bp', __name__
+)
+
+
+@reports_bp.route('/aws/reports/materialized/<name>', methods=['GET', 'POST'])
+def get_materialized_report(name: str):
+    """
+    Returns the materialized rows of a report, building them if they do not exist.
+
+    Body (POST)
+        parameters (dict, optional): The values of the report's `var.` references.
+    """
+    from json import dumps
+    from CloudHarvestPluginAws.materialized import get_report
+
+    parameters = (request.get_json(silent=True) or {}).get('parameters') if request.method == 'POST' else None
+
+    # Rows may contain ObjectIds and datetimes
+    return Response(dumps(get_report(name, parameters), default=str), mimetype='application/json')
+
+
+@reports_bp.route('/aws/reports/materialized/refresh', methods=['POST'])
+def refresh_materialized_reports():
+    """
+    Refreshes the materialized rows affected by a collection pass.
+
+    Body
+        account (str): The AWS account number.
+        region (str, optional): The AWS region. Omitted for global services.
+        service (str, optional): The AWS service.
+        type (str, optional): The service type.
+    """
+    from flask import jsonify
+    from CloudHarvestPluginAws.materialized import refresh
+
+    body = request.get_json(silent=True) or {}
+
+    return jsonify({'refreshed': refresh(account=body.get('account'),
+                                         region=body.get('region'),
+                                         service=body.get('service'),
+                                         type=body.get('type'))})
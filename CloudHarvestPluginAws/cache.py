@@ -0,0 +1,122 @@
+"""
+This library provides a thread safe, least recently used cache whose entries may expire. It is used wherever the plugin
+keeps data in memory between tasks, such as profiles and account aliases.
+"""
+from collections import OrderedDict
+from threading import RLock
+
+_MISSING = object()
+
+
+class TtlCache:
+    def __init__(self, max_size: int = None, ttl: float = None):
+        """
+        Initializes a new TtlCache instance.
+
+        Arguments
+            max_size (int, optional): The maximum number of entries. The least recently used entry is evicted when the cache is full. Defaults to unlimited.
+            ttl (float, optional): The default number of seconds an entry remains valid. Defaults to no expiration.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.entries = OrderedDict()    # key -> (expires at, value)
+        self.lock = RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key, default=None, count: bool = True):
+        """
+        Retrieves an entry, marking it as recently used.
+
+        Arguments
+            key (Hashable): The key.
+            default (Any, optional): Returned when the key is missing or expired.
+            count (bool, optional): When True, the lookup is included in the hit and miss counters. Defaults to True.
+        """
+        from time import monotonic
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry[0] is not None and entry[0] <= monotonic():
+                del self.entries[key]
+                entry = None
+
+            if entry is None:
+                if count:
+                    self.misses += 1
+
+                return default
+
+            self.entries.move_to_end(key)
+
+            if count:
+                self.hits += 1
+
+            return entry[1]
+
+    def set(self, key, value, ttl: float = None) -> None:
+        """
+        Adds or replaces an entry.
+
+        Arguments
+            key (Hashable): The key.
+            value (Any): The value.
+            ttl (float, optional): The number of seconds the entry remains valid. Defaults to the cache's ttl.
+        """
+        from time import monotonic
+
+        ttl = ttl if ttl is not None else self.ttl
+
+        with self.lock:
+            self.entries[key] = (monotonic() + ttl if ttl is not None else None, value)
+            self.entries.move_to_end(key)
+
+            while self.max_size and len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """
+        Removes an entry and returns its value.
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+
+        return default if entry is None else entry[1]
+
+    def items(self) -> list:
+        """
+        Returns a list of the (key, value) pairs which have not expired.
+        """
+        from time import monotonic
+
+        now = monotonic()
+
+        with self.lock:
+            return [(key, value) for key, (expires_at, value) in self.entries.items()
+                    if expires_at is None or expires_at > now]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the size of the cache and its hit, miss, and eviction counters.
+        """
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,173 @@
+"""
+This library maintains a pool of boto3 clients which are reused by `query_aws`. Building a client loads the botocore
+service model and endpoint data and opens a new HTTPS connection pool, which is expensive when a template iterates over
+hundreds of items. boto3 clients are thread safe, so a single client can be shared by every task which uses the same
+credentials, service, region, and configuration.
+
+Clients are created with botocore's own retries disabled. `query_aws` retries throttling and transient errors itself,
+with jitter and a shared retry budget; retries made by botocore underneath it would multiply the attempts and would not
+be counted by `RetryStats` or telemetry.
+
+Configuration:
+- platforms.aws.client_pool.max_clients: The maximum number of clients kept in the pool. Defaults to 256.
+"""
+from collections import OrderedDict
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+DEFAULT_MAX_CLIENTS = 256
+
+# Keyword arguments for the botocore `Config` of every client; a caller-supplied config is merged over them
+DEFAULT_CONFIG = {'retries': {'total_max_attempts': 1}}
+
+
+class CachedClients:
+    clients = OrderedDict()
+    lock = Lock()
+    session = None
+
+
+def credentials_identity(credentials: dict = None) -> str:
+    """
+    Returns a stable identifier for a set of credentials. The identifier is a hash so secrets are never used as keys.
+
+    Arguments
+        credentials (dict, optional): The AWS credentials in the format accepted by the boto3 Session.
+
+    Returns
+        str: 'default' when no credentials are provided, otherwise a hash of the credentials.
+    """
+    if not credentials or not any(credentials.values()):
+        return 'default'
+
+    from hashlib import sha256
+    return sha256(
+        '|'.join(str(credentials.get(key) or '') for key in ('aws_access_key_id',
+                                                             'aws_secret_access_key',
+                                                             'aws_session_token')).encode()
+    ).hexdigest()
+
+
+def get_client(service: str,
+               region: str = None,
+               credentials: dict = None,
+               config: dict = None,
+               endpoint_url: str = None):
+    """
+    Retrieves a client from the pool, creating it when it does not exist yet. The least recently used client is evicted
+    once the pool exceeds `platforms.aws.client_pool.max_clients`.
+
+    Arguments
+        service (str): The AWS service (e.g., 's3', 'ec2').
+        region (str, optional): The AWS region. None is supported as not all AWS services require a region.
+        credentials (dict, optional): The AWS credentials in the format accepted by the boto3 Session. When not provided, boto3 will attempt to use the default credentials.
+        config (dict, optional): Keyword arguments for a botocore `Config` object, merged over `DEFAULT_CONFIG`.
+        endpoint_url (str, optional): Overrides the endpoint used by the client.
+
+    Returns
+        botocore.client.BaseClient: A client for the service.
+    """
+    credentials = credentials or {}
+    config = merge_config(config)
+
+    key = (credentials_identity(credentials), service, region, repr(sorted(config.items())), endpoint_url)
+
+    with CachedClients.lock:
+        client = CachedClients.clients.get(key)
+
+        if client is not None:
+            CachedClients.clients.move_to_end(key)
+            return client
+
+        # boto3 sessions are not thread safe, so clients are only created while the lock is held. All clients are made
+        # from the same session, which lets them share the loaded service models.
+        if CachedClients.session is None:
+            from boto3 import Session
+            CachedClients.session = Session()
+
+        from botocore.config import Config
+        client = CachedClients.session.client(
+            service_name=service,
+            region_name=region,
+            config=Config(**config),
+            endpoint_url=endpoint_url,
+            **{k: v for k, v in credentials.items() if v}
+        )
+
+        CachedClients.clients[key] = client
+
+        max_clients = _max_clients()
+        while len(CachedClients.clients) > max_clients:
+            evicted_key, evicted_client = CachedClients.clients.popitem(last=False)
+            _close(evicted_client)
+            logger.debug(f'evicted {evicted_key[1]}:{evicted_key[2]} client from the pool')
+
+    return client
+
+
+def merge_config(config: dict = None) -> dict:
+    """
+    Merges a caller-supplied client configuration over `DEFAULT_CONFIG`. The `retries` dictionaries are merged key by key,
+    so a caller which only sets the retry `mode` keeps botocore's retries disabled.
+
+    Arguments
+        config (dict, optional): Keyword arguments for a botocore `Config` object.
+
+    Returns
+        dict: The merged keyword arguments.
+    """
+    config = config or {}
+    merged = DEFAULT_CONFIG | config
+    merged['retries'] = DEFAULT_CONFIG['retries'] | (config.get('retries') or {})
+
+    return merged
+
+
+def evict_clients(credentials: dict = None) -> int:
+    """
+    Removes every pooled client which uses the provided credentials. This is called when a Profile refreshes its
+    credentials so expired clients do not linger in the pool.
+
+    Arguments
+        credentials (dict, optional): The AWS credentials in the format accepted by the boto3 Session.
+
+    Returns
+        int: The number of clients removed from the pool.
+    """
+    identity = credentials_identity(credentials)
+
+    with CachedClients.lock:
+        keys = [key for key in CachedClients.clients.keys() if key[0] == identity]
+
+        for key in keys:
+            _close(CachedClients.clients.pop(key))
+
+    if keys:
+        logger.debug(f'evicted {len(keys)} clients from the pool')
+
+    return len(keys)
+
+
+def clear_clients() -> None:
+    """
+    Removes all clients from the pool.
+    """
+    with CachedClients.lock:
+        while CachedClients.clients:
+            _close(CachedClients.clients.popitem()[1])
+
+
+def _close(client) -> None:
+    # Older versions of botocore do not provide `close()`
+    try:
+        client.close()
+
+    except AttributeError:
+        pass
+
+
+def _max_clients() -> int:
+    from CloudHarvestCoreTasks.environment import Environment
+    return int(Environment.get('platforms.aws.client_pool.max_clients') or DEFAULT_MAX_CLIENTS)
@@ -0,0 +1,195 @@
+"""
+This library merges concurrent single-resource requests into multi-ID describe calls. A burst of targeted refreshes, such
+as `single` tasks queued after an event storm, would otherwise make one API call per resource.
+
+A request for an (account, region, service, command) which arrives while no other call for it is pending is sent
+immediately. A request which arrives while a call is being made starts a batch and waits for a short window. Every request
+which arrives during the window joins the batch, up to the API's maximum number of IDs. A single call is then made for the
+whole batch and each request receives the records which match its own IDs. When the batch call fails, such as when one of the IDs no longer
+exists, each request is retried on its own so one missing resource does not fail the others.
+
+Configuration:
+- platforms.aws.coalesce.window: The number of seconds a batch waits for more requests. Defaults to 0.05.
+"""
+from concurrent.futures import Future
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+DEFAULT_WINDOW = 0.05
+DEFAULT_MAX_BATCH = 100
+
+# The maximum number of IDs accepted by each command
+MAX_BATCH_SIZES = {
+    ('ec2', 'describe_images'): 1000,
+    ('ec2', 'describe_instances'): 1000,
+    ('ec2', 'describe_security_groups'): 1000,
+    ('ec2', 'describe_snapshots'): 1000,
+    ('ec2', 'describe_subnets'): 1000,
+    ('ec2', 'describe_volumes'): 1000,
+    ('ec2', 'describe_vpcs'): 1000,
+}
+
+
+class Batch:
+    def __init__(self):
+        """
+        A group of requests which are executed with a single call.
+        """
+        self.ids = {}           # ID -> None; a dict keeps the order of the IDs and makes membership checks constant time
+        self.requests = []      # (ids, Future)
+
+    def add(self, ids: list) -> Future:
+        future = Future()
+
+        self.ids.update(dict.fromkeys(ids))
+        self.requests.append((ids, future))
+
+        return future
+
+    def size_with(self, ids: list) -> int:
+        """
+        Returns the number of IDs the batch would contain after adding `ids`.
+        """
+        return len(self.ids) + sum(1 for i in set(ids) if i not in self.ids)
+
+
+class PendingBatches:
+    lock = Lock()
+    batches = {}
+    active = {}     # key -> the number of batches being waited for or executed
+
+    calls = 0       # Calls made for batches
+    requests = 0    # Requests which joined a batch
+
+
+def coalesce(key: tuple, ids: list, execute, path: str, max_batch: int = None, window: float = None):
+    """
+    Executes a request for `ids` as part of a batch.
+
+    Arguments
+        key (tuple): Identifies requests which may share a call, such as (credentials, region, service, command, other arguments).
+        ids (list): The IDs requested by this caller.
+        execute (callable): A function which accepts a list of IDs and returns a list of records.
+        path (str): The dot-separated path to the ID in each record, such as 'Instances.InstanceId'. Lists along the path
+            are filtered so each caller only receives the items it requested.
+        max_batch (int, optional): The maximum number of IDs in a call. Defaults to DEFAULT_MAX_BATCH.
+        window (float, optional): The number of seconds a batch waits for more requests. Defaults to `platforms.aws.coalesce.window`.
+
+    Returns
+        list: The records which match `ids`.
+    """
+    from time import sleep
+
+    max_batch = max_batch or DEFAULT_MAX_BATCH
+
+    # Requests which cannot share a batch are executed directly
+    if len(ids) >= max_batch:
+        return execute(ids)
+
+    with PendingBatches.lock:
+        batch = PendingBatches.batches.get(key)
+        leader = batch is None or batch.size_with(ids) > max_batch
+
+        if leader:
+            batch = Batch()
+
+            # Only wait for more requests while another call is pending; otherwise there is nothing to batch with
+            wait = PendingBatches.active.get(key, 0) > 0
+            PendingBatches.active[key] = PendingBatches.active.get(key, 0) + 1
+
+            if wait:
+                PendingBatches.batches[key] = batch
+
+        future = batch.add(ids)
+        PendingBatches.requests += 1
+
+    if leader:
+        try:
+            if wait:
+                sleep(_window() if window is None else window)
+
+                # Close the batch so later requests start a new one
+                with PendingBatches.lock:
+                    if PendingBatches.batches.get(key) is batch:
+                        del PendingBatches.batches[key]
+
+            with PendingBatches.lock:
+                PendingBatches.calls += 1
+
+            _execute_batch(batch, execute, path)
+
+        finally:
+            with PendingBatches.lock:
+                PendingBatches.active[key] -= 1
+
+                if not PendingBatches.active[key]:
+                    del PendingBatches.active[key]
+
+    return future.result()
+
+
+def stats() -> dict:
+    """
+    Returns the number of requests which joined a batch and the number of calls made for them.
+    """
+    return {
+        'requests': PendingBatches.requests,
+        'calls': PendingBatches.calls
+    }
+
+
+def _execute_batch(batch: Batch, execute, path: str) -> None:
+    parts = str(path).split('.')
+
+    try:
+        records = execute(list(batch.ids))
+
+    except Exception as e:
+        if len(batch.requests) == 1:
+            batch.requests[0][1].set_exception(e)
+            return
+
+        logger.debug(f'batch of {len(batch.ids)} IDs failed; retrying each request: {e}')
+
+        for ids, future in batch.requests:
+            try:
+                future.set_result(execute(ids))
+
+            except Exception as request_error:
+                future.set_exception(request_error)
+
+        return
+
+    records = records if isinstance(records, list) else [records]
+
+    for ids, future in batch.requests:
+        selected = [_select(record, parts, set(ids)) for record in records]
+        future.set_result([record for record in selected if record is not None])
+
+
+def _select(record, parts: list, ids: set):
+    """
+    Returns the record restricted to the items which match `ids`, or None when nothing matches.
+    """
+    if not isinstance(record, dict):
+        return None
+
+    head, rest = parts[0], parts[1:]
+    value = record.get(head)
+
+    if not rest:
+        return record if value in ids else None
+
+    if isinstance(value, list):
+        kept = [item for item in (_select(item, rest, ids) for item in value) if item is not None]
+        return type(record)(record, **{head: kept}) if kept else None
+
+    selected = _select(value, rest, ids)
+    return type(record)(record, **{head: selected}) if selected is not None else None
+
+
+def _window() -> float:
+    from CloudHarvestCoreTasks.environment import Environment
+    return float(Environment.get('platforms.aws.coalesce.window') or DEFAULT_WINDOW)
@@ -0,0 +1,259 @@
+"""
+This library reduces the memory held by large results, such as hundreds of thousands of Route 53 record sets or
+snapshots. It is used by `AwsTask` when the `compact` directive is enabled.
+
+- Metadata: Each record receives its own small 'Harvest' dictionary, but its values are the same string objects for every
+  record instead of new strings per record. Consumers may add keys to a record's metadata.
+- StringPool: Repeated strings with few distinct values, such as regions, states, and instance types, are replaced by a
+  single shared copy. botocore creates a new string for every value it parses, so a state which appears in 500,000
+  records is otherwise held 500,000 times.
+- ColumnarRecords: Records are stored as one list per key instead of one dictionary per record. Rows are built when they
+  are read.
+
+Configuration:
+- platforms.aws.results.compact: The default value of the `compact` directive. Defaults to false.
+"""
+from collections.abc import Sequence
+
+# Strings longer than this, such as ARNs and descriptions, are rarely repeated and are not pooled
+DEFAULT_MAX_LENGTH = 64
+
+# Once a key has this many distinct values, its values are no longer pooled
+DEFAULT_MAX_DISTINCT = 4096
+
+_MISSING = object()
+_EMPTY = {}
+
+
+def record_metadata(metadata: dict, pool: 'StringPool' = None):
+    """
+    Returns a function which creates the 'Harvest' metadata of one record. Each call returns a new dictionary, so records
+    may modify their metadata, while its values are shared by every record.
+
+    Arguments
+        metadata (dict): The metadata.
+        pool (StringPool, optional): Pools the metadata's strings with those of the records.
+    """
+    shared = dict(metadata)
+
+    if pool:
+        pool.record(shared)
+
+    return shared.copy
+
+
+class StringPool:
+    def __init__(self, max_length: int = DEFAULT_MAX_LENGTH, max_distinct: int = DEFAULT_MAX_DISTINCT):
+        """
+        Replaces equal strings with one shared copy. Each key's values are pooled until the key has `max_distinct`
+        distinct values, so identifiers and other unique values do not fill the pool.
+
+        A pool may be shared by threads, such as the shards of one task; dictionary operations are atomic, and the worst
+        outcome of a race is a string which is not pooled.
+
+        Arguments
+            max_length (int, optional): Longer strings are not pooled. Defaults to 64.
+            max_distinct (int, optional): The number of distinct values pooled for each key. Defaults to 4096.
+        """
+        self.max_length = max_length
+        self.max_distinct = max_distinct
+
+        self.pools = {}         # key -> {value: value}
+        self.saturated = set()  # keys which exceeded max_distinct
+
+    def record(self, record):
+        """
+        Pools the strings of a record in place and returns it.
+        """
+        if isinstance(record, dict):
+            pools = self.pools
+
+            for key, value in record.items():
+                value_type = type(value)
+
+                if value_type is str:
+                    # Most values are already pooled, so check the pool before calling string()
+                    pooled = pools.get(key, _EMPTY).get(value)
+
+                    if pooled is None:
+                        record[key] = self.string(key, value)
+
+                    elif pooled is not value:
+                        record[key] = pooled
+
+                elif value_type is dict:
+                    self.record(value)
+
+                elif value_type is list:
+                    # Lists of strings, such as security group IDs, are pooled with the key which holds them
+                    self._list(key, value)
+
+        elif isinstance(record, list):
+            self._list(None, record)
+
+        return record
+
+    def string(self, key, value: str) -> str:
+        if len(value) > self.max_length or key in self.saturated:
+            return value
+
+        pool = self.pools.get(key)
+
+        if pool is None:
+            pool = self.pools[key] = {}
+
+        pooled = pool.get(value)
+
+        if pooled is not None:
+            return pooled
+
+        if len(pool) >= self.max_distinct:
+            # The key has too many distinct values to benefit from pooling
+            self.saturated.add(key)
+            self.pools.pop(key, None)
+
+            return value
+
+        pool[value] = value
+
+        return value
+
+    def _list(self, key, values: list) -> None:
+        for index, value in enumerate(values):
+            if isinstance(value, str):
+                values[index] = self.string(key, value)
+
+            elif isinstance(value, (dict, list)):
+                self.record(value)
+
+
+class ColumnarRecords(Sequence):
+    def __init__(self, records: list = None, constants: dict = None):
+        """
+        Stores records as one list of values per key. Rows are built as dictionaries when they are read, so the records
+        may be used wherever a sequence of dictionaries is expected.
+
+        Arguments
+            records (list, optional): The records to store. Items which are not dictionaries are stored under None.
+            constants (dict, optional): Keys and values added to every row, such as the 'Harvest' metadata. Dictionary values are copied into each row, so rows may be modified.
+        """
+        self.columns = {}
+        self.constants = dict(constants or {})
+        self.length = 0
+
+        self.extend(records or [])
+
+    def append(self, record) -> None:
+        if not isinstance(record, dict):
+            record = {None: record}
+
+        for key in record.keys() - self.columns.keys():
+            self.columns[key] = [_MISSING] * self.length
+
+        for key, column in self.columns.items():
+            column.append(record.get(key, _MISSING))
+
+        self.length += 1
+
+    def extend(self, records) -> None:
+        for record in records:
+            self.append(record)
+
+    def column(self, key) -> list:
+        """
+        Returns the values of one key. Records without the key are None.
+        """
+        if key in self.constants:
+            return [self.constants[key]] * self.length
+
+        return [None if value is _MISSING else value for value in self.columns.get(key, [_MISSING] * self.length)]
+
+    def to_records(self) -> list:
+        return list(self)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+
+        if index < 0:
+            index += self.length
+
+        if not 0 <= index < self.length:
+            raise IndexError('record index out of range')
+
+        row = {key: column[index] for key, column in self.columns.items() if column[index] is not _MISSING}
+
+        # Values which are not dictionaries were stored under None
+        if list(row.keys()) == [None]:
+            return row[None]
+
+        return row | {key: value.copy() if isinstance(value, dict) else value for key, value in self.constants.items()}
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __repr__(self) -> str:
+        return f'ColumnarRecords({self.length} records, {len(self.columns)} columns)'
+
+
+def compact_options(compact) -> dict:
+    """
+    Returns the options of a `compact` directive, which may be a boolean or a dictionary with the keys `intern` and
+    `columnar`. The default is `platforms.aws.results.compact`.
+
+    Returns
+        dict: The options, or an empty dictionary when compact results are disabled.
+    """
+    if compact is None:
+        from CloudHarvestCoreTasks.environment import Environment
+        compact = Environment.get('platforms.aws.results.compact') or False
+
+    if compact is True:
+        compact = {}
+
+    elif not compact:
+        return {}
+
+    return {
+        'intern': compact.get('intern', True),
+        'columnar': compact.get('columnar', False),
+        'max_length': int(compact.get('max_length') or DEFAULT_MAX_LENGTH),
+        'max_distinct': int(compact.get('max_distinct') or DEFAULT_MAX_DISTINCT),
+    }
+
+
+def compact_records(records, metadata: dict = None, intern: bool = True, columnar: bool = False,
+                    max_length: int = DEFAULT_MAX_LENGTH, max_distinct: int = DEFAULT_MAX_DISTINCT):
+    """
+    Compacts a list of records in place.
+
+    Arguments
+        records (list): The records.
+        metadata (dict, optional): Added to every record under 'Harvest'. Each record receives its own dictionary whose values are shared.
+        intern (bool, optional): When True, repeated strings are pooled. Defaults to True.
+        columnar (bool, optional): When True, a ColumnarRecords is returned instead of a list. Defaults to False.
+        max_length (int, optional): Longer strings are not pooled.
+        max_distinct (int, optional): The number of distinct values pooled for each key.
+
+    Returns
+        list or ColumnarRecords: The compacted records.
+    """
+    pool = StringPool(max_length=max_length, max_distinct=max_distinct) if intern else None
+    new_metadata = record_metadata(metadata, pool) if metadata is not None else None
+
+    if columnar:
+        result = ColumnarRecords(constants={'Harvest': new_metadata()} if new_metadata is not None else None)
+
+        for record in records:
+            result.append(pool.record(record) if pool else record)
+
+        return result
+
+    for record in records:
+        if pool:
+            pool.record(record)
+
+        if new_metadata is not None and isinstance(record, dict):
+            record['Harvest'] = new_metadata()
+
+    return records
@@ -7,12 +7,55 @@ Required AWS Permissions:
 - organizations:DescribeAccount
 
 """
+from CloudHarvestPluginAws.cache import TtlCache
 from logging import getLogger
+from threading import Condition, Lock
 
 logger = getLogger('harvest')
 
+DEFAULT_REFRESH_LEAD_MINUTES = 5
+DEFAULT_REFRESH_IDLE_MINUTES = 60
+REFRESH_RETRY_SECONDS = 60
+DEFAULT_PROFILE_CACHE_SIZE = 1024
+CREDENTIALS_FILE_RETRY_SECONDS = 300
+
+
 class CachedProfiles:
-    profiles = {}
+    # Assumed role profiles keyed by (account number, role name)
+    profiles = TtlCache(max_size=DEFAULT_PROFILE_CACHE_SIZE)
+
+    # Profiles read from the credentials file keyed by account number; see CredentialsFileIndex
+    file_profiles = {}
+
+    # Account aliases keyed by account number
+    aliases = TtlCache()
+
+    # Single-flight locks; only one caller acquires credentials for an account and role at a time
+    lock = Lock()
+    locks = {}
+
+
+class CredentialsFileIndex:
+    """
+    Remembers what was read from the credentials file so later reads only validate new or changed sections.
+    """
+    lock = Lock()
+    path = None
+    mtime = None
+    sections = {}   # section name -> (hash of the section's values, account number or None, time to retry a failed section)
+    profiles = {}   # account number -> Profile
+
+
+class CredentialRefresher:
+    """
+    Refreshes credentials in the background shortly before they expire so tasks do not wait on STS. Profiles which have
+    not been requested for `platforms.aws.credentials_refresh_idle_minutes` are no longer refreshed.
+    """
+    condition = Condition()
+    schedule = []   # heap of (due timestamp, account number, role name)
+    scheduled = {}  # (account number, role name) -> due timestamp of the current schedule entry
+    used = {}       # (account number, role name) -> timestamp of the last get_profile() call
+    thread = None
 
 
 class Profile:
@@ -76,72 +119,132 @@ class Profile:
 
     def refresh_credentials(self) -> 'Profile':
         """
-        Refreshes the credentials for the profile.
+        Refreshes the credentials for the profile. The credentials are set one attribute at a time, so this should only be
+        called on a profile which is not shared yet; `get_profile()` refreshes a new Profile and replaces the cached one.
         """
         from CloudHarvestPluginAws.tasks.aws import query_aws
-
-        # Assume the role in the specified account
-        response = query_aws(
-            service='sts',
-            command='assume_role',
-            arguments={
-                'RoleArn': f'arn:aws:iam::{self.account_number}:role/{self.role_name}',
-                'RoleSessionName': 'CloudHarvest'
-            },
-            region='us-east-1',
-        )
-
-        # Extract the temporary credentials from the response
-        self.aws_access_key_id = response['AccessKeyId']
-        self.aws_secret_access_key = response['SecretAccessKey']
-        self.aws_session_token = response['SessionToken']
-        self.expiration = response['Expiration']
-        self.role_arn = f'arn:aws:iam::{self.account_number}:role/{self.role_name}'
-
-        if self.account_alias is None:
-            # If the account alias is not set, try to get it
-            self.account_alias = get_account_name(account_number=self.account_number, credentials=self.credentials)
+        from CloudHarvestPluginAws.telemetry import measure
+
+        with measure('refresh_credentials', account=self.account_number, role=self.role_name, source='sts'):
+            # Assume the role in the specified account
+            response = query_aws(
+                service='sts',
+                command='assume_role',
+                arguments={
+                    'RoleArn': f'arn:aws:iam::{self.account_number}:role/{self.role_name}',
+                    'RoleSessionName': 'CloudHarvest'
+                },
+                region='us-east-1',
+            )
+
+            # Extract the temporary credentials from the response
+            self.aws_access_key_id = response['AccessKeyId']
+            self.aws_secret_access_key = response['SecretAccessKey']
+            self.aws_session_token = response['SessionToken']
+            self.expiration = response['Expiration']
+            self.role_arn = f'arn:aws:iam::{self.account_number}:role/{self.role_name}'
+
+            if self.account_alias is None:
+                # If the account alias is not set, try to get it
+                self.account_alias = get_account_name(account_number=self.account_number, credentials=self.credentials)
+
+            # Persist the credentials so other worker processes can reuse them
+            from CloudHarvestPluginAws.profile_store import save_profile
+            save_profile(self)
 
         return self
 
     def write_to_credentials_file(self, path: str = None):
         """
-        Writes the profile to the AWS credentials file.
+        Writes the profile to the AWS credentials file. Use `write_profiles_to_credentials_file()` when writing many
+        profiles.
         """
 
-        from os.path import abspath, exists, expanduser
-        from configparser import ConfigParser
+        return write_profiles_to_credentials_file(profiles=[self], path=path)
 
-        path = abspath(expanduser(path or '~/.aws/credentials'))
 
-        if not exists(path):
-            # Create the credentials file and directory if it does not exist
-            from pathlib import Path
-            Path(path).parent.mkdir(parents=True, exist_ok=True)
+def write_profiles_to_credentials_file(profiles: list, path: str = None) -> None:
+    """
+    Writes many profiles to the AWS credentials file in a single pass. An exclusive lock is held while the file is
+    updated so concurrent writers do not overwrite each other's sections, and the file is replaced atomically so readers
+    never see a partially written file.
+
+    Arguments
+        profiles (list): The Profile objects to write.
+        path (str, optional): The path to the AWS credentials file. Defaults to '~/.aws/credentials'.
+    """
 
-            # Touch the file
-            Path(path).touch()
+    from configparser import ConfigParser
+    from os import chmod, fsync, replace
+    from os.path import abspath, basename, dirname, expanduser
+    from pathlib import Path
+    from tempfile import NamedTemporaryFile
 
-        # Read the existing file into a dictionary
+    path = abspath(expanduser(path or '~/.aws/credentials'))
+
+    # Create the credentials directory if it does not exist
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    with _credentials_file_lock(path):
+        # Read the existing file
         config = ConfigParser()
         config.read(path)
 
-        # Check if the profile already exists
-        if not config.has_section(self.name):
-            # Create a new section for the profile
-            config.add_section(self.name)
+        for profile in profiles:
+            # Check if the profile already exists
+            if not config.has_section(profile.name):
+                # Create a new section for the profile
+                config.add_section(profile.name)
+
+            # Write the credentials to the section
+            for key, value in profile.credentials.items():
+                config.set(profile.name, key, value)
+
+        # Write to a temporary file in the same directory, then replace the original
+        with NamedTemporaryFile('w', dir=dirname(path), prefix=f'.{basename(path)}.', delete=False) as configfile:
+            try:
+                config.write(configfile)
+                configfile.flush()
+                fsync(configfile.fileno())
+
+            except Exception:
+                Path(configfile.name).unlink(missing_ok=True)
+                raise
+
+        chmod(configfile.name, 0o600)
+        replace(configfile.name, path)
+
+    logger.debug(f'wrote {len(profiles)} profiles to {path}')
 
-        # Write the credentials to the file
-        for key, value in self.credentials.items():
-            config.set(self.name, key, value)
+    return None
 
-        # Write the file back to disk
-        with open(path, 'w') as configfile:
-            config.write(configfile)
 
-        logger.debug(f'wrote {self.name} to {path}')
+def _credentials_file_lock(path: str):
+    """
+    Returns a context manager which holds an exclusive lock on `<path>.lock`. Locking is skipped on platforms which do not
+    provide `fcntl`.
+    """
+    from contextlib import contextmanager
+
+    @contextmanager
+    def lock():
+        try:
+            from fcntl import LOCK_EX, LOCK_UN, flock
+
+        except ImportError:
+            yield
+            return
+
+        with open(f'{path}.lock', 'a') as lock_file:
+            flock(lock_file, LOCK_EX)
+
+            try:
+                yield
+
+            finally:
+                flock(lock_file, LOCK_UN)
 
-        return None
+    return lock()
 
 
 def get_profile(account_number: str, role_name: str, force_refresh: bool = False) -> Profile:
@@ -150,6 +253,12 @@ def get_profile(account_number: str, role_name: str, force_refresh: bool = False
     be returned. If it is expired, the credentials will be refreshed. If the profile does not exist, a new one will be created.
     This function caches the profiles to avoid repeatedly assuming the role.
 
+    Only one caller acquires credentials for an account and role at a time; concurrent callers wait for that acquisition
+    and then receive the cached profile. A cached profile which has not expired is returned without waiting, even while
+    its credentials are being refreshed. Assumed role credentials are refreshed in the background
+    `platforms.aws.credentials_refresh_lead_minutes` (default 5) minutes before they expire, as long as the profile was
+    requested within `platforms.aws.credentials_refresh_idle_minutes` (default 60).
+
     Arguments
     account_number (str): The AWS account number.
     role_name (str): The AWS role name.
@@ -159,128 +268,392 @@ def get_profile(account_number: str, role_name: str, force_refresh: bool = False
     # Make sure incoming account numbers are properly formatted
     account_number = str(account_number).zfill(12)
 
-    # Check if the profile already exists
-    if account_number in CachedProfiles.profiles:
-        logger.debug(f'Found profile for {account_number} in cache')
+    from time import time
+    CredentialRefresher.used[(account_number, role_name)] = time()
 
-        profile = CachedProfiles.profiles[account_number]
+    return _get_profile(account_number=account_number, role_name=role_name, force_refresh=force_refresh)
 
-        if isinstance(profile, Profile):
-            # If the profile is expired, refresh the credentials, unless it was sourced from a file
-            if not profile.sourced_from_file and (profile.is_expired or force_refresh):
-                profile.refresh_credentials()
 
-    else:
+def _get_profile(account_number: str, role_name: str, force_refresh: bool = False) -> Profile:
+    """
+    Implements `get_profile()` without recording that the profile was used, so background refreshes do not keep idle
+    profiles alive.
+    """
+    from CloudHarvestPluginAws.telemetry import measure
+    with measure('get_profile', account=account_number, role=role_name) as event:
         from CloudHarvestCoreTasks.environment import Environment
         if Environment.get('platforms.aws.credentials_source') == 'file' and account_number:
-            # Read the credentials file and return the profile
-            CachedProfiles.profiles |= read_credentials_file()
-            profile = CachedProfiles.profiles.get(account_number)
+            # Only new or changed sections are validated; when the file has not changed this is a single stat() call
+            CachedProfiles.file_profiles = read_credentials_file()
+            event['source'] = 'file'
 
-        else:
-            # Create a new profile and refresh the credentials
-            profile = Profile(account_number=account_number, role_name=role_name)
-            profile.refresh_credentials()
-            CachedProfiles.profiles[account_number] = profile
+            return CachedProfiles.file_profiles.get(account_number)
+
+        CachedProfiles.profiles.max_size = int(Environment.get('platforms.aws.profile_cache.max_size') or DEFAULT_PROFILE_CACHE_SIZE)
+
+        key = (account_number, role_name)
+
+        # Cached profiles which have not expired are returned without waiting for an acquisition or refresh in flight
+        profile = CachedProfiles.profiles.get(key)
+
+        if profile is not None and not force_refresh and not profile.is_expired:
+            logger.debug(f'Found profile for {account_number} in cache')
+            event['source'] = 'memory'
+
+            # The profile was idle and is no longer refreshed in the background
+            if key not in CredentialRefresher.scheduled:
+                _schedule_refresh(profile)
+
+            return profile
+
+        with _acquisition_lock(account_number, role_name):
+            # Check the in-memory cache again in case another caller acquired the profile, then the disk tier
+            profile = CachedProfiles.profiles.get(key, count=False)
+
+            if profile is None:
+                from CloudHarvestPluginAws.profile_store import load_profile
+                profile = load_profile(account_number=account_number, role_name=role_name)
+
+                if profile is not None:
+                    logger.debug(f'Loaded profile for {account_number} from the profile cache')
+                    event['source'] = 'disk'
+                    CachedProfiles.profiles.set(key, profile)
+                    _schedule_refresh(profile)
+
+            else:
+                logger.debug(f'Found profile for {account_number} in cache')
+                event['source'] = 'memory'
+
+            if profile is None:
+                # Create a new profile and refresh the credentials
+                profile = Profile(account_number=account_number, role_name=role_name)
+                profile.refresh_credentials()
+                CachedProfiles.profiles.set(key, profile)
+                event['source'] = 'assume_role'
+                _schedule_refresh(profile)
+
+            # If the profile is expired, refresh the credentials. The refreshed credentials are built in a new Profile and
+            # swapped into the cache, so callers holding the previous profile never see a mix of old and new credentials.
+            elif profile.is_expired or force_refresh:
+                previous = profile
+
+                profile = Profile(account_number=account_number, role_name=role_name)
+                profile.account_alias = previous.account_alias
+                profile.refresh_credentials()
+
+                CachedProfiles.profiles.set(key, profile)
+                _schedule_refresh(profile)
+                event['source'] = 'refresh'
+
+                # Pooled clients built with the previous credentials are no longer needed
+                if previous.aws_access_key_id:
+                    from CloudHarvestPluginAws.clients import evict_clients
+                    evict_clients(previous.credentials)
+
+        return profile
+
+
+def profile_cache_stats() -> dict:
+    """
+    Returns the hit and miss counters of the in-memory and disk profile caches.
+    """
+    from CloudHarvestPluginAws.profile_store import ProfileStore
+
+    return {
+        'memory': CachedProfiles.profiles.stats(),
+        'aliases': CachedProfiles.aliases.stats(),
+        'disk': {
+            'hits': ProfileStore.hits,
+            'misses': ProfileStore.misses
+        }
+    }
+
+
+def prefetch_profiles(accounts: list, role_name: str = None, max_workers: int = None) -> dict:
+    """
+    Acquires profiles for many accounts in parallel. This is intended to be called when a scheduler starts so the first
+    tasks for each account do not wait on STS.
+
+    Arguments
+        accounts (list): The AWS account numbers.
+        role_name (str, optional): The AWS role name. When not provided, the role is pulled from `platforms.aws.accounts.<account>.role` or `platforms.aws.default_role`.
+        max_workers (int, optional): The maximum number of concurrent acquisitions. Defaults to `platforms.aws.prefetch_max_workers` or 16.
+
+    Returns
+        dict: A dictionary of account numbers and their profiles. Accounts which could not be acquired are omitted.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from CloudHarvestCoreTasks.environment import Environment
+
+    accounts = list(dict.fromkeys(str(account).zfill(12) for account in accounts))
+    max_workers = int(max_workers or Environment.get('platforms.aws.prefetch_max_workers') or 16)
+
+    def acquire(account_number: str):
+        role = role_name \
+               or Environment.get(f'platforms.aws.accounts.{account_number}.role') \
+               or Environment.get('platforms.aws.default_role')
+
+        try:
+            return get_profile(account_number=account_number, role_name=role)
+
+        except Exception as e:
+            logger.warning(f'Failed to prefetch a profile for {account_number}: {e}')
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(accounts) or 1))) as executor:
+        profiles = dict(zip(accounts, executor.map(acquire, accounts)))
+
+    logger.debug(f'Prefetched {len([p for p in profiles.values() if p])} of {len(accounts)} profiles')
 
-    return profile
+    return {account: profile for account, profile in profiles.items() if profile}
 
 
-def read_credentials_file(path: str = None) -> dict:
+def _acquisition_lock(account_number: str, role_name: str or None) -> Lock:
+    """
+    Returns the single-flight lock for an account and role.
+    """
+    key = (account_number, role_name)
+
+    with CachedProfiles.lock:
+        lock = CachedProfiles.locks.get(key)
+
+        if lock is None:
+            lock = CachedProfiles.locks[key] = Lock()
+
+    return lock
+
+
+def _schedule_refresh(profile: Profile) -> None:
+    """
+    Schedules a background refresh of the profile's credentials ahead of their expiration.
+    """
+    if profile.sourced_from_file or profile.expiration is None:
+        return
+
+    from CloudHarvestCoreTasks.environment import Environment
+    from heapq import heappush
+    from threading import Thread
+
+    lead_minutes = float(Environment.get('platforms.aws.credentials_refresh_lead_minutes') or DEFAULT_REFRESH_LEAD_MINUTES)
+    due = profile.expiration.timestamp() - lead_minutes * 60
+    key = (profile.account_number, profile.role_name)
+
+    with CredentialRefresher.condition:
+        CredentialRefresher.scheduled[key] = due
+        heappush(CredentialRefresher.schedule, (due, *key))
+
+        if CredentialRefresher.thread is None or not CredentialRefresher.thread.is_alive():
+            CredentialRefresher.thread = Thread(target=_refresh_loop, name='harvest-aws-credential-refresher', daemon=True)
+            CredentialRefresher.thread.start()
+
+        CredentialRefresher.condition.notify()
+
+
+def _refresh_loop() -> None:
+    """
+    Waits for the next scheduled refresh and performs it. Runs on the background refresher thread. Profiles which have
+    not been requested for `platforms.aws.credentials_refresh_idle_minutes` are dropped from the schedule instead; they
+    are refreshed when they are next requested.
+    """
+    from CloudHarvestCoreTasks.environment import Environment
+    from heapq import heappop, heappush
+    from time import time
+
+    while True:
+        with CredentialRefresher.condition:
+            while not CredentialRefresher.schedule or CredentialRefresher.schedule[0][0] > time():
+                timeout = CredentialRefresher.schedule[0][0] - time() if CredentialRefresher.schedule else None
+                CredentialRefresher.condition.wait(timeout=timeout)
+
+            due, account_number, role_name = heappop(CredentialRefresher.schedule)
+
+            key = (account_number, role_name)
+
+            # Skip entries which were superseded by a later refresh
+            if CredentialRefresher.scheduled.get(key) != due:
+                continue
+
+            idle_minutes = float(Environment.get('platforms.aws.credentials_refresh_idle_minutes') or DEFAULT_REFRESH_IDLE_MINUTES)
+
+            if time() - CredentialRefresher.used.get(key, 0) > idle_minutes * 60:
+                logger.debug(f'Stopped refreshing credentials for {account_number}; the profile is idle')
+                CredentialRefresher.scheduled.pop(key)
+                CredentialRefresher.used.pop(key, None)
+                continue
+
+        # The schedule entry is kept while refreshing so callers do not schedule the same profile again; the refresh
+        # replaces it with the next due time
+        try:
+            logger.debug(f'Refreshing credentials for {account_number} ahead of expiration')
+            _get_profile(account_number=account_number, role_name=role_name, force_refresh=True)
+
+        except Exception as e:
+            logger.warning(f'Failed to refresh credentials for {account_number} in the background: {e}')
+
+            # Try again later; the profile is refreshed in the foreground once it expires
+            with CredentialRefresher.condition:
+                if CredentialRefresher.scheduled.get(key) == due:
+                    retry = time() + REFRESH_RETRY_SECONDS
+                    CredentialRefresher.scheduled[key] = retry
+                    heappush(CredentialRefresher.schedule, (retry, *key))
+
+
+def read_credentials_file(path: str = None, max_workers: int = None) -> dict:
     """
     Reads the AWS credentials file and returns a dictionary of profiles.
 
+    The file's modification time and a hash of each section are remembered. When the file has not changed, the previous
+    result is returned without reading it. Otherwise, only new or changed sections are validated, concurrently, using
+    `sts:GetCallerIdentity`. Sections which fail validation are retried after CREDENTIALS_FILE_RETRY_SECONDS.
+
     Arguments
         path (str, optional): The path to the AWS credentials file. Defaults to '~/.aws/credentials'.
+        max_workers (int, optional): The maximum number of sections validated at once. Defaults to `platforms.aws.credentials_file_max_workers` or 16.
 
     Returns
-        dict: A dictionary containing the profiles and their corresponding credentials.
+        dict: A dictionary of account numbers and their profiles.
     """
 
     from CloudHarvestCoreTasks.environment import Environment
-    from os.path import abspath, exists, expanduser
+    from os.path import abspath, expanduser, getmtime
+    from time import time
     path = abspath(expanduser(path or Environment.get('platforms.aws.credentials_file') or '~/.aws/credentials'))
 
-    logger.debug(f'Reading credentials from {path}')
+    with CredentialsFileIndex.lock:
+        try:
+            mtime = getmtime(path)
 
-    # Return an empty dictionary if the file does not exist
-    if not exists(path):
-        return {}
+        # Return an empty dictionary if the file does not exist
+        except OSError:
+            return {}
 
-    results = {}
+        retry_due = any(account_number is None and retry_at <= time()
+                        for _, account_number, retry_at in CredentialsFileIndex.sections.values())
 
-    # Read the credentials file
-    from configparser import ConfigParser
-    config = ConfigParser()
-    config.read(path)
+        if CredentialsFileIndex.path == path and CredentialsFileIndex.mtime == mtime and not retry_due:
+            return dict(CredentialsFileIndex.profiles)
 
-    # Parse the profiles and their credentials
-    profiles = {}
+        logger.debug(f'Reading credentials from {path}')
 
-    # For each section (profile name), read all the keys and values and set the keys to lower case
-    logger.debug(f'Found {len(config.sections())} profiles in {path}')
+        # A different file invalidates everything which was read before
+        if CredentialsFileIndex.path != path:
+            CredentialsFileIndex.sections = {}
+            CredentialsFileIndex.profiles = {}
 
-    for section in config.sections():
-        profiles[section] = {
-            k.lower(): v
-            for k, v in config.items(section)
+        # Read the credentials file
+        from configparser import ConfigParser
+        from hashlib import sha256
+        config = ConfigParser()
+        config.read(path)
+
+        logger.debug(f'Found {len(config.sections())} profiles in {path}')
+
+        # For each section (profile name), read all the keys and values and set the keys to lower case
+        sections = {
+            section: {k.lower(): v for k, v in config.items(section)}
+            for section in config.sections()
+            if section != 'default'
         }
 
-        # Only attempt to add the profile if it is not already in the cache
-        if section != 'default':
-            logger.debug(f'Building profile for {section}')
+        hashes = {
+            section: sha256(repr(sorted(values.items())).encode()).hexdigest()
+            for section, values in sections.items()
+        }
 
-            try:
-                credentials = {
-                    key: profiles[section].get(key)
-                    for key in ('aws_access_key_id', 'aws_secret_access_key', 'aws_session_token')
-                }
-
-                logger.debug(f'Retrieving caller identity for {section}')
-                from CloudHarvestPluginAws.tasks.aws import query_aws
-                identity = query_aws(
-                    service='sts',
-                    command='get_caller_identity',
-                    arguments={},
-                    credentials=credentials,
-                    result_path=(
-                        'UserId',
-                        'Account',
-                        'Arn'
-                    )
-                )
-
-                logger.debug(f'Creating profile for {section}')
-                profile = Profile(
-                    account_number=identity.get('Account'),
-                    role_name=str(identity.get('Arn') or '').split('/', maxsplit=1)[1],    # Sometimes a role will include a / after the account number
-                    sourced_from_file=True
-                )
-
-                # Continue if the profile is already in the cache. This can happen when multiple jobs are attempting to
-                # read the credentials file at the same time.
-                if profile.account_number in CachedProfiles.profiles.keys():
-                    continue
-
-                profile.account_alias = get_account_name(profile.account_number, credentials)
-                profile.aws_access_key_id = credentials.get('aws_access_key_id')
-                profile.aws_secret_access_key = credentials.get('aws_secret_access_key')
-                profile.aws_session_token = credentials.get('aws_session_token')
-
-                results[profile.account_number] = profile
-
-                logger.debug(f'Created profile {profile.name} for {section}')
-
-            except Exception as e:
-                logger.warning(f'Failed to get credentials for {section}: {e}')
-
-    return results
+        # Forget sections which were removed or changed, and failed sections which are due to be retried
+        for section, (section_hash, account_number, retry_at) in list(CredentialsFileIndex.sections.items()):
+            if hashes.get(section) != section_hash or (account_number is None and retry_at <= time()):
+                CredentialsFileIndex.sections.pop(section)
+                profile = CredentialsFileIndex.profiles.pop(account_number, None)
+
+                if profile is not None:
+                    from CloudHarvestPluginAws.clients import evict_clients
+                    evict_clients(profile.credentials)
+
+        changed = [section for section in sections.keys() if section not in CredentialsFileIndex.sections]
+
+        if changed:
+            from concurrent.futures import ThreadPoolExecutor
+            max_workers = int(max_workers or Environment.get('platforms.aws.credentials_file_max_workers') or 16)
+
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(changed)))) as executor:
+                profiles = executor.map(lambda section: _profile_from_section(section, sections[section]), changed)
+
+                for section, profile in zip(changed, profiles):
+                    account_number = profile.account_number if profile else None
+                    CredentialsFileIndex.sections[section] = (hashes[section], account_number, time() + CREDENTIALS_FILE_RETRY_SECONDS)
+
+                    # The first section found for an account is kept
+                    if profile and account_number not in CredentialsFileIndex.profiles:
+                        CredentialsFileIndex.profiles[account_number] = profile
+
+            logger.debug(f'Validated {len(changed)} new or changed profiles in {path}')
+
+        CredentialsFileIndex.path = path
+        CredentialsFileIndex.mtime = mtime
+
+        return dict(CredentialsFileIndex.profiles)
+
+
+def _profile_from_section(section: str, values: dict) -> Profile or None:
+    """
+    Builds a profile from a credentials file section by looking up the identity of its credentials.
+
+    Arguments
+        section (str): The section (profile) name.
+        values (dict): The section's keys and values.
+
+    Returns
+        Profile or None: The profile, or None if the credentials could not be validated.
+    """
+    logger.debug(f'Building profile for {section}')
+
+    try:
+        credentials = {
+            key: values.get(key)
+            for key in ('aws_access_key_id', 'aws_secret_access_key', 'aws_session_token')
+        }
+
+        logger.debug(f'Retrieving caller identity for {section}')
+        from CloudHarvestPluginAws.tasks.aws import query_aws
+        identity = query_aws(
+            service='sts',
+            command='get_caller_identity',
+            arguments={},
+            credentials=credentials,
+            result_path=(
+                'UserId',
+                'Account',
+                'Arn'
+            )
+        )
+
+        logger.debug(f'Creating profile for {section}')
+        profile = Profile(
+            account_number=identity.get('Account'),
+            role_name=str(identity.get('Arn') or '').split('/', maxsplit=1)[1],    # Sometimes a role will include a / after the account number
+            sourced_from_file=True
+        )
+
+        profile.account_alias = get_account_name(profile.account_number, credentials)
+        profile.aws_access_key_id = credentials.get('aws_access_key_id')
+        profile.aws_secret_access_key = credentials.get('aws_secret_access_key')
+        profile.aws_session_token = credentials.get('aws_session_token')
+
+        logger.debug(f'Created profile {profile.name} for {section}')
+
+        return profile
+
+    except Exception as e:
+        logger.warning(f'Failed to get credentials for {section}: {e}')
+
+    return None
 
 
 def get_account_name(account_number: str, credentials: dict) -> str or None:
     """
     Looks up the account alias for a given account number. Assumes the account is part of an organization. If it is not,
-    or an error is encountered, the provided account number will be returned.
+    or an error is encountered, the provided account number will be returned. Aliases are cached in memory and, when
+    enabled, in the profile cache database for `platforms.aws.account_alias_ttl` seconds.
 
     Arguments
         account_number (str): The AWS account number.
@@ -289,7 +662,6 @@ def get_account_name(account_number: str, credentials: dict) -> str or None:
     Returns
         str or None: The account alias if found, otherwise None.
     """
-    from CloudHarvestPluginAws.tasks.aws import query_aws
 
     # If an alias is defined in the environment, use that. This is useful for environments where the role cannot access
     # the organization service and the IAM service does not contain a useful alias. Further, some organizations may not
@@ -303,6 +675,32 @@ def get_account_name(account_number: str, credentials: dict) -> str or None:
     else:
         logger.debug(f'Failed to get account name for {account_number} using environment. An alias was not defined at `platforms.aws.accounts.{account_number}.alias`')
 
+    from CloudHarvestPluginAws.profile_store import alias_ttl, load_alias, save_alias
+
+    result = CachedProfiles.aliases.get(account_number) or load_alias(account_number)
+
+    if result:
+        CachedProfiles.aliases.set(account_number, result, ttl=alias_ttl())
+        return result
+
+    result = _lookup_account_name(account_number=account_number, credentials=credentials)
+
+    # Account numbers are returned when no alias could be found; those are not worth caching
+    if result != account_number:
+        CachedProfiles.aliases.set(account_number, result, ttl=alias_ttl())
+        save_alias(account_number, result)
+
+    return result
+
+
+def _lookup_account_name(account_number: str, credentials: dict) -> str:
+    """
+    Looks up the account alias using the organizations service, then the IAM service.
+    """
+    from CloudHarvestPluginAws.tasks.aws import query_aws
+
+    result = None
+
     # First pass, try the organizations service
     try:
         response = query_aws(
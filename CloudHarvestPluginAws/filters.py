@@ -0,0 +1,185 @@
+"""
+This library translates the `filters` and `fields` directives of an AwsTask. Filters are pushed down to the API whenever
+it supports them, either as a named parameter (such as `OwnerIds` or `MaxResults`) or as an entry in the API's `Filters`
+list. A filter is only added to the `Filters` list when its name is one the API documents, such as `instance-state-name`
+or `tag:<key>`; when the API does not document its filter names, names which contain a dot are treated as record paths.
+Filters which the API cannot apply are evaluated against each page as it is received. Fields trim each record to the
+keys which are needed before the page is kept in memory.
+"""
+from functools import lru_cache
+from logging import getLogger
+
+logger = getLogger('harvest')
+
+
+def build_filter_arguments(client, command: str, arguments: dict, filters: dict) -> tuple:
+    """
+    Translates filters into command arguments.
+
+    Arguments
+        client (botocore.client.BaseClient): The client the command will be executed with.
+        command (str): The command to execute.
+        arguments (dict): The command arguments. This dictionary is not modified.
+        filters (dict): A dictionary of filter names and values.
+
+    Returns
+        tuple: The new arguments and a dictionary of the filters which must be applied to the records.
+    """
+    if not filters:
+        return arguments, {}
+
+    operation_model = client.meta.service_model.operation_model(client.meta.method_to_api_mapping[command])
+    members = operation_model.input_shape.members if operation_model.input_shape else {}
+
+    arguments = dict(arguments)
+    remaining = {}
+
+    # Determine the keys used by the API's Filters parameter, such as {'Name': ..., 'Values': [...]}
+    filter_keys = None
+    if 'Filters' in members and members['Filters'].type_name == 'list':
+        filter_members = members['Filters'].member.members
+        name_key = next((key for key in ('Name', 'Key') if key in filter_members), None)
+
+        if name_key and 'Values' in filter_members:
+            filter_keys = (name_key, 'Values')
+
+    filter_names = _filter_names(members['Filters'].documentation or '') if filter_keys else None
+
+    for name, value in filters.items():
+        # The filter is a parameter of the command, such as OwnerIds or MaxResults
+        if name in members:
+            if members[name].type_name == 'list' and not isinstance(value, (list, tuple)):
+                value = [value]
+
+            arguments[name] = value
+
+        # The filter is supported by the command's Filters parameter
+        elif filter_keys and _is_filter_name(name, filter_names):
+            name_key, values_key = filter_keys
+            values = value if isinstance(value, (list, tuple)) else [value]
+
+            arguments['Filters'] = list(arguments.get('Filters') or []) + [
+                {name_key: name, values_key: [filter_value(v) for v in values]}
+            ]
+
+        # The filter must be applied to each page
+        else:
+            remaining[name] = value
+
+    if remaining:
+        logger.debug(f'{command} does not support server-side filtering for {list(remaining.keys())}')
+
+    return arguments, remaining
+
+
+def filter_value(value) -> str:
+    """
+    Converts a filter value to the string sent in a `Filters` list. Booleans are lower case, as the APIs expect.
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+
+    return str(value)
+
+
+def _is_filter_name(name: str, filter_names: frozenset) -> bool:
+    """
+    Determines whether a filter name is accepted by the API's `Filters` list.
+    """
+    if not filter_names:
+        return '.' not in name
+
+    # Tag filters are documented as `tag:<key>`
+    return name in filter_names or (name.startswith('tag:') and 'tag' in filter_names)
+
+
+@lru_cache(maxsize=1024)
+def _filter_names(documentation: str) -> frozenset:
+    """
+    Returns the filter names listed in the documentation of an operation's `Filters` parameter, or an empty set when the
+    documentation does not list them.
+    """
+    from re import findall
+
+    # Each filter is documented as a list item which starts with its name, such as <li> <p> <code>owner-id</code> ...
+    return frozenset(findall(r'<li>\s*(?:<p>)?\s*<code>([^<]+)</code>', documentation))
+
+
+def filter_records(records: list, filters: dict) -> list:
+    """
+    Returns the records which match every filter. A filter matches when the record's value equals the filter value or,
+    when the filter value is a list, is one of its values.
+    """
+    if not filters:
+        return records
+
+    from CloudHarvestCoreTasks.dataset import WalkableDict
+
+    def matches(record) -> bool:
+        if not isinstance(record, dict):
+            return False
+
+        walkable = WalkableDict(record)
+        for name, expected in filters.items():
+            expected = expected if isinstance(expected, (list, tuple)) else [expected]
+            actual = walkable.walk(name)
+            actual = actual if isinstance(actual, list) else [actual]
+
+            if not any(value in expected for value in actual):
+                return False
+
+        return True
+
+    return [record for record in records if matches(record)]
+
+
+def project_records(records: list, fields: list) -> list:
+    """
+    Trims each record to the provided fields. Fields may be dot-separated paths, such as 'State.Name'.
+    """
+    if not fields:
+        return records
+
+    return [project_record(record, fields) for record in records]
+
+
+def project_record(record, fields: list):
+    """
+    Trims a record to the provided fields.
+    """
+    if not fields or not isinstance(record, dict):
+        return record
+
+    result = {}
+
+    for field in fields:
+        source = record
+        target = result
+        parts = str(field).split('.')
+
+        for index, part in enumerate(parts):
+            if not isinstance(source, dict) or part not in source:
+                break
+
+            if index == len(parts) - 1:
+                target[part] = source[part]
+
+            else:
+                source = source[part]
+                target = target.setdefault(part, {})
+
+    return result
+
+
+def apply_filters_and_fields(result, filters: dict, fields: list):
+    """
+    Applies the remaining filters and the fields to a list of records or a single record.
+    """
+    if isinstance(result, list):
+        return project_records(filter_records(result, filters), fields)
+
+    elif isinstance(result, dict) and (filters or fields):
+        matched = filter_records([result], filters)
+        return project_record(matched[0], fields) if matched else None
+
+    return result
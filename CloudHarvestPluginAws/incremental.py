@@ -0,0 +1,339 @@
+"""
+This library stores the state used by the `incremental` directive of an AwsTask. Each account, region, and template has a
+high-water mark (the start time of the last successful collection) and, optionally, a fingerprint of every identifier
+which was returned by the last collection.
+
+- When the command accepts a time-bounded argument, such as `StartTime`, the argument is set to the high-water mark so
+  only new records are retrieved.
+- Otherwise, the records returned by the command are compared with the stored fingerprints and only new or changed
+  records are returned. Later per-item describe and tag calls then only run for the records which changed.
+
+State is kept in memory and, when `platforms.aws.incremental.path` is configured, in a sqlite database so it survives
+restarts.
+
+By default, the state is staged rather than stored, because later stages of the task chain have not stored the records
+yet. Staged state is stored once the records are safely stored: `Sweep` calls `commit_states()` after each unit succeeds
+and `discard_states()` after it fails, and other callers use `AwsTask.commit()` or `commit_state()`. Until then, the next
+collection retrieves the same records again. Setting the directive's `commit` key to 'task' stores the state as soon as
+the command succeeds instead; if a later stage then fails, the records returned by that collection are not retrieved
+again, except for the `overlap` of time-bounded arguments.
+
+Configuration:
+- platforms.aws.incremental.path: The path to the sqlite database. State is only kept in memory when not provided.
+"""
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+
+class IncrementalState:
+    lock = Lock()
+    values = {}
+    pending = {}    # key -> staged state which is stored by commit_state() or commit_states()
+    connection = None
+    path = None
+
+
+def get_state(key: tuple) -> dict or None:
+    """
+    Retrieves the stored state for an (account, region, template) key.
+
+    Returns
+        dict or None: A dictionary with the 'watermark' (a timezone aware datetime or None), 'updated' (a timestamp), and
+        'fingerprints' (a dictionary of identifiers and hashes) keys.
+    """
+    with IncrementalState.lock:
+        state = IncrementalState.values.get(key)
+
+        if state is None:
+            connection = _connect()
+
+            if connection is not None:
+                row = connection.execute('SELECT value FROM state WHERE key = ?', (_key(key),)).fetchone()
+
+                if row:
+                    state = IncrementalState.values[key] = _deserialize(row[0])
+
+        return state
+
+
+def set_state(key: tuple, watermark=None, fingerprints: dict = None) -> None:
+    """
+    Stores the state for an (account, region, template) key.
+
+    Arguments
+        key (tuple): The (account, region, template) key.
+        watermark (datetime, optional): The start time of the collection which just completed.
+        fingerprints (dict, optional): The identifiers and hashes of the records which were returned.
+    """
+    from time import time
+
+    state = {
+        'watermark': watermark,
+        'updated': time(),
+        'fingerprints': fingerprints
+    }
+
+    with IncrementalState.lock:
+        IncrementalState.values[key] = state
+
+        connection = _connect()
+        if connection is not None:
+            connection.execute('INSERT OR REPLACE INTO state VALUES (?, ?)', (_key(key), _serialize(state)))
+            connection.commit()
+
+
+def stage_state(key: tuple, watermark=None, fingerprints: dict = None, owner: tuple = None) -> None:
+    """
+    Stages the state for an (account, region, template) key. The state is not used by later collections until
+    `commit_state()` or `commit_states()` is called, and a newer staged state replaces an older one.
+
+    Arguments
+        key (tuple): The (account, region, template) key.
+        watermark (datetime, optional): The start time of the collection which just completed.
+        fingerprints (dict, optional): The identifiers and hashes of the records which were returned.
+        owner (tuple, optional): The (service, type) of the template which staged the state, used by `commit_states()`.
+    """
+    with IncrementalState.lock:
+        IncrementalState.pending[key] = {'watermark': watermark, 'fingerprints': fingerprints, 'owner': owner}
+
+
+def commit_state(key: tuple) -> bool:
+    """
+    Stores the state staged for an (account, region, template) key.
+
+    Returns
+        bool: True when staged state was stored.
+    """
+    with IncrementalState.lock:
+        state = IncrementalState.pending.pop(key, None)
+
+    if state is None:
+        return False
+
+    set_state(key, watermark=state['watermark'], fingerprints=state['fingerprints'])
+
+    return True
+
+
+def discard_state(key: tuple) -> None:
+    """
+    Discards the state staged for an (account, region, template) key, such as when a later stage failed.
+    """
+    with IncrementalState.lock:
+        IncrementalState.pending.pop(key, None)
+
+
+def commit_states(account: str, region: str = None, service: str = None, type: str = None) -> int:
+    """
+    Stores the state staged by the templates of an account and region, such as once a sweep unit has stored its records.
+
+    Arguments
+        account (str): The AWS account number.
+        region (str, optional): The AWS region. None for global services.
+        service (str, optional): Only the state staged by this service's templates is stored.
+        type (str, optional): Only the state staged by this service type's templates is stored.
+
+    Returns
+        int: The number of states stored.
+    """
+    return sum(commit_state(key) for key in _staged_keys(account, region, service, type))
+
+
+def discard_states(account: str, region: str = None, service: str = None, type: str = None) -> int:
+    """
+    Discards the state staged by the templates of an account and region, such as when a sweep unit failed.
+
+    Returns
+        int: The number of states discarded.
+    """
+    keys = _staged_keys(account, region, service, type)
+
+    for key in keys:
+        discard_state(key)
+
+    return len(keys)
+
+
+def _staged_keys(account: str, region: str, service: str, type: str) -> list:
+    # AwsTask stores account numbers as 12 digit strings
+    account = str(account).zfill(12)
+
+    with IncrementalState.lock:
+        return [key for key, state in IncrementalState.pending.items()
+                if key[0] == account and key[1] == region
+                and (service is None or (state['owner'] or (None, None))[0] == service)
+                and (type is None or (state['owner'] or (None, None))[1] == type)]
+
+
+def clear_state(key: tuple = None) -> None:
+    """
+    Removes the state for a key, or all state when no key is provided, forcing a full collection.
+    """
+    with IncrementalState.lock:
+        connection = _connect()
+
+        if key is None:
+            IncrementalState.values.clear()
+            IncrementalState.pending.clear()
+
+            if connection is not None:
+                connection.execute('DELETE FROM state')
+
+        else:
+            IncrementalState.values.pop(key, None)
+            IncrementalState.pending.pop(key, None)
+
+            if connection is not None:
+                connection.execute('DELETE FROM state WHERE key = ?', (_key(key),))
+
+        if connection is not None:
+            connection.commit()
+
+
+def fingerprint(record, keys: list = None) -> str:
+    """
+    Returns a hash of a record, or of the provided keys of a record.
+    """
+    from hashlib import sha256
+    from json import dumps
+
+    if keys and isinstance(record, dict):
+        from CloudHarvestCoreTasks.dataset import WalkableDict
+        walkable = WalkableDict(record)
+        record = {key: walkable.walk(key) for key in keys}
+
+    return sha256(dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _key(key: tuple) -> str:
+    return '|'.join(str(part) for part in key)
+
+
+def _serialize(state: dict) -> str:
+    from json import dumps
+    return dumps(state | {'watermark': state['watermark'].isoformat() if state['watermark'] else None})
+
+
+def _deserialize(value: str) -> dict:
+    from datetime import datetime
+    from json import loads
+
+    state = loads(value)
+    state['watermark'] = datetime.fromisoformat(state['watermark']) if state.get('watermark') else None
+
+    return state
+
+
+def _connect():
+    """
+    Opens the database when a path is configured. Must be called while holding IncrementalState.lock.
+    """
+    from CloudHarvestCoreTasks.environment import Environment
+    from os.path import abspath, expanduser
+
+    path = Environment.get('platforms.aws.incremental.path')
+
+    if not path:
+        return None
+
+    path = abspath(expanduser(path))
+
+    if IncrementalState.connection is not None and IncrementalState.path == path:
+        return IncrementalState.connection
+
+    import sqlite3
+    from pathlib import Path
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)')
+    connection.commit()
+
+    IncrementalState.connection = connection
+    IncrementalState.path = path
+
+    return connection
+
+
+def apply_watermark(arguments: dict, argument: str, watermark, overlap: float = 0, format: str = 'datetime') -> dict:
+    """
+    Sets a time-bounded argument to the high-water mark when the watermark is later than the argument's current value.
+
+    Arguments
+        arguments (dict): The command arguments. This dictionary is not modified.
+        argument (str): The name of the argument, such as 'StartTime'.
+        watermark (datetime): The start time of the last successful collection.
+        overlap (float, optional): The number of seconds subtracted from the watermark so records written while the last
+            collection was running are not missed. Defaults to 0.
+        format (str, optional): 'datetime' passes a datetime to the API; 'iso' passes an ISO 8601 string.
+
+    Returns
+        dict: The new arguments.
+    """
+    from datetime import timedelta
+
+    if watermark is None:
+        return arguments
+
+    start = watermark - timedelta(seconds=overlap or 0)
+    current = _as_datetime(arguments.get(argument))
+
+    if current is not None and current >= start:
+        return arguments
+
+    return dict(arguments) | {argument: start.isoformat() if format == 'iso' else start}
+
+
+def changed_records(records: list, previous: dict, identifier: str, keys: list = None) -> tuple:
+    """
+    Compares records with the fingerprints stored by the last collection.
+
+    Arguments
+        records (list): The records returned by the command.
+        previous (dict): The identifiers and hashes stored by the last collection.
+        identifier (str): The key which identifies each record, such as 'QueueUrl'.
+        keys (list, optional): The keys included in each fingerprint. Defaults to the entire record.
+
+    Returns
+        tuple: The records which are new or changed, and the fingerprints of every record.
+    """
+    from CloudHarvestCoreTasks.dataset import WalkableDict
+
+    previous = previous or {}
+    fingerprints = {}
+    changed = []
+
+    for record in records:
+        if not isinstance(record, dict):
+            changed.append(record)
+            continue
+
+        record_id = str(WalkableDict(record).walk(identifier))
+        fingerprints[record_id] = fingerprint(record, keys)
+
+        if previous.get(record_id) != fingerprints[record_id]:
+            changed.append(record)
+
+    return changed, fingerprints
+
+
+def _as_datetime(value):
+    """
+    Converts a datetime or ISO 8601 string to a timezone aware datetime. Naive values are assumed to be UTC.
+    """
+    from datetime import datetime, timezone
+
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+
+        except ValueError:
+            return None
+
+    if not isinstance(value, datetime):
+        return None
+
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
@@ -0,0 +1,303 @@
+"""
+This library downloads RDS log files to a local spool directory. Each portion returned by `download_db_log_file_portion`
+is written to disk as soon as it is received, so memory use does not depend on the size of the log file. The `Marker` of
+the last portion written is recorded next to the file; when a download fails, the next attempt resumes from that marker
+instead of starting over.
+
+Downloads of the same instance share a semaphore so several files may be downloaded at once without exceeding the
+per-instance limit. Downloads of the same file share a lock, so concurrent downloads do not write to the same spool file
+and checkpoint at once.
+
+Spool files are local to the process which downloaded them. Reports which return log contents to the API use
+`download_log_text()`, which decodes the file one chunk at a time and removes it. The text is returned as one string, so
+it is held in memory once the download completes; `iter_log_file()` yields the chunks of a spool file without holding
+the whole text.
+
+Configuration:
+- platforms.aws.rds_logs.spool_path: The directory log files are written to. Defaults to a 'harvest-rds-logs' directory in
+  the system temporary directory.
+- platforms.aws.rds_logs.max_concurrent_per_instance: The maximum number of concurrent downloads per instance. Defaults to 2.
+"""
+from logging import getLogger
+from threading import Lock, RLock, Semaphore
+from weakref import WeakValueDictionary
+
+logger = getLogger('harvest')
+
+DEFAULT_MAX_CONCURRENT_PER_INSTANCE = 2
+
+# The size of each chunk of text read by iter_log_file(), which matches the 1 MB maximum of each portion
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class InstanceSemaphores:
+    lock = Lock()
+    semaphores = {}
+
+
+class SpoolLocks:
+    lock = Lock()
+    locks = WeakValueDictionary()   # path -> RLock; a lock is discarded once no download holds it
+
+
+def download_log_file(instance: str,
+                      log_file: str,
+                      region: str = None,
+                      credentials: dict = None,
+                      account: str = None,
+                      compress: bool = False,
+                      number_of_lines: int = None,
+                      **kwargs) -> dict:
+    """
+    Downloads an RDS log file to the spool directory.
+
+    Arguments
+        instance (str): The DBInstanceIdentifier.
+        log_file (str): The LogFileName.
+        region (str, optional): The AWS region.
+        credentials (dict, optional): The AWS credentials. When not provided, boto3 will attempt to use the default credentials.
+        account (str, optional): The AWS account number. Used to name the spool file and the per-instance semaphore.
+        compress (bool, optional): When True, each portion is written as a gzip member. Defaults to False.
+        number_of_lines (int, optional): The number of lines requested per portion. Defaults to the API maximum of 1 MB.
+        **kwargs: Passed to `call_with_retries`'s options, such as `max_retries`, `rate_limiter`, `retry_budget`, and `retry_stats`.
+
+    Returns
+        dict: A handle describing the downloaded file.
+            DBInstanceIdentifier (str): The instance.
+            LogFileName (str): The log file.
+            LogPath (str): The path of the spool file.
+            LogBytes (int): The size of the spool file.
+            LogCompressed (bool): True when the spool file is gzip compressed.
+            Portions (int): The number of portions downloaded by this call.
+    """
+    from CloudHarvestPluginAws.retry import call_with_retries
+    from CloudHarvestPluginAws.tasks.aws import _prepare
+    from CloudHarvestPluginAws.telemetry import measure_call, timed
+
+    client, retry_options = _prepare(service='rds',
+                                     command='download_db_log_file_portion',
+                                     credentials=credentials,
+                                     max_retries=kwargs.get('max_retries'),
+                                     region=region,
+                                     rate_limiter=kwargs.get('rate_limiter'),
+                                     retry_budget=kwargs.get('retry_budget'),
+                                     retry_stats=kwargs.get('retry_stats'))
+
+    path = spool_path(account=account, region=region, instance=instance, log_file=log_file, compress=compress)
+    portions = 0
+
+    # Concurrent downloads of the same file would truncate and append to each other's spool file and checkpoint
+    with spool_lock(path):
+        marker, offset = _read_checkpoint(path)
+
+        with _instance_semaphore(account, region, instance), \
+                open(path, 'r+b' if offset else 'wb') as stream, \
+                measure_call(service='rds', region=region, command='download_db_log_file_portion') as call:
+            retry_options['call'] = call
+
+            # Discard anything written after the last checkpoint, such as a portion which was not completely written
+            stream.seek(offset)
+            stream.truncate()
+
+            if marker != '0':
+                logger.debug(f'resuming {instance}:{log_file} from marker {marker}')
+
+            while True:
+                arguments = {
+                    'DBInstanceIdentifier': instance,
+                    'LogFileName': log_file,
+                    'Marker': marker
+                }
+
+                if number_of_lines:
+                    arguments['NumberOfLines'] = number_of_lines
+
+                response = call_with_retries(lambda: timed(call, client.download_db_log_file_portion)(**arguments), **retry_options)
+
+                data = (response.get('LogFileData') or '').encode()
+                if data:
+                    if compress:
+                        from gzip import compress as gzip_compress
+                        data = gzip_compress(data)
+
+                    stream.write(data)
+                    stream.flush()
+
+                portions += 1
+                marker = response.get('Marker') or marker
+                _write_checkpoint(path, marker, stream.tell())
+
+                if not response.get('AdditionalDataPending'):
+                    break
+
+            size = stream.tell()
+
+        _clear_checkpoint(path)
+
+        return {
+            'DBInstanceIdentifier': instance,
+            'LogFileName': log_file,
+            'LogPath': path,
+            'LogBytes': size,
+            'LogCompressed': compress,
+            'Portions': portions
+        }
+
+
+def download_log_text(instance: str, log_file: str, chunk_size: int = DEFAULT_CHUNK_SIZE, **kwargs) -> dict:
+    """
+    Downloads an RDS log file and returns its text. The spool file is decoded one chunk at a time and removed once it is
+    read, so the file's bytes and its text are not held in memory together.
+
+    Arguments
+        instance (str): The DBInstanceIdentifier.
+        log_file (str): The LogFileName.
+        chunk_size (int, optional): The approximate number of characters decoded at a time. Defaults to 1 MB.
+        **kwargs: Passed to `download_log_file()`.
+
+    Returns
+        dict: The handle returned by `download_log_file()` without the 'LogPath' key, and the text under the 'Log' key.
+    """
+    from os import remove
+
+    path = spool_path(account=kwargs.get('account'), region=kwargs.get('region'), instance=instance, log_file=log_file,
+                      compress=kwargs.get('compress', False))
+
+    # Held until the file is removed, so another download of the same file cannot write to it while it is read
+    with spool_lock(path):
+        handle = download_log_file(instance=instance, log_file=log_file, **kwargs)
+        handle['Log'] = ''.join(iter_log_file(handle.pop('LogPath'), chunk_size=chunk_size))
+        remove(path)
+
+    return handle
+
+
+def iter_log_file(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Yields the text of a downloaded log file in chunks. Compressed files are decompressed as they are read.
+
+    Arguments
+        path (str): The LogPath of a handle returned by `download_log_file`.
+        chunk_size (int, optional): The approximate number of characters in each chunk. Chunks are extended to the end of
+            the line they stop in. Defaults to 1 MB.
+    """
+    from gzip import open as gzip_open
+
+    opener = gzip_open if path.endswith('.gz') else open
+
+    with opener(path, 'rt', errors='replace', newline='') as stream:
+        while True:
+            chunk = stream.read(chunk_size)
+
+            if not chunk:
+                break
+
+            if not chunk.endswith('\n'):
+                chunk += stream.readline()
+
+            yield chunk
+
+
+def read_log_file(path: str, offset: int = 0, size: int = None) -> str:
+    """
+    Reads a downloaded log file. Compressed files are decompressed.
+
+    Arguments
+        path (str): The LogPath of a handle returned by `download_log_file`.
+        offset (int, optional): The offset in the uncompressed text to start reading from. Defaults to 0.
+        size (int, optional): The maximum number of bytes to read. Defaults to the rest of the file.
+    """
+    from gzip import open as gzip_open
+
+    opener = gzip_open if path.endswith('.gz') else open
+
+    with opener(path, 'rb') as stream:
+        stream.seek(offset)
+        return stream.read(-1 if size is None else size).decode(errors='replace')
+
+
+def spool_path(account: str, region: str, instance: str, log_file: str, compress: bool = False) -> str:
+    """
+    Returns the path a log file is downloaded to, creating the directory if it does not exist.
+    """
+    from CloudHarvestCoreTasks.environment import Environment
+    from os.path import expanduser, join
+    from pathlib import Path
+    from tempfile import gettempdir
+
+    directory = Path(expanduser(Environment.get('platforms.aws.rds_logs.spool_path') or join(gettempdir(), 'harvest-rds-logs')))
+    directory = directory.joinpath(str(account), str(region), instance)
+    directory.mkdir(parents=True, exist_ok=True, mode=0o700)
+
+    # Log file names contain directories, such as 'error/postgresql.log.2024-01-01-00'
+    return str(directory.joinpath(log_file.replace('/', '_') + ('.gz' if compress else '')))
+
+
+def spool_lock(path: str) -> RLock:
+    """
+    Returns the lock held while a spool file is written or read. The lock is reentrant, so a caller holding it may download
+    the file.
+    """
+    with SpoolLocks.lock:
+        lock = SpoolLocks.locks.get(path)
+
+        if lock is None:
+            lock = SpoolLocks.locks[path] = RLock()
+
+    return lock
+
+
+def _instance_semaphore(account: str, region: str, instance: str) -> Semaphore:
+    from CloudHarvestCoreTasks.environment import Environment
+
+    key = (account, region, instance)
+
+    with InstanceSemaphores.lock:
+        semaphore = InstanceSemaphores.semaphores.get(key)
+
+        if semaphore is None:
+            limit = int(Environment.get('platforms.aws.rds_logs.max_concurrent_per_instance') or DEFAULT_MAX_CONCURRENT_PER_INSTANCE)
+            semaphore = InstanceSemaphores.semaphores[key] = Semaphore(limit)
+
+    return semaphore
+
+
+def _read_checkpoint(path: str) -> tuple:
+    """
+    Returns the (marker, offset) recorded by an interrupted download, or ('0', 0) to start from the beginning.
+    """
+    from json import load
+    from os.path import exists, getsize
+
+    try:
+        with open(f'{path}.marker') as stream:
+            checkpoint = load(stream)
+
+    except (OSError, ValueError):
+        return '0', 0
+
+    # The spool file is missing or shorter than the checkpoint, so the download must start over
+    if not exists(path) or getsize(path) < checkpoint['offset']:
+        return '0', 0
+
+    return checkpoint['marker'], checkpoint['offset']
+
+
+def _write_checkpoint(path: str, marker: str, offset: int) -> None:
+    from json import dump
+    from os import replace
+
+    with open(f'{path}.marker.tmp', 'w') as stream:
+        dump({'marker': marker, 'offset': offset}, stream)
+
+    replace(f'{path}.marker.tmp', f'{path}.marker')
+
+
+def _clear_checkpoint(path: str) -> None:
+    from os import remove
+
+    try:
+        remove(f'{path}.marker')
+
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,608 @@
+"""
+This library keeps materialized copies of the rows produced by report templates. Reports such as `reports.aws.ec2.instances`
+run a `mongo` aggregation over an entire collection each time they are opened; dashboards which refresh the same reports
+repeatedly put that load on the database every time.
+
+- The rows produced by each `mongo` task of a report are stored, keyed by the report name and its parameters (the values
+  of the `var.` references in the task).
+- Each row is tagged with the account and region of the record it was projected from. When a collection pass writes new
+  records for an account, region, service, and type, `refresh()` re-runs the affected aggregations for that account and
+  region only and replaces their rows.
+- Pipelines with stages which combine records, such as `$group`, cannot be attributed to an account and region and are
+  rebuilt in full instead.
+- Rows joined from other collections with `$lookup` may belong to any account and region, so a report is rebuilt in full
+  when records are written to a collection it joins.
+- Rows are stored by account and region, so a `$sort` which ends a pipeline is applied again when the rows are read.
+  Pipelines which sort before a later stage are rebuilt in full.
+- Reading a materialized report does not query the collection.
+
+`refresh()` must be called once the records of a collection pass are stored. `Sweep.run(runner, refresh_reports=True)`
+calls it after each unit; other schedulers call it, or `POST /aws/reports/materialized/refresh`, themselves. Reports
+which are not refreshed are rebuilt in full once they are older than `ttl`.
+
+By default, rows are stored in a MongoDB collection, so every API node shares them and they survive restarts. The
+'memory' storage keeps rows in the process which built them: a refresh only updates the process which receives it, so
+it is only suitable for a single API node.
+
+Configuration:
+- platforms.aws.reports.materialized.uri: The MongoDB URI of the database holding the collected records.
+- platforms.aws.reports.materialized.database: The database name. Defaults to 'harvest'.
+- platforms.aws.reports.materialized.storage: 'mongo' or 'memory'. Defaults to 'mongo'.
+- platforms.aws.reports.materialized.collection: The collection used by the 'mongo' storage. Defaults to 'harvest_aws_materialized_reports'.
+- platforms.aws.reports.materialized.ttl: The number of seconds after which a report is rebuilt in full, in case a refresh
+  was missed. Defaults to 86400.
+"""
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+DEFAULT_DATABASE = 'harvest'
+DEFAULT_COLLECTION = 'harvest_aws_materialized_reports'
+DEFAULT_TTL = 86400.0
+
+# Added to each row while it is aggregated so it can be attributed to the account and region of its record
+PARTITION_FIELD = '_harvest_partition'
+
+# Stages which produce rows from one record at a time, so every row belongs to the account and region of its record.
+# `$sort` is only partitionable as the last stage, where it can be applied again to the combined rows.
+PARTITIONABLE_STAGES = {'$addFields', '$lookup', '$match', '$project', '$set', '$unset', '$unwind'}
+
+# Stages which read other collections, and the key naming the collection
+JOIN_STAGES = {'$graphLookup': 'from', '$lookup': 'from', '$unionWith': 'coll'}
+
+# The order MongoDB sorts values of different types in
+SORT_TYPE_ORDER = ('null', 'number', 'string', 'object', 'array', 'bytes', 'objectid', 'bool', 'datetime')
+
+
+class MaterializedReports:
+    store = None
+    source = None
+    reports = None  # report name -> report template, read from the YAML files the first time a report is requested
+
+    lock = Lock()
+    locks = {}      # key -> Lock, so each report is built once at a time
+
+
+class MemoryStore:
+    def __init__(self):
+        """
+        Keeps materialized rows in this process.
+        """
+        self.lock = Lock()
+        self.entries = {}       # key -> {'built': timestamp, 'results': {result_as: {partition: rows}}}
+
+    def get(self, key: tuple) -> dict or None:
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            return {
+                'built': entry['built'],
+                'results': {result_as: _concatenate(partitions) for result_as, partitions in entry['results'].items()}
+            }
+
+    def replace(self, key: tuple, result_as: str, partitions: dict) -> None:
+        with self.lock:
+            self.entries.setdefault(key, {'built': None, 'results': {}})['results'][result_as] = dict(partitions)
+
+    def update(self, key: tuple, result_as: str, partition: tuple, rows: list) -> None:
+        with self.lock:
+            partitions = self.entries.setdefault(key, {'built': None, 'results': {}})['results'].setdefault(result_as, {})
+
+            if rows:
+                partitions[partition] = rows
+
+            else:
+                partitions.pop(partition, None)
+
+    def mark(self, key: tuple, built: float) -> None:
+        with self.lock:
+            self.entries.setdefault(key, {'built': None, 'results': {}})['built'] = built
+
+    def keys(self) -> list:
+        with self.lock:
+            return [key for key, entry in self.entries.items() if entry['built'] is not None]
+
+    def delete(self, key: tuple = None) -> None:
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+
+            else:
+                self.entries.pop(key, None)
+
+
+class MongoStore:
+    def __init__(self, collection):
+        """
+        Keeps materialized rows in a MongoDB collection, one document per row, so every API node shares them.
+
+        Arguments
+            collection (pymongo.collection.Collection): The collection.
+        """
+        self.collection = collection
+        self.collection.create_index([('key', 1), ('result_as', 1), ('account', 1), ('region', 1)])
+
+    def get(self, key: tuple) -> dict or None:
+        marker = self.collection.find_one({'key': _key(key), 'marker': True})
+
+        if marker is None:
+            return None
+
+        results = {}
+        for document in self.collection.find({'key': _key(key), 'marker': {'$exists': False}}, sort=[('_id', 1)]):
+            results.setdefault(document['result_as'], []).append(document['row'])
+
+        return {'built': marker['built'], 'results': results}
+
+    def replace(self, key: tuple, result_as: str, partitions: dict) -> None:
+        self.collection.delete_many({'key': _key(key), 'result_as': result_as, 'marker': {'$exists': False}})
+        self._insert(key, result_as, partitions)
+
+    def update(self, key: tuple, result_as: str, partition: tuple, rows: list) -> None:
+        self.collection.delete_many({'key': _key(key), 'result_as': result_as, 'account': partition[0], 'region': partition[1]})
+        self._insert(key, result_as, {partition: rows})
+
+    def mark(self, key: tuple, built: float) -> None:
+        self.collection.update_one({'key': _key(key), 'marker': True},
+                                   {'$set': {'report': key[0], 'parameters': key[1], 'built': built}},
+                                   upsert=True)
+
+    def keys(self) -> list:
+        return [(marker['report'], marker['parameters']) for marker in self.collection.find({'marker': True})]
+
+    def delete(self, key: tuple = None) -> None:
+        self.collection.delete_many({} if key is None else {'key': _key(key)})
+
+    def _insert(self, key: tuple, result_as: str, partitions: dict) -> None:
+        documents = [
+            {'key': _key(key), 'result_as': result_as, 'account': partition[0], 'region': partition[1], 'row': row}
+            for partition, rows in partitions.items()
+            for row in rows
+        ]
+
+        if documents:
+            self.collection.insert_many(documents, ordered=True)
+
+
+def get_report(name: str, parameters: dict = None, build: bool = True) -> dict or None:
+    """
+    Retrieves the materialized rows of a report, building them when they do not exist or are older than
+    `platforms.aws.reports.materialized.ttl`.
+
+    Arguments
+        name (str): The report name, such as 'reports.aws.ec2.instances'.
+        parameters (dict, optional): The values of the report's `var.` references.
+        build (bool, optional): When False, None is returned instead of building a report which is not materialized. Defaults to True.
+
+    Returns
+        dict or None: The rows of each `mongo` task, keyed by the task's `result_as` (or 'result').
+    """
+    from time import time
+
+    key = _report_key(name, parameters)
+    entry = get_store().get(key)
+
+    if entry is not None and entry['built'] is not None and time() - entry['built'] < _setting('ttl', DEFAULT_TTL):
+        return _sort_results(entry['results'], report_queries(name, parameters))
+
+    if not build:
+        return None
+
+    return materialize(name, parameters)
+
+
+def materialize(name: str, parameters: dict = None) -> dict:
+    """
+    Builds the rows of every `mongo` task of a report and stores them.
+
+    Returns
+        dict: The rows of each `mongo` task, keyed by the task's `result_as` (or 'result').
+    """
+    from time import time
+
+    key = _report_key(name, parameters)
+    queries = report_queries(name, parameters)
+
+    with _key_lock(key):
+        store = get_store()
+        built = time()
+
+        for query in queries:
+            store.replace(key, query['result_as'], _aggregate(query))
+
+        store.mark(key, built)
+
+    return _sort_results(store.get(key)['results'], queries)
+
+
+def refresh(account: str, region: str = None, service: str = None, type: str = None) -> int:
+    """
+    Refreshes the materialized rows which are affected by new records for an account and region. Call this after a
+    collection pass writes its records, such as with `Sweep.run(runner, refresh_reports=True)`. With the 'memory'
+    storage, only the rows of this process are refreshed.
+
+    Arguments
+        account (str): The AWS account number.
+        region (str, optional): The AWS region. None for global services.
+        service (str, optional): The AWS service. When not provided, every report is refreshed.
+        type (str, optional): The service type, such as 'instances'. When not provided, every report of the service is refreshed.
+
+    Returns
+        int: The number of report queries which were refreshed.
+    """
+    refreshed = 0
+    store = get_store()
+
+    for key in store.keys():
+        name, parameters = key
+
+        try:
+            queries = report_queries(name, _load_parameters(parameters))
+
+        except Exception as e:
+            logger.warning(f'{name}: unable to refresh the materialized report; it will be removed: {e}')
+            store.delete(key)
+            continue
+
+        for query in queries:
+            changed = _affected(query['collection'], service, type)
+
+            # Joined rows may belong to any account and region, so the whole report is rebuilt
+            joined = any(_affected(collection, service, type) for collection in query['joins'])
+
+            if not (changed or joined):
+                continue
+
+            with _key_lock(key):
+                if query['partitioned'] and not joined:
+                    partition = (account, region)
+                    rows = _aggregate(query, partition=partition).get(partition) or []
+                    store.update(key, query['result_as'], partition, rows)
+
+                else:
+                    store.replace(key, query['result_as'], _aggregate(query))
+
+            refreshed += 1
+
+    return refreshed
+
+
+def report_queries(name: str, parameters: dict = None) -> list:
+    """
+    Returns the `mongo` tasks of a report with their `var.` references replaced by the parameters.
+
+    Returns
+        list: A dictionary for each task with the 'result_as', 'collection', 'pipeline', 'partitioned', 'sort', and 'joins' keys.
+    """
+    from CloudHarvestPluginAws.exceptions import HarvestAwsException
+
+    template = _get_template(name)
+    parameters = parameters or {}
+
+    missing = [variable for variable in sorted(_variables(template)) if variable not in parameters]
+    queries = []
+
+    for index, step in enumerate(template.get('tasks') or []):
+        if not isinstance(step, dict) or 'mongo' not in step:
+            continue
+
+        task = _resolve(step['mongo'], parameters)
+        pipeline = (task.get('arguments') or {}).get('pipeline') or []
+
+        if _references(task, missing):
+            raise HarvestAwsException(f'{name}: the parameters {missing} are required')
+
+        result_as = task.get('result_as')
+
+        # A final $sort is applied again when the rows are read, so only the stages before it must be partitionable
+        sort = pipeline[-1]['$sort'] if pipeline and isinstance(pipeline[-1], dict) and set(pipeline[-1]) == {'$sort'} else None
+        stages = pipeline[:-1] if sort is not None else pipeline
+        partitioned = all(isinstance(stage, dict) and set(stage) <= PARTITIONABLE_STAGES for stage in stages)
+
+        queries.append({
+            'result_as': result_as if isinstance(result_as, str) else (result_as or {}).get('name') or 'result',
+            'collection': task['collection'],
+            'pipeline': pipeline,
+            'partitioned': partitioned,
+            'sort': sort if partitioned else None,
+            'joins': tuple(sorted(_joined_collections(pipeline))),
+        })
+
+    return queries
+
+
+def get_store():
+    """
+    Returns the configured store, creating it if it does not exist yet.
+    """
+    if MaterializedReports.store is None:
+        with MaterializedReports.lock:
+            if MaterializedReports.store is None:
+                if _setting('storage', 'mongo') == 'memory':
+                    MaterializedReports.store = MemoryStore()
+
+                else:
+                    MaterializedReports.store = MongoStore(get_source()[_setting('collection', DEFAULT_COLLECTION)])
+
+    return MaterializedReports.store
+
+
+def get_source():
+    """
+    Returns the database holding the collected records, connecting to `platforms.aws.reports.materialized.uri` if
+    no database was provided with `set_source()`.
+    """
+    if MaterializedReports.source is None:
+        with MaterializedReports.lock:
+            if MaterializedReports.source is None:
+                from CloudHarvestPluginAws.exceptions import HarvestAwsException
+
+                uri = _setting('uri', '')
+
+                if not uri:
+                    raise HarvestAwsException('platforms.aws.reports.materialized.uri is not configured')
+
+                from pymongo import MongoClient
+
+                MaterializedReports.source = MongoClient(uri)[_setting('database', DEFAULT_DATABASE)]
+
+    return MaterializedReports.source
+
+
+def set_source(database, store=None) -> None:
+    """
+    Sets the database holding the collected records, such as a database of an existing MongoClient, and optionally the
+    store.
+    """
+    with MaterializedReports.lock:
+        MaterializedReports.source = database
+
+        if store is not None:
+            MaterializedReports.store = store
+
+
+def _aggregate(query: dict, partition: tuple = None) -> dict:
+    """
+    Runs a report query and returns its rows grouped by account and region. Queries which are not partitioned return
+    their rows under (None, None).
+    """
+    pipeline = list(query['pipeline'])
+
+    if query['partitioned']:
+        pipeline = [{'$addFields': {PARTITION_FIELD: ['$Harvest.AccountId', '$Harvest.Region']}}] + [_keep_partition(stage) for stage in pipeline]
+
+        if partition is not None:
+            pipeline.insert(0, {'$match': {'Harvest.AccountId': partition[0], 'Harvest.Region': partition[1]}})
+
+    partitions = {}
+
+    for row in get_source()[query['collection']].aggregate(pipeline):
+        key = tuple(row.pop(PARTITION_FIELD, None) or (None, None))
+        partitions.setdefault(key, []).append(row)
+
+    return partitions
+
+
+def _keep_partition(stage: dict) -> dict:
+    """
+    Adds the partition field to `$project` stages which name the fields they keep.
+    """
+    projection = stage.get('$project')
+
+    if not isinstance(projection, dict):
+        return stage
+
+    # Fields are kept by excluding others, so the partition field is kept too
+    if all(value in (0, False) for field, value in projection.items() if field != '_id'):
+        return stage
+
+    return {'$project': projection | {PARTITION_FIELD: 1}}
+
+
+def _affected(collection: str, service: str = None, type: str = None) -> bool:
+    # Collections are named after the service template, such as aws.ec2.instances
+    parts = collection.split('.')
+
+    return (service is None or (len(parts) > 1 and parts[1] == service)) and (type is None or parts[-1] == type)
+
+
+def _joined_collections(value) -> set:
+    """
+    Returns the names of the collections read by the join stages of a pipeline, including nested pipelines.
+    """
+    collections = set()
+
+    if isinstance(value, dict):
+        for operator, argument in value.items():
+            if operator in JOIN_STAGES:
+                collection = argument.get(JOIN_STAGES[operator]) if isinstance(argument, dict) else argument
+
+                if isinstance(collection, str):
+                    collections.add(collection)
+
+            collections |= _joined_collections(argument)
+
+    elif isinstance(value, list):
+        for item in value:
+            collections |= _joined_collections(item)
+
+    return collections
+
+
+def _sort_results(results: dict, queries: list) -> dict:
+    """
+    Applies the final `$sort` of each partitioned query to its rows, which are stored by account and region.
+    """
+    for query in queries:
+        if query['sort'] and query['result_as'] in results:
+            results[query['result_as']] = _sort_rows(results[query['result_as']], query['sort'])
+
+    return results
+
+
+def _sort_rows(rows: list, specification: dict) -> list:
+    """
+    Sorts rows like a `$sort` stage. Values of different types are ordered as MongoDB orders them, and missing fields
+    sort as null. Sort keys which are not 1 or -1, such as text scores, are ignored.
+    """
+    rows = list(rows)
+
+    # Stable sorts from the last key to the first sort by every key
+    for path, direction in reversed(list(specification.items())):
+        if direction in (1, -1):
+            rows.sort(key=lambda row: _sort_value(_get_path(row, path), descending=direction == -1), reverse=direction == -1)
+
+    return rows
+
+
+def _sort_value(value, descending: bool = False) -> tuple:
+    from datetime import datetime
+
+    # Arrays sort by their smallest element in ascending order and their largest in descending order
+    if isinstance(value, (list, tuple)):
+        elements = [_sort_value(element, descending) for element in value]
+        return (max if descending else min)(elements) if elements else (SORT_TYPE_ORDER.index('null'), 0)
+
+    if value is None:
+        kind, value = 'null', 0
+
+    elif isinstance(value, bool):
+        kind = 'bool'
+
+    elif isinstance(value, (int, float)):
+        kind = 'number'
+
+    elif isinstance(value, str):
+        kind = 'string'
+
+    elif isinstance(value, dict):
+        kind, value = 'object', tuple((str(k), _sort_value(v, descending)) for k, v in value.items())
+
+    elif isinstance(value, bytes):
+        kind = 'bytes'
+
+    elif isinstance(value, datetime):
+        kind, value = 'datetime', value.timestamp()
+
+    elif type(value).__name__ == 'ObjectId':
+        kind, value = 'objectid', str(value)
+
+    else:
+        return len(SORT_TYPE_ORDER), str(value)
+
+    return SORT_TYPE_ORDER.index(kind), value
+
+
+def _get_path(row: dict, path: str):
+    for part in path.split('.'):
+        row = row.get(part) if isinstance(row, dict) else None
+
+    return row
+
+
+def _resolve(value, parameters: dict):
+    if isinstance(value, dict):
+        return {k: _resolve(v, parameters) for k, v in value.items()}
+
+    elif isinstance(value, list):
+        return [_resolve(v, parameters) for v in value]
+
+    elif isinstance(value, str) and value.startswith('var.') and value[4:] in parameters:
+        return parameters[value[4:]]
+
+    return value
+
+
+def _get_template(name: str) -> dict:
+    """
+    Returns the body of a report template, such as 'reports.aws.ec2.instances'. The report templates are read the first
+    time a report is requested.
+    """
+    if MaterializedReports.reports is None:
+        with MaterializedReports.lock:
+            if MaterializedReports.reports is None:
+                MaterializedReports.reports = _read_templates()
+
+    template = MaterializedReports.reports.get(name)
+
+    if template is None:
+        from CloudHarvestPluginAws.exceptions import HarvestAwsException
+        raise HarvestAwsException(f'No report named `{name}`')
+
+    return template
+
+
+def _read_templates() -> dict:
+    """
+    Reads the report templates, keyed by their name. Templates without a name are named after their path, such as
+    'reports.aws.rds.instances'.
+    """
+    from glob import glob
+    from os.path import dirname, join, relpath, splitext
+    from yaml import SafeLoader, load
+
+    root = join(dirname(__file__), 'templates')
+    templates = {}
+
+    for path in sorted(glob(join(root, 'reports', '**', '*.yaml'), recursive=True)):
+        with open(path) as stream:
+            report = (load(stream, Loader=SafeLoader) or {}).get('report') or {}
+
+        templates[report.get('name') or splitext(relpath(path, root))[0].replace('/', '.')] = report
+
+    return templates
+
+
+def _variables(value) -> set:
+    """
+    Returns the names of the variables referenced with `var.`.
+    """
+    if isinstance(value, dict):
+        return set().union(*map(_variables, value.values()))
+
+    elif isinstance(value, list):
+        return set().union(*map(_variables, value))
+
+    return {value[4:]} if isinstance(value, str) and value.startswith('var.') else set()
+
+
+def _references(value, variables: list) -> bool:
+    if isinstance(value, dict):
+        return any(_references(v, variables) for v in value.values())
+
+    elif isinstance(value, list):
+        return any(_references(v, variables) for v in value)
+
+    return isinstance(value, str) and value.startswith('var.') and value[4:] in variables
+
+
+def _concatenate(partitions: dict) -> list:
+    return [row for partition in sorted(partitions, key=lambda p: tuple(str(part) for part in p)) for row in partitions[partition]]
+
+
+def _report_key(name: str, parameters: dict = None) -> tuple:
+    from json import dumps
+    return name, dumps(parameters or {}, sort_keys=True, default=str)
+
+
+def _load_parameters(parameters: str) -> dict:
+    from json import loads
+    return loads(parameters)
+
+
+def _key(key: tuple) -> str:
+    return '|'.join(key)
+
+
+def _key_lock(key: tuple) -> Lock:
+    with MaterializedReports.lock:
+        return MaterializedReports.locks.setdefault(key, Lock())
+
+
+def _setting(name: str, default):
+    from CloudHarvestCoreTasks.environment import Environment
+    return type(default)(Environment.get(f'platforms.aws.reports.materialized.{name}') or default)
@@ -0,0 +1,418 @@
+"""
+This library answers AWS requests locally so templates can be run and measured without an AWS account. When enabled,
+every pooled client's requests are answered by an `OfflineBackend` instead of AWS: parameters are still validated and
+serialized by botocore, but no request is signed or sent.
+
+Responses are either recorded fixtures or synthetic records generated from the operation's output shape. Paginated
+commands are paginated using the command's own token names, and the backend can add latency and throttling errors.
+
+    from CloudHarvestPluginAws.offline import OfflineBackend, offline
+
+    with offline(OfflineBackend(latency=0.02, throttle_rate=0.05, counts={'ec2.describe_snapshots': 100000})):
+        query_aws('ec2', 'describe_snapshots', {}, region='us-east-1')
+"""
+from contextlib import contextmanager
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+DEFAULT_COUNT = 10
+DEFAULT_PAGE_SIZE = 1000
+
+# Nested structures below this depth are left empty
+MAX_SHAPE_DEPTH = 4
+
+# Paginator limit keys are capped at this many records, even when a larger page size is requested
+MAX_PAGE_SIZE = 10000
+
+_PARAMS_KEY = 'harvest_offline_params'
+
+
+class OfflineBackend:
+    def __init__(self,
+                 latency: float = 0,
+                 throttle_rate: float = 0,
+                 counts: dict = None,
+                 default_count: int = DEFAULT_COUNT,
+                 page_size: int = None,
+                 fixtures: dict = None,
+                 seed: int = 0):
+        """
+        Answers AWS requests locally.
+
+        Arguments
+            latency (float, optional): Seconds each request takes.
+            throttle_rate (float, optional): The fraction of requests which fail with a `Throttling` error.
+            counts (dict, optional): The number of records returned by paginated commands, keyed by '<service>.<command>'.
+            default_count (int, optional): The number of records returned by paginated commands not in `counts`.
+            page_size (int, optional): The number of records in each page. Defaults to the request's limit argument or 1000.
+            fixtures (dict, optional): Recorded responses keyed by '<service>.<command>'. A list is returned as the pages of
+                the command, one page per request, and anything else is returned for every request.
+            seed (int, optional): The seed used to decide which requests are throttled.
+        """
+        from random import Random
+
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.counts = counts or {}
+        self.default_count = default_count
+        self.page_size = page_size
+        self.fixtures = {
+            'sts.assume_role': _assume_role_response(),
+            'account.list_regions': _list_regions_response()
+        } | (fixtures or {})
+
+        self.random = Random(seed)
+        self.lock = Lock()
+
+        self.calls = {}         # '<service>.<command>' -> number of requests
+        self.throttled = 0
+        self.prototypes = {}    # (service, command) -> record prototype
+
+    @property
+    def call_count(self) -> int:
+        with self.lock:
+            return sum(self.calls.values())
+
+    def reset(self) -> None:
+        with self.lock:
+            self.calls.clear()
+            self.throttled = 0
+
+    def before_parameter_build(self, params: dict, context: dict, **kwargs) -> None:
+        # The parameters are not passed to `before-call`, so they are stored in the request context
+        context[_PARAMS_KEY] = dict(params)
+
+    def before_call(self, model, context: dict, **kwargs) -> tuple:
+        """
+        Returns the (http response, parsed response) tuple botocore uses instead of sending the request.
+        """
+        from time import sleep
+
+        service = model.service_model.service_name
+        command = _snake_case(model.name)
+        key = f'{service}.{command}'
+
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            throttle = self.throttle_rate and self.random.random() < self.throttle_rate
+
+            if throttle:
+                self.throttled += 1
+
+        if self.latency:
+            sleep(self.latency)
+
+        if throttle:
+            return _response(400, {'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded (offline)'}})
+
+        params = context.get(_PARAMS_KEY) or {}
+        fixture = self.fixtures.get(key)
+
+        if fixture is not None:
+            if isinstance(fixture, list):
+                index = (self.calls[key] - 1) % len(fixture)
+                return _response(200, _copy(fixture[index]))
+
+            return _response(200, _copy(fixture))
+
+        return _response(200, self.generate(model, service, command, params))
+
+    def generate(self, model, service: str, command: str, params: dict) -> dict:
+        """
+        Generates a response for a request. Paginated commands return a page of synthetic records.
+        """
+        from botocore.exceptions import UnknownServiceError
+
+        output_shape = model.output_shape
+
+        if output_shape is None:
+            return {}
+
+        try:
+            pagination = _pagination_config(service, command)
+
+        except UnknownServiceError:
+            pagination = None
+
+        # Commands which are not paginated return a single structure
+        if not pagination:
+            return _generate(output_shape, index=0)
+
+        result_keys = _as_list(pagination.get('result_key'))
+        input_tokens = _as_list(pagination.get('input_token'))
+        output_tokens = _as_list(pagination.get('output_token'))
+
+        count = int(self.counts.get(f'{service}.{command}', self.default_count))
+        limit = params.get(pagination.get('limit_key')) if pagination.get('limit_key') else None
+        page_size = min(int(limit or self.page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+
+        # The first input token holds the offset of the page
+        try:
+            offset = int(params.get(input_tokens[0]) or 0)
+
+        except (TypeError, ValueError):
+            offset = 0
+
+        end = min(count, offset + page_size)
+
+        response = {}
+
+        # Start with the members which are not being paginated, such as a hosted zone's details
+        for name, member in output_shape.members.items():
+            if name not in result_keys and name not in output_tokens and member.type_name == 'structure':
+                response[name] = _generate(member, index=0)
+
+        for position, result_key in enumerate(result_keys):
+            records = []
+
+            if position == 0:
+                prototype = self._prototype(output_shape, result_key, service, command)
+                records = [_instantiate(prototype, index) for index in range(offset, end)]
+
+            _set_path(response, result_key, records)
+
+        if end < count:
+            for position, output_token in enumerate(output_tokens):
+                _set_path(response, output_token, str(end) if position == 0 else 'offline')
+
+        if pagination.get('more_results'):
+            _set_path(response, pagination['more_results'], end < count)
+
+        return response
+
+    def _prototype(self, output_shape, result_key: str, service: str, command: str):
+        key = (service, command)
+
+        with self.lock:
+            prototype = self.prototypes.get(key)
+
+        if prototype is None:
+            member = _shape_at(output_shape, result_key)
+            prototype = _generate(member.member, index=None) if member is not None and member.type_name == 'list' else {}
+
+            with self.lock:
+                self.prototypes[key] = prototype
+
+        return prototype
+
+
+class Offline:
+    backend = None
+    lock = Lock()
+
+
+def enable(backend: OfflineBackend) -> None:
+    """
+    Answers every request made by pooled clients with `backend`. Pooled clients are discarded so new clients are created
+    with the backend's event handlers.
+    """
+    from CloudHarvestPluginAws.clients import CachedClients, clear_clients
+
+    with Offline.lock:
+        if Offline.backend is not None:
+            raise RuntimeError('An offline backend is already enabled')
+
+        with CachedClients.lock:
+            if CachedClients.session is None:
+                from boto3 import Session
+                CachedClients.session = Session()
+
+        clear_clients()
+
+        events = CachedClients.session.events
+        events.register('before-parameter-build', backend.before_parameter_build, unique_id='harvest-offline-params')
+        events.register('before-call', backend.before_call, unique_id='harvest-offline-call')
+
+        Offline.backend = backend
+
+    logger.info('AWS requests are answered by the offline backend')
+
+
+def disable() -> None:
+    """
+    Stops answering requests with the offline backend.
+    """
+    from CloudHarvestPluginAws.clients import CachedClients, clear_clients
+
+    with Offline.lock:
+        if Offline.backend is None:
+            return
+
+        events = CachedClients.session.events
+        events.unregister('before-parameter-build', unique_id='harvest-offline-params')
+        events.unregister('before-call', unique_id='harvest-offline-call')
+
+        clear_clients()
+        Offline.backend = None
+
+
+@contextmanager
+def offline(backend: OfflineBackend = None):
+    """
+    Answers requests with the offline backend within the block.
+    """
+    backend = backend or OfflineBackend()
+    enable(backend)
+
+    try:
+        yield backend
+
+    finally:
+        disable()
+
+
+def _response(status_code: int, parsed: dict) -> tuple:
+    from botocore.awsrequest import AWSResponse
+
+    body = repr(parsed).encode()
+    parsed['ResponseMetadata'] = {
+        'RequestId': 'offline',
+        'HTTPStatusCode': status_code,
+        'HTTPHeaders': {'content-length': str(len(body))},
+        'RetryAttempts': 0
+    }
+
+    return AWSResponse(url='https://offline.invalid', status_code=status_code, headers={}, raw=None), parsed
+
+
+def _assume_role_response() -> dict:
+    # Synthetic credentials would expire in the past, causing every profile lookup to assume the role again
+    from datetime import datetime, timedelta, timezone
+
+    return {
+        'Credentials': {
+            'AccessKeyId': 'OFFLINEACCESSKEYID',
+            'SecretAccessKey': 'offline',
+            'SessionToken': 'offline',
+            'Expiration': datetime.now(tz=timezone.utc) + timedelta(hours=12)
+        },
+        'AssumedRoleUser': {'AssumedRoleId': 'offline', 'Arn': 'arn:aws:sts::000000000000:assumed-role/offline/offline'}
+    }
+
+
+def _list_regions_response() -> dict:
+    # Synthetic region names would cause every region to be skipped as not enabled
+    from boto3 import Session
+
+    return {
+        'Regions': [
+            {'RegionName': region, 'RegionOptStatus': 'ENABLED_BY_DEFAULT'}
+            for region in Session().get_available_regions('ec2')
+        ]
+    }
+
+
+def _pagination_config(service: str, command: str) -> dict or None:
+    from CloudHarvestPluginAws.clients import CachedClients
+
+    loader = CachedClients.session._session.get_component('data_loader')
+
+    try:
+        paginators = loader.load_service_model(service, 'paginators-1')
+
+    except Exception:
+        return None
+
+    from botocore import xform_name
+
+    for operation, config in paginators.get('pagination', {}).items():
+        if xform_name(operation) == command:
+            return config
+
+    return None
+
+
+def _generate(shape, index: int or None, depth: int = 0, name: str = None):
+    """
+    Generates a value for a shape. When `index` is None, strings contain a '{i}' placeholder which `_instantiate`
+    replaces with each record's index.
+    """
+    from datetime import datetime, timezone
+
+    type_name = shape.type_name
+    name = name or shape.name
+
+    if type_name == 'structure':
+        if depth >= MAX_SHAPE_DEPTH:
+            return {}
+
+        return {member_name: _generate(member, index, depth + 1, member_name)
+                for member_name, member in shape.members.items()
+                if member.type_name != 'blob'}
+
+    elif type_name == 'list':
+        return [] if depth >= MAX_SHAPE_DEPTH else [_generate(shape.member, index, depth + 1, name)]
+
+    elif type_name == 'map':
+        return {}
+
+    elif type_name == 'string':
+        if shape.enum:
+            return shape.enum[0]
+
+        return f'{name}-' + ('{i}' if index is None else str(index))
+
+    elif type_name in ('integer', 'long'):
+        return 0 if index is None else index
+
+    elif type_name in ('float', 'double'):
+        return 0.0
+
+    elif type_name == 'boolean':
+        return False
+
+    elif type_name == 'timestamp':
+        return datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    return None
+
+
+def _instantiate(prototype, index: int):
+    if isinstance(prototype, dict):
+        return {key: _instantiate(value, index) for key, value in prototype.items()}
+
+    elif isinstance(prototype, list):
+        return [_instantiate(value, index) for value in prototype]
+
+    elif isinstance(prototype, str) and '{i}' in prototype:
+        return prototype.replace('{i}', str(index))
+
+    return prototype
+
+
+def _copy(value):
+    from copy import deepcopy
+    return deepcopy(value)
+
+
+def _shape_at(shape, path: str):
+    for part in path.split('.'):
+        if shape is None or shape.type_name != 'structure':
+            return None
+
+        shape = shape.members.get(part)
+
+    return shape
+
+
+def _set_path(response: dict, path: str, value) -> None:
+    parts = path.split('.')
+
+    for part in parts[:-1]:
+        response = response.setdefault(part, {})
+
+    response[parts[-1]] = value
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+
+    return value if isinstance(value, list) else [value]
+
+
+def _snake_case(operation_name: str) -> str:
+    from botocore import xform_name
+    return xform_name(operation_name)
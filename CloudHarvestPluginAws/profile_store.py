@@ -0,0 +1,258 @@
+"""
+This library persists unexpired credentials and account aliases to a local sqlite database. Short-lived worker processes
+which share the database can begin collecting without assuming each role or looking up each account alias again.
+
+The database is created with permissions which only allow the current user to read it. Credentials are only stored when
+a key is configured, and are encrypted with Fernet, which requires the optional `cryptography` package. Without a key,
+only account aliases are stored and a warning is logged; credentials stored in plain text by earlier versions are
+removed. A key configured without the package raises a HarvestAwsException instead of storing credentials in plain text.
+Rows which cannot be decrypted with the key are treated as cache misses.
+
+Configuration:
+- platforms.aws.profile_cache.path: The path to the sqlite database. The disk tier is disabled when not provided.
+- platforms.aws.profile_cache.key: A Fernet key used to encrypt credentials in the database. Credentials are not stored
+  without it.
+- platforms.aws.account_alias_ttl: The number of seconds an account alias is cached. Defaults to 86400.
+"""
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+DEFAULT_ALIAS_TTL = 86400
+
+
+class ProfileStore:
+    lock = Lock()
+    connection = None
+    fernet = None
+    path = None
+    error = None    # raised by every call when the configured key cannot be used
+
+    hits = 0
+    misses = 0
+
+
+def load_profile(account_number: str, role_name: str):
+    """
+    Loads a profile with unexpired credentials from the database.
+
+    Arguments
+        account_number (str): The AWS account number.
+        role_name (str): The AWS role name.
+
+    Returns
+        Profile or None: The profile, or None when the disk tier is disabled, no key is configured, or no unexpired
+        credentials are stored.
+    """
+    from datetime import datetime, timezone
+
+    with ProfileStore.lock:
+        connection = _connect()
+
+        if connection is None or ProfileStore.fernet is None:
+            return None
+
+        row = connection.execute(
+            'SELECT aws_access_key_id, aws_secret_access_key, aws_session_token, expiration, role_arn FROM profiles '
+            'WHERE account_number = ? AND role_name = ? AND expiration > ?',
+            (account_number, role_name, datetime.now(timezone.utc).timestamp())
+        ).fetchone()
+
+        if row is None:
+            ProfileStore.misses += 1
+            return None
+
+        try:
+            credentials = [_decrypt(value) for value in row[0:3]]
+
+        # Written without encryption or with another key; the credentials are acquired again and the row replaced
+        except ValueError as e:
+            logger.debug(f'Ignored the stored profile for {account_number}: {e}')
+            ProfileStore.misses += 1
+            return None
+
+        ProfileStore.hits += 1
+
+    from CloudHarvestPluginAws.credentials import Profile
+    profile = Profile(account_number=account_number, role_name=role_name)
+    profile.aws_access_key_id, profile.aws_secret_access_key, profile.aws_session_token = credentials
+    profile.expiration = datetime.fromtimestamp(row[3], timezone.utc)
+    profile.role_arn = row[4]
+    profile.account_alias = load_alias(account_number)
+
+    return profile
+
+
+def save_profile(profile) -> None:
+    """
+    Stores a profile's encrypted credentials in the database. Profiles sourced from the credentials file are not stored,
+    and nothing is stored when no key is configured.
+
+    Arguments
+        profile (Profile): The profile to store.
+    """
+    if profile.sourced_from_file or profile.expiration is None:
+        return
+
+    with ProfileStore.lock:
+        connection = _connect()
+
+        if connection is None or ProfileStore.fernet is None:
+            return
+
+        connection.execute(
+            'INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (profile.account_number,
+             profile.role_name,
+             _encrypt(profile.aws_access_key_id),
+             _encrypt(profile.aws_secret_access_key),
+             _encrypt(profile.aws_session_token),
+             profile.expiration.timestamp(),
+             profile.role_arn)
+        )
+        connection.commit()
+
+
+def load_alias(account_number: str) -> str or None:
+    """
+    Loads an unexpired account alias from the database.
+    """
+    from time import time
+
+    with ProfileStore.lock:
+        connection = _connect()
+
+        if connection is None:
+            return None
+
+        row = connection.execute('SELECT alias FROM aliases WHERE account_number = ? AND expires_at > ?',
+                                 (account_number, time())).fetchone()
+
+    return row[0] if row else None
+
+
+def save_alias(account_number: str, alias: str, ttl: float = None) -> None:
+    """
+    Stores an account alias in the database.
+    """
+    from time import time
+
+    with ProfileStore.lock:
+        connection = _connect()
+
+        if connection is None:
+            return
+
+        connection.execute('INSERT OR REPLACE INTO aliases VALUES (?, ?, ?)',
+                           (account_number, alias, time() + (ttl or alias_ttl())))
+        connection.commit()
+
+
+def alias_ttl() -> float:
+    from CloudHarvestCoreTasks.environment import Environment
+    return float(Environment.get('platforms.aws.account_alias_ttl') or DEFAULT_ALIAS_TTL)
+
+
+def purge_expired() -> None:
+    """
+    Removes expired credentials and aliases from the database.
+    """
+    from time import time
+
+    with ProfileStore.lock:
+        connection = _connect()
+
+        if connection is None:
+            return
+
+        connection.execute('DELETE FROM profiles WHERE expiration <= ?', (time(),))
+        connection.execute('DELETE FROM aliases WHERE expires_at <= ?', (time(),))
+        connection.commit()
+
+
+def _connect():
+    """
+    Opens the database when the disk tier is enabled. Must be called while holding ProfileStore.lock.
+    """
+    from CloudHarvestCoreTasks.environment import Environment
+    from os.path import abspath, expanduser
+
+    path = Environment.get('platforms.aws.profile_cache.path')
+
+    if not path:
+        return None
+
+    path = abspath(expanduser(path))
+
+    if ProfileStore.connection is not None and ProfileStore.path == path:
+        return ProfileStore.connection
+
+    if ProfileStore.error is not None:
+        raise ProfileStore.error
+
+    import sqlite3
+    from os import O_CREAT, O_WRONLY, close, open as os_open
+    from pathlib import Path
+
+    ProfileStore.fernet = None
+
+    key = Environment.get('platforms.aws.profile_cache.key')
+    if key:
+        try:
+            from cryptography.fernet import Fernet
+
+        except ImportError:
+            from CloudHarvestPluginAws.exceptions import HarvestAwsException
+
+            ProfileStore.error = HarvestAwsException('platforms.aws.profile_cache.key requires the `cryptography` package')
+            logger.error(str(ProfileStore.error))
+            raise ProfileStore.error
+
+        ProfileStore.fernet = Fernet(key)
+
+    else:
+        logger.warning('platforms.aws.profile_cache.key is not configured; credentials will not be stored in the profile cache')
+
+    # Create the file with permissions which only allow the current user to read it
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    close(os_open(path, O_CREAT | O_WRONLY, 0o600))
+
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute('CREATE TABLE IF NOT EXISTS profiles ('
+                       'account_number TEXT, role_name TEXT, aws_access_key_id TEXT, aws_secret_access_key TEXT, '
+                       'aws_session_token TEXT, expiration REAL, role_arn TEXT, PRIMARY KEY (account_number, role_name))')
+    connection.execute('CREATE TABLE IF NOT EXISTS aliases (account_number TEXT PRIMARY KEY, alias TEXT, expires_at REAL)')
+
+    # Without a key, any stored credentials were written in plain text
+    if ProfileStore.fernet is None:
+        connection.execute('DELETE FROM profiles')
+
+    connection.commit()
+
+    ProfileStore.connection = connection
+    ProfileStore.path = path
+
+    logger.debug(f'Opened profile cache {path}')
+
+    return connection
+
+
+def _encrypt(value: str or None) -> str or None:
+    if value is None or ProfileStore.fernet is None:
+        return value
+
+    return ProfileStore.fernet.encrypt(value.encode()).decode()
+
+
+def _decrypt(value: str or None) -> str or None:
+    if value is None or ProfileStore.fernet is None:
+        return value
+
+    from cryptography.fernet import InvalidToken
+
+    try:
+        return ProfileStore.fernet.decrypt(value.encode()).decode()
+
+    except InvalidToken:
+        raise ValueError('the value was not encrypted with platforms.aws.profile_cache.key')
@@ -0,0 +1,148 @@
+"""
+This library provides token bucket rate limiters which keep the requests made against an AWS API below its rate limit.
+One limiter is shared by every task which calls the same service in the same account and region, regardless of the
+thread it runs on.
+
+Configuration:
+- platforms.aws.rate_limits.<service>: The number of requests per second allowed for a service. When not provided,
+  the value from DEFAULT_RATE_LIMITS is used.
+"""
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+# Requests per second. These values are conservative interpretations of the published API rate limits and are shared by
+# every task in a process which targets the same service, account, and region.
+DEFAULT_RATE_LIMITS = {
+    'default': 10,
+    'dynamodb': 10,
+    'ec2': 20,
+    'iam': 10,
+    'kms': 20,
+    'lambda': 10,
+    'organizations': 5,
+    'resourcegroupstaggingapi': 5,
+    'rds': 10,
+    'route53': 5,
+    's3': 50,
+    'service-quotas': 5,
+    'sns': 10,
+    'sqs': 20,
+    'sts': 20,
+    'support': 5,
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        A thread safe token bucket. Tokens are added at `rate` per second up to `capacity`; each request consumes one.
+
+        Arguments
+            rate (float): The number of tokens added per second.
+            capacity (float, optional): The maximum number of tokens held by the bucket. Defaults to `rate`.
+        """
+        from time import monotonic
+
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Blocks until the requested tokens are available, then consumes them.
+
+        Arguments
+            tokens (float, optional): The number of tokens to consume. Defaults to 1.
+
+        Returns
+            float: The number of seconds spent waiting.
+        """
+        from time import sleep
+
+        waited = 0
+
+        while True:
+            delay = self._take(tokens)
+
+            if not delay:
+                return waited
+
+            sleep(delay)
+            waited += delay
+
+    async def acquire_async(self, tokens: float = 1) -> float:
+        """
+        The asyncio counterpart of `acquire()`. Other requests continue on the event loop while this one waits.
+        """
+        from asyncio import sleep
+
+        waited = 0
+
+        while True:
+            delay = self._take(tokens)
+
+            if not delay:
+                return waited
+
+            await sleep(delay)
+            waited += delay
+
+    def _take(self, tokens: float) -> float:
+        """
+        Consumes the tokens when they are available. Otherwise, returns the number of seconds until they will be.
+        """
+        from time import monotonic
+
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+
+            return (tokens - self.tokens) / self.rate
+
+
+class CachedRateLimiters:
+    limiters = {}
+    lock = Lock()
+
+
+def get_rate_limiter(service: str, region: str = None, account: str = None, rate: float = None) -> TokenBucket:
+    """
+    Retrieves the rate limiter for a service, region, and account, creating it if it does not exist yet.
+
+    Arguments
+        service (str): The AWS service.
+        region (str, optional): The AWS region. None is used for global services.
+        account (str, optional): The AWS account number.
+        rate (float, optional): Overrides the configured rate when the limiter is created.
+
+    Returns
+        TokenBucket: The shared rate limiter.
+    """
+    key = (service, region, account)
+
+    with CachedRateLimiters.lock:
+        limiter = CachedRateLimiters.limiters.get(key)
+
+        if limiter is None:
+            rate = rate or _configured_rate(service)
+            limiter = CachedRateLimiters.limiters[key] = TokenBucket(rate=rate)
+
+            logger.debug(f'created {rate}/s rate limiter for {service}:{region}:{account}')
+
+    return limiter
+
+
+def _configured_rate(service: str) -> float:
+    from CloudHarvestCoreTasks.environment import Environment
+    return float(Environment.get(f'platforms.aws.rate_limits.{service}')
+                 or DEFAULT_RATE_LIMITS.get(service)
+                 or DEFAULT_RATE_LIMITS['default'])
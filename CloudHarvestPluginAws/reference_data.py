@@ -0,0 +1,108 @@
+"""
+This library caches reference data: results which are the same for every account, such as EC2 instance types and RDS
+engine versions. The first account to request the data in a region (or partition) retrieves it; every other account
+receives a copy of the cached records until the entry expires. Each copy is a deep copy, so records and their nested
+values may be changed, such as by adding per-account metadata, without changing the cached data.
+
+Configuration:
+- platforms.aws.reference_data.ttl: The number of seconds reference data is cached. Defaults to 86400.
+- platforms.aws.reference_data.max_size: The maximum number of cached results. Defaults to 256.
+"""
+from functools import lru_cache
+from logging import getLogger
+from threading import Lock
+
+from CloudHarvestPluginAws.cache import TtlCache
+
+logger = getLogger('harvest')
+
+DEFAULT_REFERENCE_DATA_TTL = 86400
+DEFAULT_REFERENCE_DATA_MAX_SIZE = 256
+
+SCOPES = ('region', 'partition')
+
+
+class CachedReferenceData:
+    results = TtlCache(max_size=DEFAULT_REFERENCE_DATA_MAX_SIZE)
+    lock = Lock()
+    locks = {}      # key -> Lock, so each result is retrieved once
+
+
+def reference_key(scope: str, region: str, service: str, command: str, **options) -> tuple:
+    """
+    Builds the cache key for a result.
+
+    Arguments
+        scope (str): 'region' when the data differs between regions, or 'partition' when it is the same in every region
+            of a partition.
+        region (str): The AWS region.
+        service (str): The AWS service.
+        command (str): The command.
+        **options: Anything else which changes the result, such as the arguments, result path, filters, and fields.
+    """
+    if scope not in SCOPES:
+        raise ValueError(f'account_independent must be one of {SCOPES}, not {scope}')
+
+    location = partition_for_region(region) if scope == 'partition' else region
+
+    return location, service, command, repr(sorted(options.items()))
+
+
+def get_reference_data(key: tuple, loader):
+    """
+    Retrieves a cached result, calling `loader` when it is not cached. Concurrent callers with the same key wait for the
+    first caller instead of calling `loader` themselves.
+
+    Arguments
+        key (tuple): The key returned by `reference_key()`.
+        loader (callable): A function which takes no arguments and returns the result.
+
+    Returns
+        Any: A copy of the result.
+    """
+    from CloudHarvestCoreTasks.environment import Environment
+
+    result = CachedReferenceData.results.get(key)
+
+    if result is None:
+        with CachedReferenceData.lock:
+            lock = CachedReferenceData.locks.setdefault(key, Lock())
+
+        with lock:
+            result = CachedReferenceData.results.get(key, count=False)
+
+            if result is None:
+                result = loader()
+                CachedReferenceData.results.max_size = int(Environment.get('platforms.aws.reference_data.max_size') or DEFAULT_REFERENCE_DATA_MAX_SIZE)
+                CachedReferenceData.results.set(key, result, ttl=float(Environment.get('platforms.aws.reference_data.ttl') or DEFAULT_REFERENCE_DATA_TTL))
+
+            else:
+                logger.debug(f'reference data {key[1]}:{key[2]} in {key[0]} was retrieved by another task')
+
+    return copy_result(result)
+
+
+def copy_result(result):
+    """
+    Returns a deep copy of a result, so nested values such as tag lists are not shared with the cached result.
+    """
+    from copy import deepcopy
+
+    return deepcopy(result)
+
+
+@lru_cache
+def partition_for_region(region: str) -> str:
+    """
+    Returns the partition of a region, such as 'aws' or 'aws-cn'.
+    """
+    if not region:
+        return 'aws'
+
+    from boto3 import Session
+
+    try:
+        return Session().get_partition_for_region(region)
+
+    except Exception:
+        return 'aws'
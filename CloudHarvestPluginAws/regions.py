@@ -0,0 +1,249 @@
+"""
+This library keeps track of the regions which are worth collecting. Opt-in regions which are not enabled for an account
+reject every request with an authentication error, and some services are not offered in every region. Calling them
+wastes a connection setup and an error or timeout for every template in every collection cycle.
+
+- Each account's enabled regions are retrieved with `account:list_regions` (or `ec2:describe_regions` when the role is
+  not allowed to call the Account API) and cached.
+- Services which are not offered in a region are determined from the endpoint data shipped with botocore. Regions which
+  are newer than the installed endpoint data, and services without regional endpoints, are collected.
+- When a service could not be reached in a region for an account `unavailable_after` times in a row within
+  `unavailable_ttl` seconds, such as during a network outage, it is skipped for that account until the entry expires.
+  A single connection error, even after retries, does not skip the region.
+- Optionally, commands which returned no records for an account, service, and region are skipped until the entry expires.
+
+When the enabled regions cannot be determined, such as when the role may not call either API, every region is collected.
+The failed lookup is cached for `unavailable_ttl` seconds so it is not repeated by every task for the account.
+
+Configuration:
+- platforms.aws.regions.ttl: The number of seconds an account's enabled regions are cached. Defaults to 3600.
+- platforms.aws.regions.unavailable_ttl: The number of seconds an unreachable service and region is skipped for an
+  account, and the number of seconds before an account's enabled regions are retrieved again after they could not be
+  determined. Defaults to 300.
+- platforms.aws.regions.unavailable_after: The number of consecutive connection errors after which a service and region
+  is skipped for an account. Defaults to 3.
+- platforms.aws.regions.empty_ttl: The number of seconds a service and region which returned no records is skipped.
+  Disabled when not provided.
+"""
+from functools import lru_cache
+from logging import getLogger
+from threading import Lock
+
+from CloudHarvestPluginAws.cache import TtlCache
+
+logger = getLogger('harvest')
+
+DEFAULT_REGIONS_TTL = 3600.0
+DEFAULT_UNAVAILABLE_TTL = 300.0
+DEFAULT_UNAVAILABLE_AFTER = 3
+
+# Cached in place of the enabled regions when they could not be determined
+_UNKNOWN = object()
+
+# EC2 is offered in every region, so its endpoint data lists every region known to the installed botocore
+REFERENCE_SERVICE = 'ec2'
+
+# Error codes returned by regions which are not enabled for the account
+REGION_DISABLED_ERROR_CODES = {
+    'AuthFailure',
+    'InvalidClientTokenId',
+    'OptInRequired',
+    'UnrecognizedClientException',
+}
+
+
+class CachedRegions:
+    enabled = TtlCache()        # account -> frozenset of enabled regions, or _UNKNOWN
+    unavailable = TtlCache()    # (account, service, region) -> True
+    failures = TtlCache()       # (account, service, region) -> the number of consecutive connection errors
+    empty = TtlCache()          # (account, service, region, command) -> True
+
+    lock = Lock()
+    locks = {}                  # account -> Lock, so each account's regions are retrieved once
+
+
+def get_enabled_regions(account: str, credentials: dict = None) -> frozenset or None:
+    """
+    Retrieves the regions which are enabled for an account.
+
+    Arguments
+        account (str): The AWS account number.
+        credentials (dict, optional): Credentials for the account. When not provided, boto3 will attempt to use the default credentials.
+
+    Returns
+        frozenset or None: The enabled regions, or None when they cannot be determined.
+    """
+    regions = CachedRegions.enabled.get(account)
+
+    if regions is None:
+        with CachedRegions.lock:
+            lock = CachedRegions.locks.setdefault(account, Lock())
+
+        with lock:
+            # Another thread may have retrieved the regions while this one was waiting
+            regions = CachedRegions.enabled.get(account, count=False)
+
+            if regions is None:
+                regions = _list_enabled_regions(account=account, credentials=credentials)
+
+                # A failed lookup is retried sooner than the regions are refreshed, but not by every task
+                if regions is None:
+                    regions = _UNKNOWN
+                    CachedRegions.enabled.set(account, regions, ttl=_setting('unavailable_ttl', DEFAULT_UNAVAILABLE_TTL))
+
+                else:
+                    CachedRegions.enabled.set(account, regions, ttl=_setting('ttl', DEFAULT_REGIONS_TTL))
+
+    return None if regions is _UNKNOWN else regions
+
+
+def _list_enabled_regions(account: str, credentials: dict = None) -> frozenset or None:
+    from CloudHarvestPluginAws.tasks.aws import query_aws
+
+    try:
+        result = query_aws(service='account',
+                           command='list_regions',
+                           arguments={'RegionOptStatusContains': ['ENABLED', 'ENABLED_BY_DEFAULT']},
+                           credentials=credentials,
+                           result_path='Regions')
+
+        regions = frozenset(region['RegionName'] for region in result or [])
+
+    except Exception as account_error:
+        logger.debug(f'{account}: account:list_regions failed; trying ec2:describe_regions: {account_error}')
+
+        try:
+            # Without AllRegions, only the regions which are enabled for the account are returned
+            result = query_aws(service='ec2',
+                               command='describe_regions',
+                               arguments={},
+                               credentials=credentials,
+                               region='us-east-1',
+                               result_path='Regions')
+
+            regions = frozenset(region['RegionName'] for region in result or [])
+
+        except Exception as ec2_error:
+            logger.warning(f'{account}: unable to determine the enabled regions; all regions will be collected: {ec2_error}')
+            return None
+
+    return regions
+
+
+def should_collect(account: str, service: str, region: str, command: str = None, credentials: dict = None) -> bool:
+    """
+    Determines whether a service should be collected in a region.
+
+    Arguments
+        account (str): The AWS account number.
+        service (str): The AWS service.
+        region (str): The AWS region. Global services (None) are always collected.
+        command (str, optional): The command. Commands which recently returned no records are skipped when `platforms.aws.regions.empty_ttl` is configured.
+        credentials (dict, optional): Credentials for the account, used to retrieve its enabled regions.
+
+    Returns
+        bool: False when the region is not enabled for the account or the service is known to be unavailable.
+    """
+    if not region:
+        return True
+
+    if not is_offered(service=service, region=region):
+        return False
+
+    if (account, service, region) in CachedRegions.unavailable or (account, service, region, command) in CachedRegions.empty:
+        return False
+
+    enabled = get_enabled_regions(account=account, credentials=credentials)
+
+    return enabled is None or region in enabled
+
+
+def is_offered(service: str, region: str) -> bool:
+    """
+    Determines whether a service is offered in a region according to the endpoint data shipped with botocore. Regions which
+    botocore does not know, and services without regional endpoints in the region's partition, are assumed to be offered.
+    """
+    partition = next((partition for partition, regions in partition_regions(REFERENCE_SERVICE).items() if region in regions), None)
+    offered = partition_regions(service).get(partition)
+
+    return not offered or region in offered
+
+
+@lru_cache(maxsize=None)
+def partition_regions(service: str) -> dict:
+    """
+    Returns the regions in which a service has a regional endpoint, keyed by partition. Partitions in which the service has
+    no regional endpoints, such as for global services, are omitted.
+    """
+    from botocore.session import get_session
+
+    session = get_session()
+    result = {}
+
+    try:
+        for partition in session.get_available_partitions():
+            regions = frozenset(session.get_available_regions(service, partition_name=partition))
+
+            if regions:
+                result[partition] = regions
+
+    except Exception as e:
+        logger.debug(f'unable to read the endpoint data of {service}: {e}')
+
+    return result
+
+
+def prune_regions(account: str, service: str, regions: list, credentials: dict = None) -> list:
+    """
+    Returns the regions in which a service should be collected for an account.
+    """
+    return [region for region in regions if should_collect(account=account, service=service, region=region, credentials=credentials)]
+
+
+def record_error(account: str, service: str, region: str, exception: Exception) -> None:
+    """
+    Records an error which shows that a service cannot be reached in a region or that a region may have been disabled.
+    """
+    from botocore.exceptions import ClientError, EndpointConnectionError
+
+    if not region:
+        return
+
+    # call_with_retries raises a new exception when the retries are exhausted
+    if not isinstance(exception, (ClientError, EndpointConnectionError)) and exception.__cause__ is not None:
+        exception = exception.__cause__
+
+    if isinstance(exception, EndpointConnectionError):
+        key = (account, service, region)
+        ttl = _setting('unavailable_ttl', DEFAULT_UNAVAILABLE_TTL)
+
+        with CachedRegions.lock:
+            failures = CachedRegions.failures.get(key, 0, count=False) + 1
+            CachedRegions.failures.set(key, failures, ttl=ttl)
+
+        if failures >= _setting('unavailable_after', DEFAULT_UNAVAILABLE_AFTER):
+            logger.info(f'{account}: {service} could not be reached in {region} {failures} times; it will be skipped for {ttl} seconds')
+            CachedRegions.unavailable.set(key, True, ttl=ttl)
+
+    # These errors are also returned for expired credentials, so the enabled regions are retrieved again rather than
+    # assuming the region was disabled
+    elif isinstance(exception, ClientError) and exception.response.get('Error', {}).get('Code') in REGION_DISABLED_ERROR_CODES:
+        CachedRegions.enabled.pop(account)
+
+
+def record_result(account: str, service: str, region: str, command: str, result) -> None:
+    """
+    Records a command which succeeded, which resets the connection errors of the service and region, and a command which
+    returned no records, when `platforms.aws.regions.empty_ttl` is configured.
+    """
+    CachedRegions.failures.pop((account, service, region))
+
+    ttl = _setting('empty_ttl', 0.0)
+
+    if ttl and region and not result:
+        CachedRegions.empty.set((account, service, region, command), True, ttl=ttl)
+
+
+def _setting(name: str, default):
+    from CloudHarvestCoreTasks.environment import Environment
+    return type(default)(Environment.get(f'platforms.aws.regions.{name}') or default)
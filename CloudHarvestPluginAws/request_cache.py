@@ -0,0 +1,154 @@
+"""
+This library shares the results of identical read-only requests. Several templates and reports issue the same request
+for the same account and region, such as `describe_db_instances` for RDS instances and the RDS log reports. When the
+cache is enabled, `query_aws` and `async_query_aws` return the cached result of an identical request made within the TTL, and concurrent
+identical requests wait for the first one instead of calling the API themselves.
+
+Requests are identified by a hash of the credentials identity, service, region, command, arguments, and result options.
+Each caller receives a deep copy of the result, so it may change the records and their nested values.
+
+Configuration:
+- platforms.aws.request_cache.ttl: The number of seconds a result is cached. The cache is disabled when not provided.
+- platforms.aws.request_cache.max_size: The maximum number of cached results. Defaults to 1024.
+"""
+from logging import getLogger
+from threading import Lock
+
+from CloudHarvestPluginAws.cache import TtlCache
+
+logger = getLogger('harvest')
+
+DEFAULT_MAX_SIZE = 1024
+
+# Only commands with these prefixes are cached
+READ_ONLY_PREFIXES = ('describe_', 'get_', 'list_')
+
+# Read-only commands whose results are never cached
+NEVER_CACHED = {
+    'get_federation_token',
+    'get_parameter',
+    'get_parameters',
+    'get_parameters_by_path',
+    'get_secret_value',
+    'get_session_token',
+}
+
+_MISSING = object()
+
+
+class CachedRequests:
+    results = TtlCache(max_size=DEFAULT_MAX_SIZE)
+    lock = Lock()
+    locks = {}      # key -> Lock for requests which are in flight
+    tasks = {}      # (event loop, key) -> asyncio.Task for requests which are in flight on an event loop
+
+
+def request_cache_ttl() -> float:
+    from CloudHarvestCoreTasks.environment import Environment
+    return float(Environment.get('platforms.aws.request_cache.ttl') or 0)
+
+
+def is_cacheable(command: str) -> bool:
+    return command.startswith(READ_ONLY_PREFIXES) and command not in NEVER_CACHED
+
+
+def request_key(credentials: dict, service: str, region: str, command: str, arguments: dict, **options) -> str:
+    """
+    Returns a canonical hash of a request.
+
+    Arguments
+        credentials (dict): The AWS credentials. Only their identity is used.
+        service (str): The AWS service.
+        region (str): The AWS region.
+        command (str): The command.
+        arguments (dict): The command arguments.
+        **options: Anything else which changes the result, such as the result path, filters, and fields.
+    """
+    from hashlib import sha256
+    from json import dumps
+    from CloudHarvestPluginAws.clients import credentials_identity
+
+    return sha256(dumps([credentials_identity(credentials), service, region, command, arguments, options],
+                        sort_keys=True,
+                        default=str).encode()).hexdigest()
+
+
+def cached_request(key: str, loader, ttl: float):
+    """
+    Returns the cached result of a request, calling `loader` when it is not cached.
+
+    Arguments
+        key (str): The key returned by `request_key()`.
+        loader (callable): A function which takes no arguments and executes the request.
+        ttl (float): The number of seconds the result is cached.
+
+    Returns
+        Any: A copy of the result.
+    """
+    from CloudHarvestCoreTasks.environment import Environment
+    from CloudHarvestPluginAws.reference_data import copy_result
+
+    result = CachedRequests.results.get(key, _MISSING)
+
+    if result is _MISSING:
+        with CachedRequests.lock:
+            lock = CachedRequests.locks.setdefault(key, Lock())
+
+        try:
+            with lock:
+                # An identical request may have completed while this one was waiting
+                result = CachedRequests.results.get(key, _MISSING, count=False)
+
+                if result is _MISSING:
+                    result = loader()
+
+                    CachedRequests.results.max_size = int(Environment.get('platforms.aws.request_cache.max_size') or DEFAULT_MAX_SIZE)
+                    CachedRequests.results.set(key, result, ttl=ttl)
+
+        finally:
+            with CachedRequests.lock:
+                if CachedRequests.locks.get(key) is lock and not lock.locked():
+                    del CachedRequests.locks[key]
+
+    return copy_result(result)
+
+
+async def async_cached_request(key: str, loader, ttl: float):
+    """
+    The asyncio counterpart of `cached_request`. `loader` is a coroutine function. Identical requests on the same event
+    loop await the first request instead of sending their own.
+
+    Returns
+        Any: A copy of the result.
+    """
+    from asyncio import get_running_loop, shield
+    from CloudHarvestCoreTasks.environment import Environment
+    from CloudHarvestPluginAws.reference_data import copy_result
+
+    result = CachedRequests.results.get(key, _MISSING)
+
+    if result is _MISSING:
+        loop = get_running_loop()
+
+        with CachedRequests.lock:
+            task = CachedRequests.tasks.get((loop, key))
+            loading = task is None
+
+            if loading:
+                task = CachedRequests.tasks[(loop, key)] = loop.create_task(loader())
+                task.add_done_callback(lambda done: CachedRequests.tasks.pop((loop, key), None))
+
+        result = await shield(task)
+
+        if loading:
+            CachedRequests.results.max_size = int(Environment.get('platforms.aws.request_cache.max_size') or DEFAULT_MAX_SIZE)
+            CachedRequests.results.set(key, result, ttl=ttl)
+
+    return copy_result(result)
+
+
+def request_cache_stats() -> dict:
+    """
+    Returns the size of the request cache and its hit, miss, and eviction counters.
+    """
+    return CachedRequests.results.stats()
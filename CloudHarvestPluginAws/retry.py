@@ -0,0 +1,323 @@
+"""
+This library decides which AWS errors may be retried and how long to wait between attempts. Backoff uses decorrelated
+jitter so concurrent tasks which were throttled together do not retry in lockstep. Every account and region shares a
+retry budget; when a region is throttling heavily the budget runs out and tasks fail fast instead of piling more retries
+onto the API.
+
+Configuration:
+- platforms.aws.retries.base_delay: The minimum number of seconds to wait before a retry. Defaults to 1.
+- platforms.aws.retries.max_delay: The maximum number of seconds to wait before a retry. Defaults to 20.
+- platforms.aws.retries.budget: The retry budget capacity per account and region. Defaults to 500.
+"""
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+# Error codes returned when a request exceeds an API's rate limit
+THROTTLE_ERROR_CODES = {
+    'BandwidthLimitExceeded',
+    'EC2ThrottledException',
+    'LimitExceededException',
+    'PriorRequestNotComplete',
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'SlowDown',
+    'ThrottledException',
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'TransactionInProgressException',
+}
+
+# Error codes returned when AWS failed to process an otherwise valid request
+TRANSIENT_ERROR_CODES = {
+    'IDPCommunicationError',
+    'InternalError',
+    'InternalFailure',
+    'InternalServerError',
+    'InternalServiceError',
+    'InternalServiceException',
+    'RequestTimeout',
+    'RequestTimeoutException',
+    'ServiceUnavailable',
+    'ServiceUnavailableException',
+    'Unavailable',
+}
+
+TRANSIENT_STATUS_CODES = {500, 502, 503, 504}
+
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 20.0
+DEFAULT_BUDGET = 500
+
+# Retry budget costs, modeled on the AWS SDK 'standard' retry mode
+RETRY_COST = 5
+NO_RETRY_INCREMENT = 1
+
+
+def classify_error(exception: Exception) -> str or None:
+    """
+    Determines whether an exception may be retried.
+
+    Arguments
+        exception (Exception): The exception raised by a boto3 call.
+
+    Returns
+        str or None: 'throttle' or 'transient' when the request may be retried, otherwise None.
+    """
+    from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+    if isinstance(exception, ClientError):
+        error_code = exception.response.get('Error', {}).get('Code') or ''
+        status_code = exception.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+
+        if error_code in THROTTLE_ERROR_CODES or status_code == 429:
+            return 'throttle'
+
+        if error_code in TRANSIENT_ERROR_CODES or status_code in TRANSIENT_STATUS_CODES:
+            return 'transient'
+
+    # Connection resets, connection timeouts, and read timeouts
+    elif isinstance(exception, (ConnectionError, HTTPClientError)):
+        return 'transient'
+
+    return None
+
+
+def decorrelated_jitter(previous: float, base: float = DEFAULT_BASE_DELAY, cap: float = DEFAULT_MAX_DELAY) -> float:
+    """
+    Returns the next backoff delay using decorrelated jitter.
+
+    Arguments
+        previous (float): The previous delay. Use `base` for the first retry.
+        base (float, optional): The minimum delay.
+        cap (float, optional): The maximum delay.
+
+    Returns
+        float: The number of seconds to wait.
+    """
+    from random import uniform
+    return min(cap, uniform(base, max(base, previous) * 3))
+
+
+class RetryBudget:
+    def __init__(self, capacity: int = DEFAULT_BUDGET):
+        """
+        A pool of retry tokens shared by every request to an account and region. Each retry costs RETRY_COST tokens and
+        each successful request returns tokens to the pool.
+
+        Arguments
+            capacity (int, optional): The maximum number of tokens.
+        """
+        self.capacity = capacity
+        self.tokens = capacity
+        self.lock = Lock()
+
+    def acquire(self, cost: int = RETRY_COST) -> bool:
+        """
+        Withdraws tokens for a retry.
+
+        Returns
+            bool: False when the budget is exhausted and the request should not be retried.
+        """
+        with self.lock:
+            if self.tokens < cost:
+                return False
+
+            self.tokens -= cost
+            return True
+
+    def release(self, amount: int = NO_RETRY_INCREMENT) -> None:
+        """
+        Returns tokens to the budget after a successful request.
+        """
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class CachedRetryBudgets:
+    budgets = {}
+    lock = Lock()
+
+
+def get_retry_budget(account: str = None, region: str = None) -> RetryBudget:
+    """
+    Retrieves the retry budget for an account and region, creating it if it does not exist yet.
+
+    Arguments
+        account (str, optional): The AWS account number or credentials identity.
+        region (str, optional): The AWS region. None is used for global services.
+
+    Returns
+        RetryBudget: The shared retry budget.
+    """
+    key = (account, region)
+
+    with CachedRetryBudgets.lock:
+        budget = CachedRetryBudgets.budgets.get(key)
+
+        if budget is None:
+            budget = CachedRetryBudgets.budgets[key] = RetryBudget(capacity=_setting('budget', DEFAULT_BUDGET))
+
+    return budget
+
+
+class RetryStats:
+    def __init__(self):
+        """
+        Counts the retries performed on behalf of a task. Tasks which fan out share a single instance across threads.
+        """
+        self.retries = 0
+        self.throttles = 0
+        self.sleep_seconds = 0.0
+        self.resumes = 0
+        self.lock = Lock()
+
+    def record_retry(self, kind: str, delay: float) -> None:
+        with self.lock:
+            self.retries += 1
+            self.sleep_seconds += delay
+
+            if kind == 'throttle':
+                self.throttles += 1
+
+    def record_resume(self) -> None:
+        with self.lock:
+            self.resumes += 1
+
+    def as_dict(self) -> dict:
+        return {
+            'retries': self.retries,
+            'throttles': self.throttles,
+            'sleep_seconds': round(self.sleep_seconds, 3),
+            'resumes': self.resumes
+        }
+
+
+def call_with_retries(function,
+                      max_retries: int = 10,
+                      retry_budget: RetryBudget = None,
+                      rate_limiter=None,
+                      stats: RetryStats = None,
+                      call=None):
+    """
+    Calls `function` until it succeeds, retrying throttling and transient errors with decorrelated jitter.
+
+    Arguments
+        function (callable): A function which takes no arguments and performs one AWS request.
+        max_retries (int, optional): The maximum number of retries. Defaults to 10.
+        retry_budget (RetryBudget, optional): The budget retries are withdrawn from.
+        rate_limiter (TokenBucket, optional): A rate limiter which is acquired before each attempt.
+        stats (RetryStats, optional): Receives the retry counts.
+        call (telemetry.Call, optional): Receives the retry counts of the call being measured.
+
+    Returns
+        Any: The result of `function`.
+    """
+    from time import sleep
+
+    state = _RetryState(max_retries=max_retries, retry_budget=retry_budget, stats=stats, call=call)
+
+    while True:
+        if rate_limiter:
+            rate_limiter.acquire()
+
+        try:
+            result = function()
+
+        except Exception as e:
+            sleep(state.backoff(e))
+
+        else:
+            state.succeeded()
+            return result
+
+
+async def async_call_with_retries(function,
+                                  max_retries: int = 10,
+                                  retry_budget: RetryBudget = None,
+                                  rate_limiter=None,
+                                  stats: RetryStats = None,
+                                  call=None):
+    """
+    The asyncio counterpart of `call_with_retries`. `function` is a coroutine function which takes no arguments and
+    performs one AWS request. Backoff delays and rate limiter waits are awaited, so other requests continue on the event
+    loop while this one waits.
+
+    Returns
+        Any: The result of `function`.
+    """
+    from asyncio import sleep
+
+    state = _RetryState(max_retries=max_retries, retry_budget=retry_budget, stats=stats, call=call)
+
+    while True:
+        if rate_limiter:
+            await rate_limiter.acquire_async()
+
+        try:
+            result = await function()
+
+        except Exception as e:
+            await sleep(state.backoff(e))
+
+        else:
+            state.succeeded()
+            return result
+
+
+class _RetryState:
+    def __init__(self, max_retries: int, retry_budget: RetryBudget = None, stats: RetryStats = None, call=None):
+        """
+        The retry decisions of a single `call_with_retries` or `async_call_with_retries` call.
+        """
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget
+        self.stats = stats
+        self.call = call
+
+        self.base = _setting('base_delay', DEFAULT_BASE_DELAY)
+        self.cap = _setting('max_delay', DEFAULT_MAX_DELAY)
+        self.delay = self.base
+        self.retries = 0
+
+    def backoff(self, exception: Exception) -> float:
+        """
+        Returns the number of seconds to wait before retrying, or raises when the request may not be retried.
+        """
+        kind = classify_error(exception)
+
+        if kind is None:
+            raise exception
+
+        if self.retries >= self.max_retries:
+            raise Exception('Max retries exceeded') from exception
+
+        if self.retry_budget and not self.retry_budget.acquire():
+            logger.warning(f'retry budget exhausted: {exception}')
+            raise exception
+
+        self.retries += 1
+        self.delay = decorrelated_jitter(self.delay, base=self.base, cap=self.cap)
+
+        if self.stats:
+            self.stats.record_retry(kind=kind, delay=self.delay)
+
+        if self.call:
+            self.call.record_retry(kind=kind, delay=self.delay)
+
+        logger.debug(f'retry {self.retries}/{self.max_retries} in {self.delay:.2f}s after {kind}: {exception}')
+
+        return self.delay
+
+    def succeeded(self) -> None:
+        if self.retry_budget:
+            self.retry_budget.release(RETRY_COST if self.retries else NO_RETRY_INCREMENT)
+
+
+def _setting(name: str, default):
+    from CloudHarvestCoreTasks.environment import Environment
+    return type(default)(Environment.get(f'platforms.aws.retries.{name}') or default)
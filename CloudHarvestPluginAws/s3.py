@@ -0,0 +1,292 @@
+"""
+This library adds per-bucket details, such as encryption, versioning, and lifecycle rules, to the buckets returned by
+`list_buckets`. S3 bucket APIs must be called in the bucket's home region; a call made in any other region pays for a
+redirect or a `PermanentRedirect` error and a retry, for every bucket and every detail.
+
+- Each bucket's region is taken from the `BucketRegion` key returned by `list_buckets` or retrieved with
+  `get_bucket_location`, and cached.
+- Buckets are grouped by region so each region's calls share one pooled client and one rate limiter.
+- The calls run concurrently under the rate limit of each region.
+- Errors which only mean a bucket has no such configuration, such as `NoSuchBucketPolicy`, are returned as empty results.
+- When a bucket moved to another region since its region was cached, the call is made again in the new region.
+- Any other error returned for one bucket, such as `AccessDenied` from a bucket policy which denies every caller, does
+  not fail the collection. The detail's empty value is stored and the error code is recorded in the bucket's `Errors`.
+
+Configuration:
+- platforms.aws.s3.region_ttl: The number of seconds a bucket's region is cached. Defaults to 86400.
+"""
+from logging import getLogger
+
+from CloudHarvestPluginAws.cache import TtlCache
+
+logger = getLogger('harvest')
+
+DEFAULT_REGION_TTL = 86400.0
+
+# The region of buckets whose LocationConstraint is empty
+DEFAULT_BUCKET_REGION = 'us-east-1'
+
+# Error codes which mean the bucket does not have the requested configuration
+MISSING_CONFIGURATION_ERROR_CODES = {
+    'NoSuchBucketPolicy',
+    'NoSuchCORSConfiguration',
+    'NoSuchLifecycleConfiguration',
+    'NoSuchPublicAccessBlockConfiguration',
+    'NoSuchTagSet',
+    'NoSuchWebsiteConfiguration',
+    'ObjectLockConfigurationNotFoundError',
+    'OwnershipControlsNotFoundError',
+    'ReplicationConfigurationNotFoundError',
+    'ServerSideEncryptionConfigurationNotFoundError',
+}
+
+# Error codes returned when a request is made in a region other than the bucket's region
+WRONG_REGION_ERROR_CODES = {'AuthorizationHeaderMalformed', 'IllegalLocationConstraintException', 'PermanentRedirect'}
+
+# The details which may be added to each bucket. `empty` is stored when the bucket does not have the configuration.
+DETAILS = {
+    'Encryption': {'command': 'get_bucket_encryption', 'result_path': 'ServerSideEncryptionConfiguration.Rules', 'empty': []},
+    'Lifecycle': {'command': 'get_bucket_lifecycle_configuration', 'result_path': 'Rules', 'empty': []},
+    'Logging': {'command': 'get_bucket_logging', 'result_path': 'LoggingEnabled', 'empty': None},
+    'OwnershipControls': {'command': 'get_bucket_ownership_controls', 'result_path': 'OwnershipControls.Rules', 'empty': []},
+    'PolicyStatus': {'command': 'get_bucket_policy_status', 'result_path': 'PolicyStatus', 'empty': None},
+    'PublicAccessBlock': {'command': 'get_public_access_block', 'result_path': 'PublicAccessBlockConfiguration', 'empty': None},
+    'Tags': {'command': 'get_bucket_tagging', 'result_path': 'TagSet', 'empty': []},
+    'Versioning': {'command': 'get_bucket_versioning', 'result_path': ['Status', 'MFADelete'], 'empty': None},
+}
+
+DEFAULT_DETAILS = ('Encryption', 'Versioning', 'PolicyStatus', 'PublicAccessBlock', 'Lifecycle')
+
+
+class CachedBucketRegions:
+    regions = TtlCache()        # (account, bucket) -> region
+
+
+def bucket_region(location_constraint: str or None) -> str:
+    """
+    Converts a `get_bucket_location` LocationConstraint to a region name.
+    """
+    if not location_constraint:
+        return DEFAULT_BUCKET_REGION
+
+    # Buckets created in eu-west-1 before regional names were introduced
+    if location_constraint == 'EU':
+        return 'eu-west-1'
+
+    return location_constraint
+
+
+def get_bucket_regions(buckets: list, account: str = None, credentials: dict = None, max_workers: int = 8, **kwargs) -> dict:
+    """
+    Retrieves the region of each bucket.
+
+    Arguments
+        buckets (list): The `list_buckets` records. The `BucketRegion` key is used when present.
+        account (str, optional): The AWS account number, which the cached regions are keyed by.
+        credentials (dict, optional): The AWS credentials.
+        max_workers (int, optional): The maximum number of concurrent `get_bucket_location` calls. Defaults to 8.
+
+        All other arguments, such as `max_retries` and `retry_budget`, are passed to `query_aws`.
+
+    Returns
+        dict: The region of each bucket name. Buckets whose location could not be retrieved are omitted and the error code
+        is recorded under the bucket's `Errors`.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from CloudHarvestPluginAws.rate_limits import get_rate_limiter
+    from CloudHarvestPluginAws.tasks.aws import query_aws
+    from CloudHarvestPluginAws.telemetry import bind
+
+    ttl = _setting('region_ttl', DEFAULT_REGION_TTL)
+    regions = {}
+    unknown = []
+
+    for bucket in buckets:
+        name = bucket['Name']
+        region = bucket.get('BucketRegion') or CachedBucketRegions.regions.get((account, name))
+
+        if region:
+            regions[name] = region
+            CachedBucketRegions.regions.set((account, name), region, ttl=ttl)
+
+        else:
+            unknown.append(name)
+
+    # get_bucket_location may be called from any region
+    rate_limiter = get_rate_limiter(service='s3', region=DEFAULT_BUCKET_REGION, account=account)
+
+    def locate(name: str) -> tuple:
+        from botocore.exceptions import ClientError
+
+        try:
+            location = query_aws(service='s3',
+                                 command='get_bucket_location',
+                                 arguments={'Bucket': name},
+                                 region=DEFAULT_BUCKET_REGION,
+                                 result_path='LocationConstraint',
+                                 credentials=credentials,
+                                 rate_limiter=rate_limiter,
+                                 **kwargs)
+
+        except ClientError as e:
+            return name, None, _error_code(e)
+
+        return name, bucket_region(location), None
+
+    if unknown:
+        by_name = {bucket['Name']: bucket for bucket in buckets}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unknown)))) as executor:
+            for name, region, error in executor.map(bind(locate), unknown):
+                if error:
+                    logger.warning(f'{account}: unable to locate the S3 bucket {name}: {error}')
+                    by_name[name].setdefault('Errors', {})['BucketRegion'] = error
+                    continue
+
+                regions[name] = region
+                CachedBucketRegions.regions.set((account, name), region, ttl=ttl)
+
+    return regions
+
+
+def get_bucket_detail(bucket: str, region: str, detail: dict, account: str = None, credentials: dict = None, rate_limiter=None, **kwargs):
+    """
+    Retrieves one detail of a bucket in the bucket's region.
+
+    Arguments
+        bucket (str): The bucket name.
+        region (str): The bucket's region.
+        detail (dict): The command, result_path, and empty value of the detail, such as `DETAILS['Encryption']`.
+        account (str, optional): The AWS account number.
+        credentials (dict, optional): The AWS credentials.
+        rate_limiter (TokenBucket, optional): The rate limiter of the bucket's region.
+
+        All other arguments, such as `max_retries` and `retry_budget`, are passed to `query_aws`.
+
+    Returns
+        Any: The detail, or its empty value when the bucket does not have the configuration.
+    """
+    from botocore.exceptions import ClientError
+    from CloudHarvestPluginAws.rate_limits import get_rate_limiter
+    from CloudHarvestPluginAws.tasks.aws import query_aws
+
+    for attempt in range(2):
+        try:
+            return query_aws(service='s3',
+                             command=detail['command'],
+                             arguments={'Bucket': bucket} | (detail.get('arguments') or {}),
+                             region=region,
+                             result_path=detail.get('result_path'),
+                             credentials=credentials,
+                             rate_limiter=rate_limiter,
+                             **kwargs)
+
+        except ClientError as e:
+            code = _error_code(e)
+
+            if code in MISSING_CONFIGURATION_ERROR_CODES:
+                return detail.get('empty')
+
+            moved_to = e.response.get('ResponseMetadata', {}).get('HTTPHeaders', {}).get('x-amz-bucket-region')
+
+            # The bucket was recreated in another region since its region was cached
+            if attempt == 0 and code in WRONG_REGION_ERROR_CODES and moved_to and moved_to != region:
+                logger.debug(f'{bucket} moved from {region} to {moved_to}')
+
+                CachedBucketRegions.regions.set((account, bucket), moved_to, ttl=_setting('region_ttl', DEFAULT_REGION_TTL))
+                region = moved_to
+                rate_limiter = get_rate_limiter(service='s3', region=region, account=account)
+                continue
+
+            raise
+
+
+def enrich_buckets(buckets: list,
+                   details: list or dict = None,
+                   account: str = None,
+                   credentials: dict = None,
+                   max_workers: int = 8,
+                   rate_limit: float = None,
+                   **kwargs) -> list:
+    """
+    Adds per-bucket details to `list_buckets` records in place. Each bucket's `BucketRegion` is set as well. When a detail
+    cannot be retrieved for a bucket, such as when its policy denies access, its empty value is stored and the error code is
+    recorded under the bucket's `Errors` key, keyed by the detail name.
+
+    Arguments
+        buckets (list): The `list_buckets` records.
+        details (list or dict, optional): The names of `DETAILS` to add, or a dictionary of names and `DETAILS`-style specifications. Defaults to `DEFAULT_DETAILS`.
+        account (str, optional): The AWS account number.
+        credentials (dict, optional): The AWS credentials.
+        max_workers (int, optional): The maximum number of concurrent calls. Defaults to 8.
+        rate_limit (float, optional): Requests per second allowed in each region. Defaults to `platforms.aws.rate_limits.s3`.
+
+        All other arguments, such as `max_retries` and `retry_budget`, are passed to `query_aws`.
+
+    Returns
+        list: The buckets.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from CloudHarvestPluginAws.exceptions import HarvestAwsException
+    from CloudHarvestPluginAws.rate_limits import get_rate_limiter
+    from CloudHarvestPluginAws.telemetry import bind
+
+    if not isinstance(details, dict):
+        unknown = [name for name in details or DEFAULT_DETAILS if name not in DETAILS]
+
+        if unknown:
+            raise HarvestAwsException(f'Unknown S3 bucket details {unknown}; expected one of {sorted(DETAILS)}')
+
+        details = {name: DETAILS[name] for name in details or DEFAULT_DETAILS}
+
+    buckets = [bucket for bucket in buckets if isinstance(bucket, dict) and bucket.get('Name')]
+    regions = get_bucket_regions(buckets, account=account, credentials=credentials, max_workers=max_workers, **kwargs)
+
+    # Calls are submitted region by region so each region's pooled client and rate limiter are used together
+    by_region = {}
+    for bucket in buckets:
+        # Buckets which could not be located only keep their list_buckets keys
+        if bucket['Name'] not in regions:
+            continue
+
+        bucket['BucketRegion'] = regions[bucket['Name']]
+        by_region.setdefault(bucket['BucketRegion'], []).append(bucket)
+
+    calls = [
+        (bucket, name, detail, region, get_rate_limiter(service='s3', region=region, account=account, rate=rate_limit))
+        for region, region_buckets in by_region.items()
+        for bucket in region_buckets
+        for name, detail in details.items()
+    ]
+
+    def call(arguments: tuple) -> tuple:
+        from botocore.exceptions import ClientError
+
+        bucket, name, detail, region, rate_limiter = arguments
+
+        try:
+            return get_bucket_detail(bucket['Name'], region=region, detail=detail, account=account, credentials=credentials,
+                                     rate_limiter=rate_limiter, **kwargs), None
+
+        except ClientError as e:
+            return detail.get('empty'), _error_code(e)
+
+    if calls:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calls)))) as executor:
+            for (bucket, name, *_), (value, error) in zip(calls, executor.map(bind(call), calls)):
+                bucket[name] = value
+
+                if error:
+                    logger.warning(f'{account}: unable to retrieve {name} of the S3 bucket {bucket["Name"]}: {error}')
+                    bucket.setdefault('Errors', {})[name] = error
+
+    return buckets
+
+
+def _error_code(exception) -> str:
+    return exception.response.get('Error', {}).get('Code') or str(exception)
+
+
+def _setting(name: str, default):
+    from CloudHarvestCoreTasks.environment import Environment
+    return type(default)(Environment.get(f'platforms.aws.s3.{name}') or default)
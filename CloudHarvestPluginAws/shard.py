@@ -0,0 +1,159 @@
+"""
+This library splits a very large listing into shards which are enumerated concurrently. Pagination tokens force a single
+listing to be retrieved one page at a time; shards are independent listings, each with its own pagination.
+
+Strategies:
+- time: Splits the range between two time arguments, such as `StartTime` and `EndTime`, into windows.
+- values: Runs the command once per value of a parameter or filter, such as `SnapshotType`. The values must cover every
+  record the command would otherwise return.
+- record_names: Splits a Route 53 `list_resource_record_sets` listing at record name prefixes. Each boundary is located
+  with a single-record request, so shards split exactly where Route 53's own ordering places the boundary.
+
+The results of every shard are merged in shard order and records which appear in more than one shard are removed.
+"""
+from logging import getLogger
+
+logger = getLogger('harvest')
+
+DEFAULT_WINDOWS = 4
+DEFAULT_RECORD_NAME_PREFIXES = ['d', 'h', 'l', 'p', 't']
+DEFAULT_MIN_WINDOW_SECONDS = 3600
+STRATEGIES = ('time', 'values', 'record_names')
+
+
+class Shard:
+    def __init__(self, arguments: dict = None, filters: dict = None, stop: dict = None):
+        """
+        One independent listing.
+
+        Arguments
+            arguments (dict, optional): Arguments which replace the command arguments.
+            filters (dict, optional): Filters added to the task's filters.
+            stop (dict, optional): The first record of the next shard. The listing stops when it is reached.
+        """
+        self.arguments = arguments or {}
+        self.filters = filters or {}
+        self.stop = stop
+
+
+def time_shards(arguments: dict, start_argument: str = 'StartTime', end_argument: str = 'EndTime',
+                windows: int = DEFAULT_WINDOWS, min_window: float = DEFAULT_MIN_WINDOW_SECONDS) -> list:
+    """
+    Splits the range between two time arguments into windows. Ranges which are shorter than `min_window` seconds per
+    window are split into fewer windows.
+
+    Returns
+        list: A list of Shard.
+    """
+    from datetime import datetime, timezone
+    from CloudHarvestPluginAws.incremental import _as_datetime
+
+    start = _as_datetime(arguments.get(start_argument))
+    end = _as_datetime(arguments.get(end_argument)) or datetime.now(timezone.utc)
+
+    if start is None or end <= start:
+        return [Shard(arguments=arguments)]
+
+    count = max(1, min(int(windows), int((end - start).total_seconds() // (min_window or 1))))
+    step = (end - start) / count
+
+    return [
+        Shard(arguments=arguments | {start_argument: start + step * index,
+                                     end_argument: end if index == count - 1 else start + step * (index + 1)})
+        for index in range(count)
+    ]
+
+
+def value_shards(arguments: dict, name: str, values: list) -> list:
+    """
+    Returns one shard per value. The value is applied as a filter, which is sent to the API as a parameter or `Filters`
+    entry when it supports one.
+    """
+    return [Shard(arguments=arguments, filters={name: value}) for value in values]
+
+
+def record_name_shards(arguments: dict, zone_name: str, prefixes: list, locate) -> list:
+    """
+    Splits a Route 53 record listing at record name prefixes.
+
+    Arguments
+        arguments (dict): The `list_resource_record_sets` arguments.
+        zone_name (str): The hosted zone name, such as 'example.com.'.
+        prefixes (list): The labels each shard starts at, such as ['g', 'n', 't']. Shards begin at '<prefix>.<zone_name>'.
+        locate (callable): A function which accepts arguments and returns the first record set of that listing, or None.
+
+    Returns
+        list: A list of Shard.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    zone_name = zone_name.rstrip('.') + '.'
+    names = [f'{prefix}.{zone_name}' for prefix in prefixes]
+
+    with ThreadPoolExecutor(max_workers=max(1, len(names))) as executor:
+        boundaries = list(executor.map(lambda name: locate(arguments | {'StartRecordName': name, 'MaxItems': '1'}), names))
+
+    # Remove boundaries past the last record and boundaries which landed on the same record
+    starts = []
+    for record in boundaries:
+        if record and (not starts or _record_identity(record) != _record_identity(starts[-1])):
+            starts.append(record)
+
+    shards = []
+    for index, start in enumerate([None] + starts):
+        shard_arguments = dict(arguments)
+
+        if start:
+            shard_arguments |= {'StartRecordName': start['Name'], 'StartRecordType': start['Type']}
+
+            if start.get('SetIdentifier'):
+                shard_arguments['StartRecordIdentifier'] = start['SetIdentifier']
+
+        shards.append(Shard(arguments=shard_arguments, stop=starts[index] if index < len(starts) else None))
+
+    return shards
+
+
+def take_until(pages, stop: dict = None) -> list:
+    """
+    Collects the records of each page until the `stop` record is reached. The remaining pages are not requested.
+    """
+    records = []
+    stop_identity = _record_identity(stop) if stop else None
+
+    for page in pages:
+        for record in page if isinstance(page, list) else [page]:
+            if stop_identity and isinstance(record, dict) and _record_identity(record) == stop_identity:
+                return records
+
+            records.append(record)
+
+    return records
+
+
+def merge_shards(results: list, keys: list = None) -> list:
+    """
+    Merges the records of each shard, removing duplicates.
+
+    Arguments
+        results (list): A list of each shard's records.
+        keys (list, optional): The keys which identify a record. Defaults to the entire record.
+    """
+    from CloudHarvestPluginAws.incremental import fingerprint
+
+    seen = set()
+    merged = []
+
+    for records in results:
+        for record in records if isinstance(records, list) else [records]:
+            identity = fingerprint(record, keys)
+
+            if identity not in seen:
+                seen.add(identity)
+                merged.append(record)
+
+    return merged
+
+
+def _record_identity(record: dict) -> tuple:
+    return record.get('Name'), record.get('Type'), record.get('SetIdentifier')
@@ -0,0 +1,529 @@
+"""
+This library plans and schedules a sweep: every service template run for every account and region. A full inventory is
+the product of accounts, regions, and templates, and a few very large templates, such as EBS snapshots and Route 53
+record sets, dominate the cycle when they start late.
+
+- Each (template, account, region) unit records its runtime and the number of API calls it made. Estimates are a moving
+  average of previous runs; units without history use the average of the same template in other accounts and regions.
+- Units are scheduled longest-first. They are dealt to workers so each worker receives a similar estimated total, and a
+  worker which runs out of work steals the longest remaining unit from the worker with the most work left, so an
+  inaccurate estimate does not leave workers idle.
+- The number of units running at once may be capped per account, per region, and per service.
+- A dry run simulates the schedule and estimates the cycle's API calls and duration without calling AWS.
+- The incremental state staged by a unit's tasks is stored once the unit succeeds and discarded when it fails, so records
+  which were not stored are retrieved again by the next run.
+
+History is kept in memory and, when `platforms.aws.sweep.history_path` is configured, in a sqlite database so it survives
+restarts.
+
+Configuration:
+- platforms.aws.sweep.max_workers: The number of units run at once. Defaults to 8.
+- platforms.aws.sweep.max_per_account: The number of units run at once for each account. Unlimited when not provided.
+- platforms.aws.sweep.max_per_region: The number of units run at once in each region. Unlimited when not provided.
+- platforms.aws.sweep.max_per_service: The number of units run at once for each service. Unlimited when not provided.
+- platforms.aws.sweep.history_path: The path to the sqlite database. History is only kept in memory when not provided.
+- platforms.aws.sweep.default_seconds: The estimated runtime of a template without history. Defaults to 30.
+- platforms.aws.sweep.default_calls: The estimated API calls of a template without history. Defaults to 10.
+"""
+from collections import namedtuple
+from contextvars import ContextVar
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_SECONDS = 30.0
+DEFAULT_CALLS = 10
+
+# The weight of the latest run in the moving average
+HISTORY_WEIGHT = 0.5
+
+SweepUnit = namedtuple('SweepUnit', ['template', 'service', 'type', 'account', 'region'])
+SweepResult = namedtuple('SweepResult', ['unit', 'result', 'seconds', 'calls', 'error'])
+
+# The API call counter of the unit running in the current context
+_calls = ContextVar('harvest_aws_sweep_calls', default=None)
+
+
+class SweepHistory:
+    lock = Lock()
+    values = {}             # (template, account, region) -> {'seconds', 'calls', 'runs', 'updated'}
+    connection = None
+    path = None
+    counter = None          # the telemetry sink which counts the calls of each unit
+
+
+class CallCounter:
+    """
+    A telemetry sink which counts the API calls made by the unit running in the current context. Work submitted to
+    thread pools is run with `telemetry.bind()`, so calls made by fan out and shards are counted too.
+    """
+    @staticmethod
+    def emit(event: dict) -> None:
+        calls = _calls.get()
+
+        if calls is not None and event.get('kind') == 'call':
+            # list.append is atomic, so concurrent calls made by one unit are not lost
+            calls.append(1)
+
+
+def get_history(template: str, account: str, region: str = None) -> dict or None:
+    """
+    Retrieves the recorded history of a unit.
+
+    Returns
+        dict or None: A dictionary with the 'seconds' and 'calls' moving averages, the number of 'runs', and when the
+        history was 'updated' (a timestamp).
+    """
+    with SweepHistory.lock:
+        _connect()
+        return SweepHistory.values.get((template, account, region))
+
+
+def record_history(template: str, account: str, region: str = None, seconds: float = 0, calls: int = None) -> dict:
+    """
+    Adds a run to the history of a unit.
+
+    Arguments
+        template (str): The template name.
+        account (str): The AWS account number.
+        region (str, optional): The AWS region. None for global templates.
+        seconds (float, optional): The runtime.
+        calls (int, optional): The number of API calls. When None, such as when telemetry is disabled, the previous estimate is kept.
+
+    Returns
+        dict: The updated history.
+    """
+    from json import dumps
+    from time import time
+
+    key = (template, account, region)
+
+    with SweepHistory.lock:
+        _connect()
+        previous = SweepHistory.values.get(key)
+
+        if previous is None:
+            history = {'seconds': seconds, 'calls': calls, 'runs': 1}
+
+        else:
+            history = {
+                'seconds': _average(previous['seconds'], seconds),
+                'calls': previous['calls'] if calls is None else _average(previous['calls'], calls),
+                'runs': previous['runs'] + 1
+            }
+
+        history['updated'] = time()
+        SweepHistory.values[key] = history
+
+        if SweepHistory.connection is not None:
+            SweepHistory.connection.execute('INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?)',
+                                            (template, account, region or '', dumps(history)))
+            SweepHistory.connection.commit()
+
+    return history
+
+
+def clear_history() -> None:
+    """
+    Removes all recorded history.
+    """
+    with SweepHistory.lock:
+        SweepHistory.values.clear()
+
+        connection = _connect()
+        if connection is not None:
+            connection.execute('DELETE FROM history')
+            connection.commit()
+
+
+def estimate_unit(unit: SweepUnit, averages: dict = None) -> tuple:
+    """
+    Estimates the runtime and API calls of a unit from its history, the history of the same template in other accounts
+    and regions, or the configured defaults.
+
+    Arguments
+        unit (SweepUnit): The unit.
+        averages (dict, optional): The result of `template_averages()`, when estimating many units.
+
+    Returns
+        tuple: The estimated seconds and calls, and whether the unit has history of its own.
+    """
+    default_calls = _setting('default_calls', DEFAULT_CALLS)
+    history = get_history(unit.template, unit.account, unit.region)
+
+    if history is not None:
+        return history['seconds'], default_calls if history['calls'] is None else history['calls'], True
+
+    average = (template_averages() if averages is None else averages).get(unit.template)
+
+    if average is not None:
+        return average[0], default_calls if average[1] is None else average[1], False
+
+    return _setting('default_seconds', DEFAULT_SECONDS), default_calls, False
+
+
+def template_averages() -> dict:
+    """
+    Returns the average seconds and calls of each template across the accounts and regions with history.
+    """
+    totals = {}
+
+    with SweepHistory.lock:
+        _connect()
+
+        for (template, account, region), history in SweepHistory.values.items():
+            total = totals.setdefault(template, [0.0, 0, 0.0, 0])
+            total[0] += history['seconds']
+            total[1] += 1
+
+            if history['calls'] is not None:
+                total[2] += history['calls']
+                total[3] += 1
+
+    return {template: (seconds / runs, calls / counted if counted else None)
+            for template, (seconds, runs, calls, counted) in totals.items()}
+
+
+def plan_sweep(accounts: list, regions: list, templates: list = None, credentials: dict = None, prune: bool = True) -> list:
+    """
+    Returns the units of a sweep, longest first.
+
+    Arguments
+        accounts (list): The AWS account numbers.
+        regions (list): The regions to collect. Global templates are collected once per account.
+        templates (list, optional): The service template names. Defaults to every service template.
+        credentials (dict, optional): Credentials keyed by account, used to retrieve each account's enabled regions.
+        prune (bool, optional): When True, regions which are not enabled for an account and services which are unavailable in a region are skipped. Defaults to True.
+
+    Returns
+        list: A list of SweepUnit.
+    """
+    from CloudHarvestPluginAws.regions import prune_regions
+    from CloudHarvestPluginAws.exceptions import HarvestAwsException
+
+    available = _service_templates()
+    units = []
+
+    for name in templates or sorted(available):
+        if name not in available:
+            raise HarvestAwsException(f'No service template named `{name}`')
+
+        service, type_name, harvest = available[name]
+        is_global = bool(harvest.get('global'))
+
+        for account in accounts:
+            if is_global:
+                template_regions = [None]
+
+            elif prune:
+                template_regions = prune_regions(account=account, service=service, regions=list(regions),
+                                                 credentials=(credentials or {}).get(account))
+
+            else:
+                template_regions = list(regions)
+
+            units.extend(SweepUnit(template=name, service=service, type=type_name, account=account, region=region)
+                         for region in template_regions)
+
+    averages = template_averages()
+
+    return sorted(units, key=lambda unit: estimate_unit(unit, averages)[0], reverse=True)
+
+
+class Sweep:
+    def __init__(self,
+                 units: list,
+                 max_workers: int = None,
+                 max_per_account: int = None,
+                 max_per_region: int = None,
+                 max_per_service: int = None):
+        """
+        Schedules the units of a sweep longest-first with work stealing.
+
+        Arguments
+            units (list): A list of SweepUnit, such as the result of `plan_sweep()`.
+            max_workers (int, optional): The number of units run at once. Defaults to `platforms.aws.sweep.max_workers` or 8.
+            max_per_account (int, optional): The number of units run at once for each account. Defaults to `platforms.aws.sweep.max_per_account`.
+            max_per_region (int, optional): The number of units run at once in each region. Defaults to `platforms.aws.sweep.max_per_region`.
+            max_per_service (int, optional): The number of units run at once for each service. Defaults to `platforms.aws.sweep.max_per_service`.
+        """
+        self.units = list(units)
+        self.max_workers = max(1, int(max_workers or _setting('max_workers', DEFAULT_MAX_WORKERS)))
+
+        self.caps = {
+            'account': max_per_account or _setting('max_per_account', 0) or None,
+            'region': max_per_region or _setting('max_per_region', 0) or None,
+            'service': max_per_service or _setting('max_per_service', 0) or None,
+        }
+
+        averages = template_averages()
+        self.estimates = {unit: estimate_unit(unit, averages) for unit in self.units}
+
+        self.queues = []        # one list of units per worker, longest first
+        self.remaining = []     # the estimated seconds left in each queue
+        self.running = {}       # (dimension, value) -> the number of units running
+
+    def estimate(self) -> dict:
+        """
+        Simulates the schedule without running it. This is the dry run of a sweep.
+
+        Returns
+            dict: The number of units, the estimated API calls, the total runtime of every unit ('seconds'), the
+            estimated wall time of the cycle ('duration'), and the number of units without history ('unknown').
+        """
+        from heapq import heappop, heappush
+
+        self._deal()
+
+        clock = 0.0
+        finishing = []      # (finishes at, worker, unit)
+        idle = list(range(self.max_workers))
+
+        while True:
+            for worker in list(idle):
+                unit = self._take(worker)
+
+                if unit is not None:
+                    idle.remove(worker)
+                    heappush(finishing, (clock + self.estimates[unit][0], worker, unit))
+
+            if not finishing:
+                break
+
+            clock, worker, unit = heappop(finishing)
+            self._release(unit)
+            idle.append(worker)
+
+        return {
+            'units': len(self.units),
+            'calls': round(sum(estimate[1] for estimate in self.estimates.values())),
+            'seconds': round(sum(estimate[0] for estimate in self.estimates.values()), 3),
+            'duration': round(clock, 3),
+            'workers': self.max_workers,
+            'unknown': sum(1 for estimate in self.estimates.values() if not estimate[2]),
+        }
+
+    def run(self, runner, dry_run: bool = False, refresh_reports: bool = False) -> list or dict:
+        """
+        Runs every unit.
+
+        Arguments
+            runner (callable): Called with each SweepUnit, such as a function which runs the template's task chain with the unit's STAR variables. Its return value is the unit's result.
+            dry_run (bool, optional): When True, `runner` is not called and the estimate is returned instead. Defaults to False.
+            refresh_reports (bool, optional): When True, the materialized reports affected by each unit which succeeds are refreshed once it finishes. The runner must store the unit's records before it returns. Defaults to False.
+
+        Returns
+            list or dict: A SweepResult for each unit in the order they finished, or the estimate when `dry_run` is True.
+        """
+        from threading import Condition, Thread
+        from CloudHarvestPluginAws.telemetry import add_sink, enabled
+
+        if dry_run:
+            return self.estimate()
+
+        if enabled() and SweepHistory.counter is None:
+            with SweepHistory.lock:
+                if SweepHistory.counter is None:
+                    SweepHistory.counter = CallCounter()
+                    add_sink(SweepHistory.counter)
+
+        self._deal()
+
+        condition = Condition()
+        results = []
+
+        def work(worker: int):
+            while True:
+                with condition:
+                    unit = self._take(worker)
+
+                    while unit is None and any(self.queues):
+                        # Every remaining unit is capped; wait for a running unit to finish
+                        condition.wait()
+                        unit = self._take(worker)
+
+                    if unit is None:
+                        return
+
+                result = self._run_unit(runner, unit)
+
+                if refresh_reports and result.error is None:
+                    _refresh_reports(unit)
+
+                with condition:
+                    self._release(unit)
+                    results.append(result)
+                    condition.notify_all()
+
+        threads = [Thread(target=work, args=(worker,), name=f'harvest-sweep-{worker}', daemon=True)
+                   for worker in range(min(self.max_workers, len(self.units)))]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    @staticmethod
+    def _run_unit(runner, unit: SweepUnit) -> SweepResult:
+        from time import perf_counter
+        from CloudHarvestPluginAws.incremental import commit_states, discard_states
+        from CloudHarvestPluginAws.telemetry import enabled, tags
+
+        calls = [] if enabled() else None
+        token = _calls.set(calls)
+        started = perf_counter()
+
+        try:
+            with tags(account=unit.account, template=unit.template):
+                result = runner(unit)
+
+        except Exception as e:
+            logger.error(f'{unit.account}: {unit.template} failed in {unit.region or "global"}: {e}')
+
+            # The records were not stored, so the next run retrieves them again
+            discard_states(account=unit.account, region=unit.region, service=unit.service, type=unit.type)
+
+            # Failed runs are usually much shorter than successful ones and are not added to the history
+            return SweepResult(unit=unit, result=None, seconds=perf_counter() - started, calls=len(calls) if calls is not None else None, error=e)
+
+        finally:
+            _calls.reset(token)
+
+        seconds = perf_counter() - started
+        count = len(calls) if calls is not None else None
+
+        # The runner stored the unit's records, so the incremental state staged by its tasks is stored
+        commit_states(account=unit.account, region=unit.region, service=unit.service, type=unit.type)
+
+        record_history(unit.template, unit.account, unit.region, seconds=seconds, calls=count)
+
+        return SweepResult(unit=unit, result=result, seconds=seconds, calls=count, error=None)
+
+    def _deal(self) -> None:
+        """
+        Deals the units, longest first, to the worker with the least estimated work.
+        """
+        self.queues = [[] for _ in range(self.max_workers)]
+        self.remaining = [0.0] * self.max_workers
+        self.running = {}
+
+        for unit in sorted(self.units, key=lambda u: self.estimates[u][0], reverse=True):
+            worker = self.remaining.index(min(self.remaining))
+            self.queues[worker].append(unit)
+            self.remaining[worker] += self.estimates[unit][0]
+
+    def _take(self, worker: int) -> SweepUnit or None:
+        """
+        Removes and returns the next unit for a worker: its own longest unit which is within the caps, or else the longest
+        such unit of the worker with the most work left. Returns None when no unit may be started.
+        """
+        victims = [worker] + sorted((other for other in range(len(self.queues)) if other != worker),
+                                    key=lambda other: self.remaining[other], reverse=True)
+
+        for victim in victims:
+            for index, unit in enumerate(self.queues[victim]):
+                if self._allowed(unit):
+                    del self.queues[victim][index]
+                    self.remaining[victim] -= self.estimates[unit][0]
+
+                    for key in self._dimensions(unit):
+                        self.running[key] = self.running.get(key, 0) + 1
+
+                    return unit
+
+        return None
+
+    def _release(self, unit: SweepUnit) -> None:
+        for key in self._dimensions(unit):
+            self.running[key] -= 1
+
+    def _allowed(self, unit: SweepUnit) -> bool:
+        return all(self.caps[key[0]] is None or self.running.get(key, 0) < self.caps[key[0]] for key in self._dimensions(unit))
+
+    @staticmethod
+    def _dimensions(unit: SweepUnit) -> tuple:
+        return ('account', unit.account), ('region', unit.region), ('service', unit.service)
+
+
+def _service_templates() -> dict:
+    """
+    Reads the service templates. Returns a tuple of the service, type, and `harvest` body of each template, keyed by the
+    template name.
+    """
+    from glob import glob
+    from os.path import basename, dirname, join, splitext
+    from yaml import SafeLoader, load
+
+    root = join(dirname(__file__), 'templates', 'services', 'aws')
+    templates = {}
+
+    # services/aws/<service>/<type>.yaml
+    for path in sorted(glob(join(root, '*', '*.yaml'))):
+        with open(path) as stream:
+            harvest = (load(stream, Loader=SafeLoader) or {}).get('harvest') or {}
+
+        service, type_name = basename(dirname(path)), splitext(basename(path))[0]
+        templates[harvest.get('name') or f'services.aws.{service}.{type_name}'] = (service, type_name, harvest)
+
+    return templates
+
+
+def _refresh_reports(unit: SweepUnit) -> None:
+    from CloudHarvestPluginAws.materialized import refresh
+
+    try:
+        refresh(account=unit.account, region=unit.region, service=unit.service, type=unit.type)
+
+    except Exception as e:
+        logger.warning(f'{unit.account}: unable to refresh the materialized reports of {unit.template}: {e}')
+
+
+def _average(previous: float, latest: float) -> float:
+    return previous + HISTORY_WEIGHT * (latest - previous)
+
+
+def _setting(name: str, default):
+    from CloudHarvestCoreTasks.environment import Environment
+    return type(default)(Environment.get(f'platforms.aws.sweep.{name}') or default)
+
+
+def _connect():
+    """
+    Opens the database when a path is configured and loads its history. Must be called while holding SweepHistory.lock.
+    """
+    from CloudHarvestCoreTasks.environment import Environment
+    from os.path import abspath, expanduser
+
+    path = Environment.get('platforms.aws.sweep.history_path')
+
+    if not path:
+        return None
+
+    path = abspath(expanduser(path))
+
+    if SweepHistory.connection is not None and SweepHistory.path == path:
+        return SweepHistory.connection
+
+    import sqlite3
+    from json import loads
+    from pathlib import Path
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute('CREATE TABLE IF NOT EXISTS history (template TEXT, account TEXT, region TEXT, value TEXT, '
+                       'PRIMARY KEY (template, account, region))')
+    connection.commit()
+
+    for template, account, region, value in connection.execute('SELECT template, account, region, value FROM history'):
+        SweepHistory.values.setdefault((template, account, region or None), loads(value))
+
+    SweepHistory.connection = connection
+    SweepHistory.path = path
+
+    return connection
@@ -0,0 +1,95 @@
+"""
+This library retrieves tags in bulk from the Resource Groups Tagging API. A single paginated `get_resources` call returns
+the tags of every resource of a type in a region, which replaces one `list_tags_*` call per resource. The tags are indexed
+by ARN so they can be merged into records in a single pass.
+
+The Tagging API only returns resources which have (or had) tags, so a resource which is missing from the index has no
+tags. When the API cannot be used, such as when the role is not allowed to call it or the resource type is not supported
+in the region, the `aws_tags` task falls back to per-resource calls.
+"""
+from logging import getLogger
+
+logger = getLogger('harvest')
+
+# The maximum number of ARNs accepted by the ResourceARNList argument of get_resources
+MAX_RESOURCE_ARNS = 100
+
+
+def get_tag_index(region: str = None,
+                  credentials: dict = None,
+                  resource_types: list = None,
+                  arns: list = None,
+                  **kwargs) -> dict:
+    """
+    Retrieves the tags of every resource of the provided types.
+
+    Arguments
+        region (str, optional): The AWS region.
+        credentials (dict, optional): The AWS credentials. When not provided, boto3 will attempt to use the default credentials.
+        resource_types (list, optional): Resource type filters such as 'sqs' or 'kms:key'.
+        arns (list, optional): When no more than MAX_RESOURCE_ARNS are provided, only these resources are requested.
+        **kwargs: Passed to `query_aws`, such as `max_retries`, `retry_budget`, and `retry_stats`.
+
+    Returns
+        dict: A dictionary of ARNs and tag dictionaries.
+    """
+    from CloudHarvestPluginAws.rate_limits import get_rate_limiter
+    from CloudHarvestPluginAws.tasks.aws import query_aws
+
+    # ResourceARNList cannot be combined with ResourceTypeFilters, but a small list of resources takes a single call
+    if arns and len(arns) <= MAX_RESOURCE_ARNS:
+        arguments = {'ResourceARNList': list(arns)}
+
+    else:
+        arguments = {'ResourceTypeFilters': list(resource_types or [])}
+
+    kwargs.setdefault('rate_limiter', get_rate_limiter(service='resourcegroupstaggingapi', region=region))
+
+    mappings = query_aws(service='resourcegroupstaggingapi',
+                         command='get_resources',
+                         arguments=arguments,
+                         credentials=credentials,
+                         region=region,
+                         result_path='ResourceTagMappingList',
+                         **kwargs) or []
+
+    return {
+        mapping['ResourceARN']: tags_to_dict(mapping.get('Tags'))
+        for mapping in mappings
+    }
+
+
+def tags_to_dict(tags, name_key: str = 'Key', value_key: str = 'Value') -> dict:
+    """
+    Converts a list of tags such as [{'Key': 'Name', 'Value': 'web'}] to {'Name': 'web'}. Dictionaries are returned as-is.
+    """
+    if isinstance(tags, dict):
+        return tags
+
+    return {
+        tag.get(name_key): tag.get(value_key)
+        for tag in tags or []
+        if isinstance(tag, dict)
+    }
+
+
+def merge_tags(records: list, index: dict, arn_key: str, target_key: str = 'Tags') -> list:
+    """
+    Sets `target_key` on each record to the tags of the record's ARN.
+
+    Arguments
+        records (list): The records to update. Records are updated in place.
+        index (dict): A dictionary of ARNs and tag dictionaries.
+        arn_key (str): The key containing each record's ARN. May be a dot-separated path.
+        target_key (str, optional): The key the tags are stored under. Defaults to 'Tags'.
+
+    Returns
+        list: The records.
+    """
+    from CloudHarvestCoreTasks.dataset import WalkableDict
+
+    for record in records or []:
+        if isinstance(record, dict):
+            record[target_key] = index.get(WalkableDict(record).walk(arn_key)) or {}
+
+    return records
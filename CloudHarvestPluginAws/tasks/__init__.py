@@ -1 +1,4 @@
 from CloudHarvestPluginAws.tasks.aws import AwsTask
+from CloudHarvestPluginAws.tasks.aws_tags import AwsTagsTask
+from CloudHarvestPluginAws.tasks.aws_rds_logs import AwsRdsLogsTask
+from CloudHarvestPluginAws.tasks.aws_s3_buckets import AwsS3BucketsTask
@@ -1,8 +1,12 @@
+from logging import getLogger
+
 from CloudHarvestCoreTasks.dataset import WalkableDict
 from CloudHarvestCoreTasks.tasks import BaseTask
 from CloudHarvestCorePluginManager.decorators import register_definition
 
-from botocore.exceptions import ClientError
+from CloudHarvestPluginAws.telemetry import bind, tagged
+
+logger = getLogger('harvest')
 
 
 @register_definition(name='aws', category='task')
@@ -19,6 +23,16 @@ class AwsTask(BaseTask):
                  global_service: bool = False,
                  max_retries: int = 10,
                  result_path: str or list or tuple = None,
+                 stream: bool = False,
+                 fan_out: dict = None,
+                 rate_limit: float = None,
+                 filters: dict = None,
+                 fields: list = None,
+                 incremental: dict = None,
+                 account_independent: bool or str = False,
+                 coalesce: dict = None,
+                 shard: dict = None,
+                 compact: bool or dict = None,
                  *args,
                  **kwargs):
         """
@@ -36,6 +50,46 @@ class AwsTask(BaseTask):
             global_service (bool, optional): If True, the service is considered a global service (e.g., IAM). Negates the 'region' input. Defaults to False.
             max_retries (int, optional): The maximum number of retries for the command. Defaults to 10.
             result_path (str, optional): Path to the results. When not provided, the path is the first key that is not 'Marker' or 'NextToken'.
+            stream (bool, optional): When True, the result is a generator which yields records page by page instead of a list built from every page. Defaults to False.
+            fan_out (dict, optional): Executes the command once per item using a bounded thread pool. Arguments beginning with 'each.' are resolved against the item. Keys:
+                items (list): The items to iterate over.
+                max_workers (int, optional): The maximum number of concurrent calls. Defaults to `platforms.aws.fan_out.max_workers` or 8.
+                result_key (str, optional): When provided, each item's result is stored under this key in a new record.
+                include (dict, optional): Keys added to each item's record(s). Values beginning with 'each.' are resolved against the item.
+            rate_limit (float, optional): Requests per second allowed for the service, account, and region. Defaults to `platforms.aws.rate_limits.<service>`.
+            filters (dict, optional): Filter names and values. Filters are applied by the API when it supports them; otherwise they are applied to each page.
+            fields (list, optional): The keys to keep in each record. Records are trimmed as each page is received.
+            incremental (dict, optional): Only retrieves records which are new or changed since the last successful collection for the account, region, and template. Keys:
+                argument (str, optional): A time-bounded argument, such as 'StartTime', which is set to the start time of the last collection.
+                format (str, optional): 'datetime' (default) or 'iso' when the API expects an ISO 8601 string.
+                overlap (int, optional): Seconds subtracted from the last collection's start time. Defaults to 60.
+                identifier (str, optional): When no argument is provided, the key identifying each record. Only records whose fingerprint changed are returned.
+                fingerprint (list, optional): The keys included in each record's fingerprint. Defaults to the entire record.
+                key (str, optional): The name the state is stored under. Defaults to '<service>.<type>.<command>'.
+                commit (str, optional): 'manual' (default) stages the state until the records are stored, when `Sweep` or
+                    `commit()` stores it; until then, the next collection retrieves the same records again. 'task' stores the
+                    state as soon as the command succeeds, before later stages of the task chain store the records; if a
+                    later stage fails, those records are not retrieved again.
+            account_independent (bool or str, optional): Declares that the result is the same for every account. The result is retrieved once per region ('region' or True) or partition ('partition') and shared by every account. Defaults to False.
+            coalesce (dict, optional): Merges concurrent requests for the same command into a single multi-ID call. Keys:
+                argument (str): The list argument containing the IDs, such as 'InstanceIds'.
+                path (str): The path to the ID in each record, such as 'Instances.InstanceId'.
+                max_batch (int, optional): The maximum number of IDs in a call. Defaults to the API's maximum.
+                window (float, optional): Seconds a batch waits for more requests. Defaults to `platforms.aws.coalesce.window` or 0.05.
+            shard (dict, optional): Splits the listing into shards which are enumerated concurrently and merged without duplicates. Keys:
+                strategy (str): 'time', 'values', or 'record_names'.
+                keys (list, optional): The keys which identify a record when duplicates are removed. Defaults to the entire record.
+                max_workers (int, optional): The maximum number of concurrent shards. Defaults to `platforms.aws.fan_out.max_workers` or 8.
+                size (int, optional): The expected number of records, such as a hosted zone's record count.
+                min_size (int, optional): When `size` is less than `min_size`, the listing is not sharded. When `size` is not provided, the first page of the unsharded listing is requested and the listing is only sharded when the page holds at least `min_size` records.
+                The 'time' strategy accepts `start_argument` (default 'StartTime'), `end_argument` (default 'EndTime'), `windows` (default 4), and `min_window` seconds (default 3600).
+                The 'values' strategy accepts `name` (a parameter or filter name) and `values`.
+                The 'record_names' strategy accepts `zone_name` and `prefixes`.
+            compact (bool or dict, optional): Reduces the memory held by large results. Each record's 'Harvest' metadata shares its values with every other record and repeated strings are pooled. Defaults to `platforms.aws.results.compact` or False. When a dictionary, the keys are:
+                intern (bool, optional): Pool repeated strings, such as regions and states. Defaults to True.
+                columnar (bool, optional): Store the records as a ColumnarRecords, one list per key, instead of a list of dictionaries. Defaults to False.
+                max_length (int, optional): Longer strings are not pooled. Defaults to 64.
+                max_distinct (int, optional): The number of distinct values pooled for each key. Defaults to 4096.
         """
 
         # Initialize parent class
@@ -53,17 +107,77 @@ class AwsTask(BaseTask):
         self.command = command
         self.arguments = arguments or {}
         self.max_retries = max_retries
+        self.fan_out = fan_out or {}
+        self.rate_limit = rate_limit
 
         # Output manipulation
         self.include_metadata = include_metadata
         self.result_path = result_path
+        self.stream = stream
+        self.filters = filters or {}
+        self.fields = fields or []
+        self.incremental = incremental or {}
+        self.account_independent = 'region' if account_independent is True else account_independent or None
+        self.coalesce = coalesce or {}
+        self.shard = shard or {}
+
+        from CloudHarvestPluginAws.compact import StringPool, compact_options
+        self.compact = compact_options(compact)
+
+        # Repeated strings are pooled by query_aws as each page is received, so the duplicates are freed right away
+        self.string_pool = None
+        if self.compact.get('intern'):
+            self.string_pool = StringPool(max_length=self.compact['max_length'], max_distinct=self.compact['max_distinct'])
+
+        if self.stream and self.fan_out:
+            from CloudHarvestPluginAws.exceptions import HarvestAwsTaskException
+            raise HarvestAwsTaskException('The `stream` and `fan_out` directives cannot be used together')
+
+        if self.incremental and (self.stream or self.fan_out):
+            from CloudHarvestPluginAws.exceptions import HarvestAwsTaskException
+            raise HarvestAwsTaskException('The `incremental` directive cannot be used with `stream` or `fan_out`')
+
+        if self.incremental and not (self.incremental.get('argument') or self.incremental.get('identifier')):
+            from CloudHarvestPluginAws.exceptions import HarvestAwsTaskException
+            raise HarvestAwsTaskException('The `incremental` directive requires an `argument` or an `identifier`')
+
+        if self.incremental.get('commit', 'manual') not in ('task', 'manual'):
+            from CloudHarvestPluginAws.exceptions import HarvestAwsTaskException
+            raise HarvestAwsTaskException("The `incremental` commit must be 'task' or 'manual'")
+
+        if self.account_independent and (self.stream or self.fan_out or self.incremental):
+            from CloudHarvestPluginAws.exceptions import HarvestAwsTaskException
+            raise HarvestAwsTaskException('The `account_independent` directive cannot be used with `stream`, `fan_out`, or `incremental`')
+
+        if self.coalesce and (self.stream or self.fan_out or self.incremental or self.account_independent):
+            from CloudHarvestPluginAws.exceptions import HarvestAwsTaskException
+            raise HarvestAwsTaskException('The `coalesce` directive cannot be used with `stream`, `fan_out`, `incremental`, or `account_independent`')
+
+        if self.shard:
+            from CloudHarvestPluginAws.exceptions import HarvestAwsTaskException
+            from CloudHarvestPluginAws.shard import STRATEGIES
+
+            if self.stream or self.fan_out or self.coalesce or self.account_independent:
+                raise HarvestAwsTaskException('The `shard` directive cannot be used with `stream`, `fan_out`, `coalesce`, or `account_independent`')
+
+            if self.shard.get('strategy') not in STRATEGIES:
+                raise HarvestAwsTaskException(f'The `shard` strategy must be one of {STRATEGIES}')
+
+        if self.compact.get('columnar') and self.stream:
+            from CloudHarvestPluginAws.exceptions import HarvestAwsTaskException
+            raise HarvestAwsTaskException('The `compact.columnar` option cannot be used with `stream`')
 
         # Programmatic attributes
         self.account_alias = None
+        self.incremental_key = None     # the state key staged by an incremental collection which commits manually
+
+        from CloudHarvestPluginAws.retry import RetryStats
+        self.retry_stats = RetryStats()
 
         # Initialize parent class again
         super().__init__(*args, **kwargs)
 
+    @tagged
     def method(self):
         """
         Executes the command on the AWS service and stores the result.
@@ -74,6 +188,96 @@ class AwsTask(BaseTask):
         Returns:
             self: Returns the instance of the AwsTask.
         """
+        options = self._prepare_options()
+
+        # The region was skipped
+        if options is None:
+            return self
+
+        # Stream the records page by page; metadata is applied as each record is yielded
+        if self.stream:
+            self.result = self._stream_records(query_aws_pages(arguments=self.arguments, **options))
+
+            return self
+
+        from CloudHarvestPluginAws.regions import record_error, record_result
+
+        try:
+            # Execute the command once per item
+            if self.fan_out:
+                result = self._fan_out(options=options)
+
+            # Only retrieve records which changed since the last collection
+            elif self.incremental:
+                result = self._query_incremental(options=options)
+
+            # Retrieve the result once for every account
+            elif self.account_independent:
+                result = self._query_reference_data(options=options)
+
+            # Merge the request with concurrent requests for other IDs
+            elif self.coalesce:
+                result = self._query_coalesced(options=options)
+
+            # Execute the AWS query
+            else:
+                result = self._query(arguments=self.arguments, options=options)
+
+                # Only inventory-wide calls show that the region has nothing to collect
+                if not self.arguments and not self.filters:
+                    record_result(account=self.account, service=self.service, region=self.region, command=self.command, result=result)
+
+        except Exception as e:
+            record_error(account=self.account, service=self.service, region=self.region, exception=e)
+            raise e
+
+        return self._store_result(result)
+
+    @tagged
+    async def async_method(self):
+        """
+        The asyncio counterpart of `method()`. Plain commands and `fan_out` send their requests with aiobotocore on the
+        running event loop. The profile is retrieved in a thread, and the other directives run `method()` in a thread.
+
+        Returns:
+            self: Returns the instance of the AwsTask.
+        """
+        from asyncio import to_thread
+
+        if self.stream or self.incremental or self.account_independent or self.coalesce or self.shard:
+            return await to_thread(self.method)
+
+        options = await to_thread(self._prepare_options)
+
+        # The region was skipped
+        if options is None:
+            return self
+
+        from CloudHarvestPluginAws.regions import record_error, record_result
+
+        try:
+            if self.fan_out:
+                result = await self._async_fan_out(options=options)
+
+            else:
+                result = await async_query_aws(arguments=self.arguments, **options)
+
+                if not self.arguments and not self.filters:
+                    record_result(account=self.account, service=self.service, region=self.region, command=self.command, result=result)
+
+        except Exception as e:
+            record_error(account=self.account, service=self.service, region=self.region, exception=e)
+            raise e
+
+        return self._store_result(result)
+
+    def _prepare_options(self) -> dict or None:
+        """
+        Retrieves the profile for the account and builds the keyword arguments shared by every call made by this task.
+
+        Returns:
+            dict or None: The `query_aws` keyword arguments, or None when the region is skipped.
+        """
         from CloudHarvestPluginAws.credentials import Profile, get_profile
         profile: Profile = get_profile(account_number=self.account, role_name=self.role)
 
@@ -83,32 +287,54 @@ class AwsTask(BaseTask):
         # Set the account_alias attribute
         self.account_alias = profile.account_alias
 
-        # Execute the AWS query
-        result = query_aws(
-            service=self.service,
-            region=self.region,
-            command=self.command,
-            arguments=self.arguments,
-            credentials=profile.credentials,
-            max_retries=self.max_retries,
-            result_path=self.result_path
-        )
+        # Skip regions which are not enabled for the account and services which are not offered in the region
+        from CloudHarvestPluginAws.regions import should_collect
+
+        if not should_collect(account=self.account, service=self.service, region=self.region, command=self.command, credentials=profile.credentials):
+            logger.info(f'{self.name}: skipped {self.service}:{self.command} in {self.account}/{self.region}')
+            self.result = []
+
+            return None
+
+        # All calls made by this task share the rate limiter and retry budget for the service, account, and region
+        from CloudHarvestPluginAws.rate_limits import get_rate_limiter
+        from CloudHarvestPluginAws.retry import get_retry_budget
+
+        return {
+            'service': self.service,
+            'region': self.region,
+            'command': self.command,
+            'credentials': profile.credentials,
+            'max_retries': self.max_retries,
+            'result_path': self.result_path,
+            'filters': self.filters,
+            'fields': self.fields,
+            'rate_limiter': get_rate_limiter(service=self.service, region=self.region, account=self.account, rate=self.rate_limit),
+            'retry_budget': get_retry_budget(account=self.account, region=self.region),
+            'retry_stats': self.retry_stats,
+            'string_pool': self.string_pool
+        }
+
+    def _store_result(self, result):
+        """
+        Adds the metadata to the result and stores it.
+        """
+        # Share the metadata and pool repeated strings instead of copying them into every record
+        if self.compact and isinstance(result, list):
+            from CloudHarvestPluginAws.compact import compact_records
+            result = compact_records(result,
+                                     metadata=self._metadata() if self.include_metadata else None,
+                                     intern=False,
+                                     columnar=self.compact['columnar'])
 
         # Add starting metadata to the result
-        if self.include_metadata:
+        elif self.include_metadata:
             if isinstance(result, list):
                 for record in result:
-                    if isinstance(record, dict):
-                        record['Harvest'] = {
-                            'AccountId': self.account,
-                            'AccountName': self.account_alias
-                        }
+                    self._add_metadata(record)
 
             elif isinstance(result, dict):
-                result['Harvest'] = {
-                    'AccountId': self.account,
-                    'AccountName': self.account_alias
-                }
+                self._add_metadata(result)
 
         # Store the result
         self.result = result
@@ -116,6 +342,283 @@ class AwsTask(BaseTask):
         # Return the instance of the AwsTask
         return self
 
+    def _add_metadata(self, record):
+        """
+        Adds the 'Harvest' metadata fields to a record.
+        """
+        if isinstance(record, dict):
+            record['Harvest'] = self._metadata()
+
+        return record
+
+    def _metadata(self) -> dict:
+        return {
+            'AccountId': self.account,
+            'AccountName': self.account_alias
+        }
+
+    def _fan_out(self, options: dict) -> list:
+        """
+        Executes the command once per `fan_out.items` entry using a bounded thread pool. Every call shares the same pooled
+        client, rate limiter, and retry budget. Results are returned in the same order as the items.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from CloudHarvestCoreTasks.environment import Environment
+
+        items = self.fan_out.get('items') or []
+        max_workers = int(self.fan_out.get('max_workers') or Environment.get('platforms.aws.fan_out.max_workers') or 8)
+
+        def call(item):
+            item_result = query_aws(arguments=_resolve_item_references(self.arguments, item), **options)
+
+            return self._fan_out_result(item, item_result)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items) or 1))) as executor:
+            # map() preserves the order of the items, so downstream joins behave the same as a serial iteration
+            return _flatten(executor.map(bind(call), items))
+
+    async def _async_fan_out(self, options: dict) -> list:
+        """
+        The asyncio counterpart of `_fan_out`. At most `fan_out.max_workers` items (default
+        `platforms.aws.async.max_concurrency` or 256) are in flight at once. Results are returned in the same order as the
+        items.
+        """
+        from asyncio import Semaphore, gather
+        from CloudHarvestCoreTasks.environment import Environment
+        from CloudHarvestPluginAws.aio import DEFAULT_MAX_CONCURRENCY
+
+        items = self.fan_out.get('items') or []
+        semaphore = Semaphore(int(self.fan_out.get('max_workers')
+                                  or Environment.get('platforms.aws.async.max_concurrency')
+                                  or DEFAULT_MAX_CONCURRENCY))
+
+        async def call(item):
+            async with semaphore:
+                item_result = await async_query_aws(arguments=_resolve_item_references(self.arguments, item), **options)
+
+            return self._fan_out_result(item, item_result)
+
+        return _flatten(await gather(*(call(item) for item in items)))
+
+    def _fan_out_result(self, item, item_result):
+        """
+        Applies `fan_out.result_key` and `fan_out.include` to the result of one item.
+        """
+        result_key = self.fan_out.get('result_key')
+        include = self.fan_out.get('include') or {}
+
+        if result_key:
+            item_result = {result_key: item_result}
+
+        if include:
+            for record in item_result if isinstance(item_result, list) else [item_result]:
+                if isinstance(record, dict):
+                    record.update(_resolve_item_references(include, item))
+
+        return item_result
+
+    def _query(self, arguments: dict, options: dict):
+        """
+        Executes the command, enumerating its shards concurrently when the `shard` directive is provided.
+        """
+        if not self.shard:
+            return query_aws(arguments=arguments, **options)
+
+        min_size = int(self.shard.get('min_size') or 0)
+
+        # Without an expected size, the first page of the unsharded listing shows whether the listing is large. A page
+        # which holds fewer than `min_size` records is the last page, so the listing is completed without sharding.
+        if min_size and self.shard.get('size') is None:
+            pages = query_aws_pages(arguments=arguments, **options)
+            first_page = next(pages, [])
+            first_page = first_page if isinstance(first_page, list) else [first_page]
+
+            if len(first_page) < min_size:
+                return first_page + [record for page in pages for record in (page if isinstance(page, list) else [page])]
+
+            pages.close()
+
+        elif int(self.shard.get('size') or 0) < min_size:
+            return query_aws(arguments=arguments, **options)
+
+        return self._query_sharded(arguments=arguments, options=options)
+
+    def _query_sharded(self, arguments: dict, options: dict) -> list:
+        """
+        Splits the listing into shards, enumerates them using a bounded thread pool, and merges the records without
+        duplicates.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from CloudHarvestCoreTasks.environment import Environment
+        from CloudHarvestPluginAws import shard as sharding
+
+        strategy = self.shard['strategy']
+
+        if strategy == 'time':
+            shards = sharding.time_shards(arguments=arguments,
+                                          start_argument=self.shard.get('start_argument') or 'StartTime',
+                                          end_argument=self.shard.get('end_argument') or 'EndTime',
+                                          windows=int(self.shard.get('windows') or sharding.DEFAULT_WINDOWS),
+                                          min_window=float(self.shard.get('min_window') or sharding.DEFAULT_MIN_WINDOW_SECONDS))
+
+        elif strategy == 'values':
+            shards = sharding.value_shards(arguments=arguments, name=self.shard['name'], values=self.shard['values'])
+
+        else:
+            def locate(locate_arguments: dict):
+                # Only the first page is requested
+                for page in query_aws_pages(arguments=locate_arguments, **options):
+                    return page[0] if page else None
+
+            shards = sharding.record_name_shards(arguments=arguments,
+                                                 zone_name=self.shard['zone_name'],
+                                                 prefixes=self.shard.get('prefixes') or sharding.DEFAULT_RECORD_NAME_PREFIXES,
+                                                 locate=bind(locate))
+
+        def enumerate_shard(shard) -> list:
+            shard_options = options | {'filters': (options.get('filters') or {}) | shard.filters}
+
+            if shard.stop is not None:
+                return sharding.take_until(query_aws_pages(arguments=shard.arguments, **shard_options), stop=shard.stop)
+
+            result = query_aws(arguments=shard.arguments, **shard_options)
+            return result if isinstance(result, list) else [result]
+
+        max_workers = int(self.shard.get('max_workers') or Environment.get('platforms.aws.fan_out.max_workers') or 8)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(shards)))) as executor:
+            results = list(executor.map(bind(enumerate_shard), shards))
+
+        logger.debug(f'{self.name}: merged {len(shards)} shards')
+
+        return sharding.merge_shards(results, keys=self.shard.get('keys'))
+
+    def _query_coalesced(self, options: dict):
+        """
+        Executes the command as part of a batch of requests for the same credentials, region, and command. Only the
+        records which match this task's IDs are returned.
+        """
+        from CloudHarvestPluginAws.clients import credentials_identity
+        from CloudHarvestPluginAws.coalesce import MAX_BATCH_SIZES, coalesce
+
+        argument = self.coalesce['argument']
+        ids = self.arguments.get(argument)
+
+        # Requests without a list of IDs, such as the `all` tasks, are not batched
+        if not ids or not isinstance(ids, list):
+            return query_aws(arguments=self.arguments, **options)
+
+        arguments = {key: value for key, value in self.arguments.items() if key != argument}
+
+        key = (credentials_identity(options['credentials']), self.region, self.service, self.command,
+               repr(sorted(arguments.items())), repr(self.result_path), repr(self.filters), repr(self.fields))
+
+        return coalesce(key=key,
+                        ids=ids,
+                        execute=lambda batch_ids: query_aws(arguments=arguments | {argument: batch_ids}, **options),
+                        path=self.coalesce['path'],
+                        max_batch=self.coalesce.get('max_batch') or MAX_BATCH_SIZES.get((self.service, self.command)),
+                        window=self.coalesce.get('window'))
+
+    def _query_reference_data(self, options: dict):
+        """
+        Retrieves a result which is the same for every account from the reference data cache. Each task receives its own
+        deep copy of the records, so the per-account metadata and later stages do not change the cached result.
+        """
+        from CloudHarvestPluginAws.reference_data import get_reference_data, reference_key
+
+        key = reference_key(scope=self.account_independent,
+                            region=self.region,
+                            service=self.service,
+                            command=self.command,
+                            arguments=self.arguments,
+                            result_path=self.result_path,
+                            filters=self.filters,
+                            fields=self.fields)
+
+        return get_reference_data(key, loader=lambda: query_aws(arguments=self.arguments, **options))
+
+    def commit(self):
+        """
+        Stores the incremental state staged by this task when the `incremental` directive's `commit` is 'manual', the
+        default. Call this once the records returned by the task have been stored; until then, the next collection
+        retrieves them again. `Sweep` commits the state of each unit which succeeds.
+
+        Returns:
+            bool: True when staged state was stored.
+        """
+        from CloudHarvestPluginAws.incremental import commit_state
+
+        if self.incremental_key is None:
+            return False
+
+        key, self.incremental_key = self.incremental_key, None
+
+        return commit_state(key)
+
+    def _query_incremental(self, options: dict):
+        """
+        Executes the command using the state stored by the last successful collection. The state is only updated once the
+        command succeeds, so a failed collection is retried in full by the next run. Unless `commit` is 'task', the state
+        is staged until the records are stored.
+        """
+        from datetime import datetime, timezone
+        from CloudHarvestPluginAws.incremental import apply_watermark, changed_records, get_state, set_state, stage_state
+
+        key = (self.account, self.region, self.incremental.get('key') or f'{self.service}.{self.type}.{self.command}')
+        state = get_state(key) or {}
+        started = datetime.now(timezone.utc)
+
+        argument = self.incremental.get('argument')
+        arguments = self.arguments
+
+        if argument:
+            arguments = apply_watermark(arguments=arguments,
+                                        argument=argument,
+                                        watermark=state.get('watermark'),
+                                        overlap=float(self.incremental.get('overlap', 60)),
+                                        format=self.incremental.get('format') or 'datetime')
+
+        result = self._query(arguments=arguments, options=options)
+        fingerprints = None
+
+        identifier = self.incremental.get('identifier')
+        if identifier and not argument and isinstance(result, list):
+            result, fingerprints = changed_records(records=result,
+                                                   previous=state.get('fingerprints'),
+                                                   identifier=identifier,
+                                                   keys=self.incremental.get('fingerprint'))
+
+        if self.incremental.get('commit', 'manual') == 'manual':
+            stage_state(key, watermark=started, fingerprints=fingerprints, owner=(self.service, self.type))
+            self.incremental_key = key
+
+        else:
+            set_state(key, watermark=started, fingerprints=fingerprints)
+
+        return result
+
+    def _stream_records(self, pages):
+        """
+        Yields the records of each page as the page is received.
+        """
+        new_metadata = None
+        if self.compact and self.include_metadata:
+            from CloudHarvestPluginAws.compact import record_metadata
+            new_metadata = record_metadata(self._metadata(), self.string_pool)
+
+        for page in pages:
+            records = page if isinstance(page, list) else [page]
+
+            for record in records:
+                if new_metadata is not None and isinstance(record, dict):
+                    record['Harvest'] = new_metadata()
+
+                elif self.include_metadata and not self.compact:
+                    self._add_metadata(record)
+
+                yield record
+
 
 def query_aws(service: str,
               command: str,
@@ -123,7 +626,13 @@ def query_aws(service: str,
               credentials: dict = None,
               max_retries: int = None,
               region: str = None,
-              result_path: str or list or tuple = None) -> WalkableDict:
+              result_path: str or list or tuple = None,
+              filters: dict = None,
+              fields: list = None,
+              rate_limiter=None,
+              retry_budget=None,
+              retry_stats=None,
+              string_pool=None) -> WalkableDict:
     """
     Queries AWS for the specified service and command.
 
@@ -132,90 +641,547 @@ def query_aws(service: str,
         command (str): The command to execute on the AWS service.
         arguments (dict): The arguments to pass to the command.
         credentials (dict, optional): The AWS credentials to use for the session. When not provided, boto3 will attempt to use the default credentials.
-        max_retries (int, optional): The maximum number of retries for the command. Defaults to 10.
+        max_retries (int, optional): The maximum number of retries for each request. Defaults to 10.
         region (str, optional): The AWS region to use for the session. None is supported as not all AWS services require a region.
         result_path (str, optional): Path to the results. When not provided, the path is the first key that is not 'Marker' or 'NextToken'.
+        filters (dict, optional): Filter names and values. Filters are applied by the API when it supports them; otherwise they are applied to each page.
+        fields (list, optional): The keys to keep in each record. Records are trimmed as each page is received.
+        rate_limiter (TokenBucket, optional): A rate limiter which is acquired before each request.
+        retry_budget (RetryBudget, optional): The budget retries are withdrawn from. Defaults to the budget for the credentials and region.
+        retry_stats (RetryStats, optional): Receives the retry, sleep, and resume counts.
+        string_pool (StringPool, optional): Pools the repeated strings of each page's records as the page is received.
 
     Returns:
         Any: The result of the AWS query.
     """
-    # Make sure the credentials is a dictionary
-    credentials = credentials or {}
-    max_retries = max_retries or 10
+    from CloudHarvestPluginAws.request_cache import cached_request, is_cacheable, request_cache_ttl, request_key
+
+    # Identical read-only requests made within the request cache TTL share a single result
+    ttl = request_cache_ttl()
+    if ttl and is_cacheable(command):
+        key = request_key(credentials=credentials, service=service, region=region, command=command, arguments=arguments,
+                          result_path=result_path, filters=filters, fields=fields)
+
+        return cached_request(key, ttl=ttl, loader=lambda: _query_aws(service, command, arguments, credentials, max_retries,
+                                                                      region, result_path, filters, fields, rate_limiter,
+                                                                      retry_budget, retry_stats, string_pool))
+
+    return _query_aws(service, command, arguments, credentials, max_retries, region, result_path, filters, fields,
+                      rate_limiter, retry_budget, retry_stats, string_pool)
+
+
+def _query_aws(service, command, arguments, credentials, max_retries, region, result_path, filters, fields, rate_limiter,
+               retry_budget, retry_stats, string_pool):
+    """
+    Executes a request for `query_aws`.
+    """
+    client, retry_options = _prepare(service, command, credentials, max_retries, region, rate_limiter, retry_budget, retry_stats)
+
+    from CloudHarvestPluginAws.filters import build_filter_arguments
+    from CloudHarvestPluginAws.telemetry import measure_call, timed
+    arguments, filters = build_filter_arguments(client, command, arguments, filters)
 
-    from boto3 import Session
-    session = Session(**credentials)
+    with measure_call(service=service, region=region, command=command) as call:
+        retry_options['call'] = call
 
-    # Create a client for the specified service in the specified region
-    client = session.client(service_name=service, region_name=region)
+        # If the command can be paginated, combine the pages the same way botocore's build_full_result() does. Records
+        # are filtered and trimmed as each page is received so only the records being kept are held in memory.
+        if client.can_paginate(command):
+            result = _build_full_result(_paginate(client, command, arguments, retry_options),
+                                        transform=lambda records: _finish_records(records, filters, fields, string_pool))
 
-    # Initialize the result and attempt counter
-    attempt = 0
+            return _extract_result(result, result_path)
+
+        # Otherwise, execute the command directly
+        from CloudHarvestPluginAws.retry import call_with_retries
+        result = call_with_retries(lambda: timed(call, getattr(client, command))(**arguments), **retry_options)
+
+    return _finish_records(_extract_result(result, result_path), filters, fields, string_pool)
+
+
+def query_aws_pages(service: str,
+                    command: str,
+                    arguments: dict,
+                    credentials: dict = None,
+                    max_retries: int = None,
+                    region: str = None,
+                    result_path: str or list or tuple = None,
+                    filters: dict = None,
+                    fields: list = None,
+                    rate_limiter=None,
+                    retry_budget=None,
+                    retry_stats=None,
+                    string_pool=None):
+    """
+    Queries AWS for the specified service and command, yielding the result of each page as it is received. Unlike
+    `query_aws`, the pages are never combined, so memory use is bound by the page size instead of the number of records.
+
+    Arguments
+        service (str): The AWS service to query (e.g., 's3', 'ec2').
+        command (str): The command to execute on the AWS service.
+        arguments (dict): The arguments to pass to the command.
+        credentials (dict, optional): The AWS credentials to use for the session. When not provided, boto3 will attempt to use the default credentials.
+        max_retries (int, optional): The maximum number of retries for each request. Defaults to 10.
+        region (str, optional): The AWS region to use for the session. None is supported as not all AWS services require a region.
+        result_path (str, optional): Path to the results. When not provided, the path is the paginator's result key.
+        filters (dict, optional): Filter names and values. Filters are applied by the API when it supports them; otherwise they are applied to each page.
+        fields (list, optional): The keys to keep in each record.
+        rate_limiter (TokenBucket, optional): A rate limiter which is acquired before each request.
+        retry_budget (RetryBudget, optional): The budget retries are withdrawn from. Defaults to the budget for the credentials and region.
+        retry_stats (RetryStats, optional): Receives the retry, sleep, and resume counts.
+        string_pool (StringPool, optional): Pools the repeated strings of each page's records as the page is received.
+
+    Yields:
+        Any: The result extracted from each page.
+    """
+    client, retry_options = _prepare(service, command, credentials, max_retries, region, rate_limiter, retry_budget, retry_stats)
+
+    from CloudHarvestPluginAws.filters import build_filter_arguments
+    from CloudHarvestPluginAws.telemetry import measure_call, timed
+    arguments, filters = build_filter_arguments(client, command, arguments, filters)
+
+    with measure_call(service=service, region=region, command=command) as call:
+        retry_options['call'] = call
+
+        # Commands which cannot be paginated return a single page
+        if not client.can_paginate(command):
+            from CloudHarvestPluginAws.retry import call_with_retries
+            result = call_with_retries(lambda: timed(call, getattr(client, command))(**arguments), **retry_options)
+            yield _finish_records(_extract_result(result, result_path), filters, fields, string_pool)
+
+            return
+
+        for page_iterator, page in _paginate(client, command, arguments, retry_options):
+            # Default to the paginator's result key, which is the list being paginated
+            if result_path is None and page_iterator.result_keys:
+                result_path = page_iterator.result_keys[0].expression
+
+            yield _finish_records(_extract_result(page, result_path), filters, fields, string_pool)
+
+
+async def async_query_aws(service: str,
+                          command: str,
+                          arguments: dict,
+                          credentials: dict = None,
+                          max_retries: int = None,
+                          region: str = None,
+                          result_path: str or list or tuple = None,
+                          filters: dict = None,
+                          fields: list = None,
+                          rate_limiter=None,
+                          retry_budget=None,
+                          retry_stats=None,
+                          string_pool=None):
+    """
+    The asyncio counterpart of `query_aws`, which accepts the same arguments and returns the same result. Requests are
+    sent with aiobotocore, which requires the `async` extra. Pages, backoff delays, and rate limiter waits are awaited,
+    so many requests may be in flight on one event loop.
+
+    Returns:
+        Any: The result of the AWS query.
+    """
+    from CloudHarvestPluginAws.request_cache import async_cached_request, is_cacheable, request_cache_ttl, request_key
+
+    # Identical read-only requests made within the request cache TTL share a single result
+    ttl = request_cache_ttl()
+    if ttl and is_cacheable(command):
+        key = request_key(credentials=credentials, service=service, region=region, command=command, arguments=arguments,
+                          result_path=result_path, filters=filters, fields=fields)
+
+        return await async_cached_request(key, ttl=ttl, loader=lambda: _async_query_aws(service, command, arguments,
+                                                                                        credentials, max_retries, region,
+                                                                                        result_path, filters, fields,
+                                                                                        rate_limiter, retry_budget,
+                                                                                        retry_stats, string_pool))
+
+    return await _async_query_aws(service, command, arguments, credentials, max_retries, region, result_path, filters,
+                                  fields, rate_limiter, retry_budget, retry_stats, string_pool)
+
+
+async def _async_query_aws(service, command, arguments, credentials, max_retries, region, result_path, filters, fields,
+                           rate_limiter, retry_budget, retry_stats, string_pool):
+    """
+    Executes a request for `async_query_aws`.
+    """
+    client, retry_options = await _async_prepare(service, command, credentials, max_retries, region, rate_limiter,
+                                                 retry_budget, retry_stats)
+
+    from CloudHarvestPluginAws.filters import build_filter_arguments
+    from CloudHarvestPluginAws.telemetry import async_timed, measure_call
+    arguments, filters = build_filter_arguments(client, command, arguments, filters)
+
+    with measure_call(service=service, region=region, command=command) as call:
+        retry_options['call'] = call
+
+        # Pages are combined the same way as `query_aws`
+        if client.can_paginate(command):
+            complete_result = {}
+            page_iterator = None
+
+            async for page_iterator, page in _async_paginate(client, command, arguments, retry_options):
+                _merge_page(complete_result, page_iterator, page,
+                            transform=lambda records: _finish_records(records, filters, fields, string_pool))
+
+            return _extract_result(_finish_full_result(complete_result, page_iterator), result_path)
+
+        from CloudHarvestPluginAws.retry import async_call_with_retries
+        result = await async_call_with_retries(lambda: async_timed(call, getattr(client, command))(**arguments), **retry_options)
+
+    return _finish_records(_extract_result(result, result_path), filters, fields, string_pool)
+
+
+async def async_query_aws_pages(service: str,
+                                command: str,
+                                arguments: dict,
+                                credentials: dict = None,
+                                max_retries: int = None,
+                                region: str = None,
+                                result_path: str or list or tuple = None,
+                                filters: dict = None,
+                                fields: list = None,
+                                rate_limiter=None,
+                                retry_budget=None,
+                                retry_stats=None,
+                                string_pool=None):
+    """
+    The asyncio counterpart of `query_aws_pages`, which accepts the same arguments. Requests are sent with aiobotocore,
+    which requires the `async` extra.
+
+    Yields:
+        Any: The result extracted from each page.
+    """
+    client, retry_options = await _async_prepare(service, command, credentials, max_retries, region, rate_limiter,
+                                                 retry_budget, retry_stats)
+
+    from CloudHarvestPluginAws.filters import build_filter_arguments
+    from CloudHarvestPluginAws.telemetry import async_timed, measure_call
+    arguments, filters = build_filter_arguments(client, command, arguments, filters)
+
+    with measure_call(service=service, region=region, command=command) as call:
+        retry_options['call'] = call
+
+        # Commands which cannot be paginated return a single page
+        if not client.can_paginate(command):
+            from CloudHarvestPluginAws.retry import async_call_with_retries
+            result = await async_call_with_retries(lambda: async_timed(call, getattr(client, command))(**arguments), **retry_options)
+            yield _finish_records(_extract_result(result, result_path), filters, fields, string_pool)
+
+            return
+
+        async for page_iterator, page in _async_paginate(client, command, arguments, retry_options):
+            # Default to the paginator's result key, which is the list being paginated
+            if result_path is None and page_iterator.result_keys:
+                result_path = page_iterator.result_keys[0].expression
+
+            yield _finish_records(_extract_result(page, result_path), filters, fields, string_pool)
+
+
+def _prepare(service, command, credentials, max_retries, region, rate_limiter, retry_budget, retry_stats) -> tuple:
+    """
+    Retrieves the pooled client and builds the keyword arguments for `call_with_retries`.
+    """
+    from CloudHarvestPluginAws.clients import get_client
+
+    # Retrieve a pooled client for the specified service in the specified region
+    client = get_client(service=service, region=region, credentials=credentials or {})
+
+    return client, _retry_options(client, service, command, credentials, max_retries, region, rate_limiter, retry_budget, retry_stats)
+
+
+async def _async_prepare(service, command, credentials, max_retries, region, rate_limiter, retry_budget, retry_stats) -> tuple:
+    """
+    Retrieves the aiobotocore client for the running event loop and builds the keyword arguments for
+    `async_call_with_retries`.
+    """
+    from CloudHarvestPluginAws.aio import get_client
+
+    client = await get_client(service=service, region=region, credentials=credentials or {})
+
+    return client, _retry_options(client, service, command, credentials, max_retries, region, rate_limiter, retry_budget, retry_stats)
+
+
+def _retry_options(client, service, command, credentials, max_retries, region, rate_limiter, retry_budget, retry_stats) -> dict:
+    from CloudHarvestPluginAws.clients import credentials_identity
+    from CloudHarvestPluginAws.retry import get_retry_budget
 
     # Make sure the command exists in the client before making any attempts
     if not hasattr(client, command):
         raise Exception(f'Command `{command}` not found in service `{service}`')
 
-    # Initialize the result dictionary
-    result = {}
+    return {
+        'max_retries': 10 if max_retries is None else max_retries,
+        'retry_budget': retry_budget or get_retry_budget(account=credentials_identity(credentials), region=region),
+        'rate_limiter': rate_limiter,
+        'stats': retry_stats
+    }
+
+
+def _paginate(client, command: str, arguments: dict, retry_options: dict):
+    """
+    Yields a (page_iterator, page) tuple for each page of a paginated command. Each page request is retried on its own;
+    when a page fails with a retryable error, pagination resumes from the token of the last page received rather than
+    starting again from the first page.
+    """
+    from CloudHarvestPluginAws.retry import call_with_retries
+
+    cursor = _PageCursor(client, command, arguments, stats=retry_options.get('stats'), call=retry_options.get('call'))
+
+    while True:
+        page = call_with_retries(cursor.next_page, **retry_options)
+
+        if page is None:
+            return
+
+        yield cursor.page_iterator, page
+
+        cursor.advance(page)
+
+
+async def _async_paginate(client, command: str, arguments: dict, retry_options: dict):
+    """
+    The asyncio counterpart of `_paginate`.
+    """
+    from CloudHarvestPluginAws.retry import async_call_with_retries
+
+    cursor = _AsyncPageCursor(client, command, arguments, stats=retry_options.get('stats'), call=retry_options.get('call'))
 
-    # Start a loop to execute the command
     while True:
-        # Increment the attempt counter
-        attempt += 1
+        page = await async_call_with_retries(cursor.next_page, **retry_options)
+
+        if page is None:
+            return
+
+        yield cursor.page_iterator, page
+
+        cursor.advance(page)
+
+
+class _PageCursor:
+    def __init__(self, client, command: str, arguments: dict, stats=None, call=None):
+        """
+        Tracks the position of a paginated command so a failed page can be requested again from the token of the last
+        page received. When provided, `call` receives the latency and size of each page.
+        """
+        self.paginator = client.get_paginator(command)
+        self.arguments = arguments
+        self.stats = stats
+        self.call = call
+
+        self.page_arguments = dict(arguments)
+        self.page_iterator = None
+        self.pages = None
+        self.received = 0
+
+    def next_page(self):
+        """
+        Requests the next page, returning None when there are no more pages.
+        """
+        if self.pages is None:
+            self.pages = iter(self._restart())
+
+        from time import perf_counter
+        started = perf_counter()
 
         try:
-            # If the maximum number of retries is exceeded, raise an exception
-            if attempt > max_retries:
-                raise Exception('Max retries exceeded')
+            page = next(self.pages, None)
 
-            # If the command can be paginated, get a paginator and build the full result
-            if client.can_paginate(command):
-                paginator = client.get_paginator(command)
-                result = paginator.paginate(**arguments).build_full_result()
+        except Exception:
+            self.pages = None
+            raise
 
-            # Otherwise, execute the command directly
-            else:
-                result = getattr(client, command)(**arguments)
+        return self._received(page, perf_counter() - started)
 
-            # Break the loop if the command was executed successfully
-            break
+    def advance(self, page: dict) -> None:
+        """
+        Remembers where to resume from should the next page fail. botocore does not expose the next token publicly.
+        """
+        self.received += 1
 
-        # If a ClientError is raised, handle it
-        except ClientError as e:
-            # If the error is due to throttling, sleep for a while and then retry
-            if any(error_code in e.response['Error']['Code']
-                   for error_code in ('Throttling', 'TooManyRequestsException')):
-                from time import sleep
-                sleep(2 * attempt)
+        next_token = self.page_iterator._get_next_token(page)
+        self.page_arguments = dict(self.arguments) | {k: v for k, v in next_token.items() if v is not None}
 
-            # If the error is due to any other reason, raise it
-            else:
-                raise e
+    def _restart(self):
+        """
+        Starts a page iterator from the last token received. A page iterator cannot be used after it raises.
+        """
+        if self.received and self.stats:
+            self.stats.record_resume()
+
+        self.page_iterator = self.paginator.paginate(**self.page_arguments)
+
+        return self.page_iterator
+
+    def _received(self, page, seconds: float):
+        if self.call and page is not None:
+            self.call.record_page(seconds, page)
+
+        return page
+
+
+class _AsyncPageCursor(_PageCursor):
+    async def next_page(self):
+        """
+        The asyncio counterpart of `_PageCursor.next_page`.
+        """
+        if self.pages is None:
+            self.pages = aiter(self._restart())
+
+        from time import perf_counter
+        started = perf_counter()
+
+        try:
+            page = await anext(self.pages, None)
+
+        except Exception:
+            self.pages = None
+            raise
+
+        return self._received(page, perf_counter() - started)
+
+
+def _build_full_result(pages, transform=None) -> dict:
+    """
+    Combines the pages yielded by `_paginate` into a single response. This mirrors botocore's
+    `PageIterator.build_full_result()`, which cannot be used because it restarts from the first page after an error.
+    When provided, `transform` is applied to each page's list of results before it is combined.
+    """
+    complete_result = {}
+    page_iterator = None
+
+    for page_iterator, page in pages:
+        _merge_page(complete_result, page_iterator, page, transform)
+
+    return _finish_full_result(complete_result, page_iterator)
+
+
+def _merge_page(complete_result: dict, page_iterator, page: dict, transform=None) -> None:
+    """
+    Adds one page to the result being built by `_build_full_result`.
+    """
+    from botocore.utils import set_value_from_jmespath
+
+    for result_expression in page_iterator.result_keys:
+        result_value = result_expression.search(page)
+
+        if result_value is None:
+            continue
+
+        if transform and isinstance(result_value, list):
+            result_value = transform(result_value)
+
+        existing_value = result_expression.search(complete_result)
+
+        if existing_value is None:
+            set_value_from_jmespath(complete_result, result_expression.expression, result_value)
+
+        elif isinstance(result_value, list):
+            existing_value.extend(result_value)
 
-    result = WalkableDict(result)
+        elif isinstance(result_value, (int, float, str)):
+            set_value_from_jmespath(complete_result, result_expression.expression, existing_value + result_value)
+
+
+def _finish_full_result(complete_result: dict, page_iterator) -> dict:
+    from botocore.utils import merge_dicts
+
+    if page_iterator is not None:
+        merge_dicts(complete_result, page_iterator.non_aggregate_part)
+
+    return complete_result
+
+
+def _extract_result(response: dict, result_path: str or list or tuple = None):
+    """
+    Extracts the result from a boto3 response.
+
+    Arguments
+        response (dict): The boto3 response.
+        result_path (str, optional): Path to the results. When not provided, the path is the first key that is not 'Marker' or 'NextToken'.
+
+    Returns:
+        Any: The extracted result.
+    """
+    result = response
+
+    # A top-level key is read directly; wrapping the response in a WalkableDict would copy it
+    if isinstance(result_path, str) and '.' not in result_path and isinstance(response, dict):
+        result = response.get(result_path)
 
     # If a result key is specified, extract the result using the key
-    if isinstance(result_path, str):
-        result = result.walk(result_path)
+    elif isinstance(result_path, str):
+        result = WalkableDict(response).walk(result_path)
 
     elif isinstance(result_path, (list, tuple)):
+        walkable = WalkableDict(response)
         result = {
-            path: result.walk(path)
+            path: walkable.walk(path)
             for path in result_path
         }
 
     # Otherwise, extract the result using the first key that is not 'Marker' or 'NextToken'
     else:
-        for key in result.keys():
+        for key in response.keys():
             if key in ['Marker', 'NextToken']:
                 continue
 
             else:
-                result = result[key]
+                result = response[key]
                 if isinstance(result, dict):
                     result = WalkableDict(result)
 
                 break
 
     return result
+
+
+def _finish_records(result, filters: dict, fields: list, string_pool=None):
+    """
+    Applies the filters and fields to a page's records, then pools their repeated strings.
+    """
+    from CloudHarvestPluginAws.filters import apply_filters_and_fields
+
+    result = apply_filters_and_fields(result, filters, fields)
+
+    if string_pool is not None:
+        string_pool.record(result)
+
+    return result
+
+
+def _flatten(results) -> list:
+    """
+    Combines the results of each item into a single list.
+    """
+    result = []
+    for item_result in results:
+        if isinstance(item_result, list):
+            result.extend(item_result)
+
+        else:
+            result.append(item_result)
+
+    return result
+
+
+def _resolve_item_references(value, item):
+    """
+    Replaces strings beginning with 'each.' with the corresponding value from the item. Dictionaries and lists are
+    resolved recursively.
+
+    Arguments
+        value (Any): The value to resolve.
+        item (Any): The item the references are resolved against.
+
+    Returns:
+        Any: The resolved value.
+    """
+    if isinstance(value, dict):
+        return {k: _resolve_item_references(v, item) for k, v in value.items()}
+
+    elif isinstance(value, list):
+        return [_resolve_item_references(v, item) for v in value]
+
+    elif isinstance(value, str) and value.startswith('each.'):
+        return WalkableDict(item).walk(value[len('each.'):]) if isinstance(item, dict) else None
+
+    return value
@@ -0,0 +1,92 @@
+from CloudHarvestCorePluginManager.decorators import register_definition
+from CloudHarvestPluginAws.tasks.aws import AwsTask
+from CloudHarvestPluginAws.telemetry import bind, tagged
+
+
+@register_definition(name='aws_rds_logs', category='task')
+class AwsRdsLogsTask(AwsTask):
+    def __init__(self,
+                 files: list = None,
+                 file: dict = None,
+                 compress: bool = False,
+                 include_text: bool = False,
+                 max_workers: int = None,
+                 *args,
+                 **kwargs):
+        """
+        Downloads RDS log files to a local spool directory, writing each portion to disk as it is received. The result is
+        a list of handles describing each file rather than the text of the files.
+
+        Args:
+            files (list, optional): A list of dictionaries with the 'DBInstanceIdentifier' and 'LogFileName' keys.
+            file (dict, optional): A single dictionary with the 'DBInstanceIdentifier' and 'LogFileName' keys. The result is
+                its handle instead of a list. Either `files` or `file` is required.
+            compress (bool, optional): When True, the spool files are gzip compressed. Defaults to False.
+            include_text (bool, optional): When True, the text of each file is added to its handle under the 'Log' key and the
+                spool file is removed. Use this when the result leaves the worker, such as in reports. Defaults to False.
+            max_workers (int, optional): The maximum number of concurrent downloads. Defaults to `platforms.aws.fan_out.max_workers` or 8.
+                Downloads of the same instance are also limited by `platforms.aws.rds_logs.max_concurrent_per_instance`.
+
+            All other AwsTask arguments, such as `max_retries` and `rate_limit`, are supported.
+        """
+        kwargs.setdefault('command', 'download_db_log_file_portion')
+        kwargs.setdefault('service', 'rds')
+        kwargs.setdefault('include_metadata', False)
+
+        super().__init__(*args, **kwargs)
+
+        self.file = file
+        self.files = [file] if file else files if isinstance(files, list) else [files] if files else []
+        self.compress = compress
+        self.include_text = include_text
+        self.max_workers = max_workers
+
+    @tagged
+    def method(self):
+        """
+        Downloads the log files and stores their handles.
+
+        Returns:
+            self: Returns the instance of the AwsRdsLogsTask.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from CloudHarvestCoreTasks.environment import Environment
+        from CloudHarvestPluginAws.credentials import get_profile
+        from CloudHarvestPluginAws.logs import download_log_file, download_log_text
+        from CloudHarvestPluginAws.rate_limits import get_rate_limiter
+        from CloudHarvestPluginAws.retry import get_retry_budget
+
+        profile = get_profile(account_number=self.account, role_name=self.role)
+
+        if not profile:
+            raise Exception(f'No profile found for account {self.account} and role {self.role}')
+
+        self.account_alias = profile.account_alias
+
+        options = {
+            'region': self.region,
+            'account': self.account,
+            'credentials': profile.credentials,
+            'compress': self.compress,
+            'max_retries': self.max_retries,
+            'rate_limiter': get_rate_limiter(service=self.service, region=self.region, account=self.account, rate=self.rate_limit),
+            'retry_budget': get_retry_budget(account=self.account, region=self.region),
+            'retry_stats': self.retry_stats
+        }
+
+        def download(file: dict) -> dict:
+            # Spool files only exist on this worker, so the text is returned instead of the path
+            download_file = download_log_text if self.include_text else download_log_file
+            handle = download_file(instance=file['DBInstanceIdentifier'], log_file=file['LogFileName'], **options)
+
+            return self._add_metadata(handle) if self.include_metadata else handle
+
+        max_workers = int(self.max_workers or Environment.get('platforms.aws.fan_out.max_workers') or 8)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(self.files) or 1))) as executor:
+            self.result = list(executor.map(bind(download), self.files))
+
+        if self.file:
+            self.result = self.result[0]
+
+        return self
@@ -0,0 +1,71 @@
+from CloudHarvestCorePluginManager.decorators import register_definition
+from CloudHarvestPluginAws.tasks.aws import AwsTask
+from CloudHarvestPluginAws.telemetry import tagged
+
+
+@register_definition(name='aws_s3_buckets', category='task')
+class AwsS3BucketsTask(AwsTask):
+    def __init__(self,
+                 records: list,
+                 details: list or dict = None,
+                 max_workers: int = None,
+                 *args,
+                 **kwargs):
+        """
+        Adds per-bucket details, such as encryption and versioning, to `list_buckets` records. Each call is made in the
+        bucket's home region with a pooled regional client, so no call is redirected.
+
+        Args:
+            records (list): The `list_buckets` records, such as `var.buckets`.
+            details (list or dict, optional): The details to add, such as 'Encryption' or 'Versioning'. Defaults to
+                `CloudHarvestPluginAws.s3.DEFAULT_DETAILS`. A dictionary of names and specifications adds other commands. Keys:
+                command (str): The command, such as 'get_bucket_website'.
+                arguments (dict, optional): Arguments added to the `Bucket` argument.
+                result_path (str, optional): The path to the detail in the response.
+                empty (Any, optional): The value stored when the bucket does not have the configuration. Defaults to None.
+            max_workers (int, optional): The maximum number of concurrent calls. Defaults to `platforms.aws.fan_out.max_workers` or 8.
+                Calls are also limited to `rate_limit` requests per second in each region.
+
+            All other AwsTask arguments, such as `max_retries` and `rate_limit`, are supported.
+        """
+        kwargs.setdefault('command', 'list_buckets')
+        kwargs.setdefault('service', 's3')
+        kwargs.setdefault('global_service', True)
+        kwargs.setdefault('include_metadata', False)
+
+        super().__init__(*args, **kwargs)
+
+        self.records = records if isinstance(records, list) else [records] if isinstance(records, dict) else []
+        self.details = details
+        self.max_workers = max_workers
+
+    @tagged
+    def method(self):
+        """
+        Retrieves the details of every bucket and adds them to the records.
+
+        Returns:
+            self: Returns the instance of the AwsS3BucketsTask.
+        """
+        from CloudHarvestCoreTasks.environment import Environment
+        from CloudHarvestPluginAws.credentials import get_profile
+        from CloudHarvestPluginAws.s3 import enrich_buckets
+
+        profile = get_profile(account_number=self.account, role_name=self.role)
+
+        if not profile:
+            raise Exception(f'No profile found for account {self.account} and role {self.role}')
+
+        self.account_alias = profile.account_alias
+
+        # Retry budgets are taken per region by query_aws
+        self.result = enrich_buckets(self.records,
+                                     details=self.details,
+                                     account=self.account,
+                                     credentials=profile.credentials,
+                                     max_workers=int(self.max_workers or Environment.get('platforms.aws.fan_out.max_workers') or 8),
+                                     rate_limit=self.rate_limit,
+                                     max_retries=self.max_retries,
+                                     retry_stats=self.retry_stats)
+
+        return self
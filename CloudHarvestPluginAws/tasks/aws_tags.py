@@ -0,0 +1,128 @@
+from logging import getLogger
+
+from CloudHarvestCorePluginManager.decorators import register_definition
+from CloudHarvestPluginAws.tasks.aws import AwsTask, query_aws, _resolve_item_references
+from CloudHarvestPluginAws.telemetry import bind, tagged
+
+logger = getLogger('harvest')
+
+
+@register_definition(name='aws_tags', category='task')
+class AwsTagsTask(AwsTask):
+    def __init__(self,
+                 records: list,
+                 arn_key: str,
+                 resource_types: list = None,
+                 fallback: dict = None,
+                 target_key: str = 'Tags',
+                 *args,
+                 **kwargs):
+        """
+        Adds tags to records using the Resource Groups Tagging API. The tags of every resource are retrieved with a
+        handful of paginated `get_resources` calls instead of one call per resource.
+
+        Args:
+            records (list): The records to add tags to, such as `var.result`.
+            arn_key (str): The key containing each record's ARN, such as 'QueueArn'.
+            resource_types (list, optional): Tagging API resource type filters, such as 'sqs' or 'kms:key'.
+            fallback (dict, optional): A per-resource tag command used when the Tagging API cannot be used. Keys:
+                command (str): The command, such as 'list_queue_tags'.
+                arguments (dict, optional): The command arguments. Values beginning with 'each.' are resolved against the record.
+                result_path (str, optional): The path to the tags in the response. Defaults to 'Tags'.
+                name_key (str, optional): The tag name key when tags are a list. Defaults to 'Key'.
+                value_key (str, optional): The tag value key when tags are a list. Defaults to 'Value'.
+            target_key (str, optional): The key the tags are stored under. Defaults to 'Tags'.
+
+            All other AwsTask arguments, such as `max_retries` and `rate_limit`, are supported.
+        """
+        kwargs.setdefault('command', 'get_resources')
+        kwargs.setdefault('include_metadata', False)
+
+        super().__init__(*args, **kwargs)
+
+        self.records = records
+        self.arn_key = arn_key
+        self.resource_types = resource_types or []
+        self.fallback = fallback or {}
+        self.target_key = target_key
+
+    @tagged
+    def method(self):
+        """
+        Retrieves the tags and merges them into the records.
+
+        Returns:
+            self: Returns the instance of the AwsTagsTask.
+        """
+        from CloudHarvestCoreTasks.dataset import WalkableDict
+        from CloudHarvestPluginAws.credentials import get_profile
+        from CloudHarvestPluginAws.rate_limits import get_rate_limiter
+        from CloudHarvestPluginAws.retry import get_retry_budget
+        from CloudHarvestPluginAws.tagging import get_tag_index, merge_tags
+
+        profile = get_profile(account_number=self.account, role_name=self.role)
+
+        if not profile:
+            raise Exception(f'No profile found for account {self.account} and role {self.role}')
+
+        self.account_alias = profile.account_alias
+
+        records = self.records if isinstance(self.records, list) else [self.records] if isinstance(self.records, dict) else []
+        arns = [arn for arn in (WalkableDict(record).walk(self.arn_key) for record in records if isinstance(record, dict)) if arn]
+
+        options = {
+            'credentials': profile.credentials,
+            'max_retries': self.max_retries,
+            'retry_budget': get_retry_budget(account=self.account, region=self.region),
+            'retry_stats': self.retry_stats
+        }
+
+        try:
+            rate_limiter = get_rate_limiter(service='resourcegroupstaggingapi', region=self.region, account=self.account)
+            index = get_tag_index(region=self.region,
+                                  resource_types=self.resource_types,
+                                  arns=arns,
+                                  rate_limiter=rate_limiter,
+                                  **options) if arns else {}
+
+        except Exception as e:
+            if not self.fallback:
+                raise e
+
+            logger.warning(f'{self.name}: the Resource Groups Tagging API is unavailable; retrieving tags per resource: {e}')
+            index = self._fallback_index(records=records, options=options)
+
+        self.result = merge_tags(records, index, arn_key=self.arn_key, target_key=self.target_key)
+
+        return self
+
+    def _fallback_index(self, records: list, options: dict) -> dict:
+        """
+        Retrieves the tags of each record with the per-resource `fallback` command using a bounded thread pool.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from CloudHarvestCoreTasks.dataset import WalkableDict
+        from CloudHarvestCoreTasks.environment import Environment
+        from CloudHarvestPluginAws.rate_limits import get_rate_limiter
+        from CloudHarvestPluginAws.tagging import tags_to_dict
+
+        rate_limiter = get_rate_limiter(service=self.service, region=self.region, account=self.account, rate=self.rate_limit)
+        max_workers = int(Environment.get('platforms.aws.fan_out.max_workers') or 8)
+
+        def call(record) -> tuple:
+            tags = query_aws(service=self.service,
+                             region=self.region,
+                             command=self.fallback['command'],
+                             arguments=_resolve_item_references(self.fallback.get('arguments') or {}, record),
+                             result_path=self.fallback.get('result_path') or 'Tags',
+                             rate_limiter=rate_limiter,
+                             **options)
+
+            return WalkableDict(record).walk(self.arn_key), tags_to_dict(tags,
+                                                                         name_key=self.fallback.get('name_key') or 'Key',
+                                                                         value_key=self.fallback.get('value_key') or 'Value')
+
+        records = [record for record in records if isinstance(record, dict)]
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(records) or 1))) as executor:
+            return dict(executor.map(bind(call), records))
@@ -0,0 +1,452 @@
+"""
+This library records timing and counters for every AWS call and credential acquisition. Each call is tagged with the
+account, region, service, command, and template, and reports its duration, the latency of each page, the number of pages
+and response bytes, and the retries and throttle sleeps it needed. Finished events are passed to every sink.
+
+Sinks:
+- memory: Aggregates events in-process, including latency histograms. Read with `snapshot()` or the `/aws/metrics` route.
+- json: Appends each event as a line of JSON to `platforms.aws.telemetry.json_path`.
+
+Additional sinks may be registered with `add_sink()`; a sink is any object with an `emit(event: dict)` method.
+
+Configuration:
+- platforms.aws.telemetry.enabled: When false, no events are recorded. Defaults to true.
+- platforms.aws.telemetry.sinks: The sinks to create. Defaults to ['memory'].
+- platforms.aws.telemetry.json_path: The file used by the json sink. Defaults to './harvest-aws-telemetry.jsonl'.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger('harvest')
+
+# Upper bounds of the latency histogram buckets, in milliseconds. The last bucket has no upper bound.
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+DEFAULT_JSON_PATH = './harvest-aws-telemetry.jsonl'
+
+CALL_TAGS = ('account', 'region', 'service', 'command', 'template')
+CREDENTIAL_TAGS = ('account', 'role', 'source')
+
+# Tags applied to the events recorded by the current task, such as the account and template
+_tags = ContextVar('harvest_aws_telemetry_tags', default={})
+
+
+class Telemetry:
+    sinks = None
+    lock = Lock()
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS_MS):
+        """
+        Counts observations in fixed latency buckets.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+
+    def observe(self, milliseconds: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if milliseconds <= bound:
+                self.counts[index] += 1
+                return
+
+        self.counts[-1] += 1
+
+    def as_dict(self) -> dict:
+        labels = [f'<={bound}ms' for bound in self.buckets] + [f'>{self.buckets[-1]}ms']
+        return dict(zip(labels, self.counts))
+
+
+class MemorySink:
+    def __init__(self):
+        """
+        Aggregates events in-process by their kind and tags.
+        """
+        self.lock = Lock()
+        self.metrics = {}
+
+    def emit(self, event: dict) -> None:
+        key = (event['kind'],) + tuple(event.get(tag) for tag in _tag_names(event['kind']))
+
+        with self.lock:
+            metric = self.metrics.get(key)
+
+            if metric is None:
+                metric = self.metrics[key] = {
+                    'kind': event['kind'],
+                    **{tag: event.get(tag) for tag in _tag_names(event['kind'])},
+                    'count': 0,
+                    'errors': 0,
+                    'seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'pages': 0,
+                    'bytes': 0,
+                    'retries': 0,
+                    'throttles': 0,
+                    'sleep_seconds': 0.0,
+                    'latency': Histogram(),
+                    'page_latency': Histogram()
+                }
+
+            metric['count'] += 1
+            metric['errors'] += 1 if event.get('error') else 0
+            metric['seconds'] += event['seconds']
+            metric['max_seconds'] = max(metric['max_seconds'], event['seconds'])
+            metric['latency'].observe(event['seconds'] * 1000)
+
+            for counter in ('pages', 'bytes', 'retries', 'throttles', 'sleep_seconds'):
+                metric[counter] += event.get(counter) or 0
+
+            for seconds in event.get('page_seconds') or []:
+                metric['page_latency'].observe(seconds * 1000)
+
+    def snapshot(self) -> list:
+        with self.lock:
+            return [
+                metric | {
+                    'seconds': round(metric['seconds'], 6),
+                    'max_seconds': round(metric['max_seconds'], 6),
+                    'sleep_seconds': round(metric['sleep_seconds'], 6),
+                    'latency': metric['latency'].as_dict(),
+                    'page_latency': metric['page_latency'].as_dict()
+                }
+                for metric in self.metrics.values()
+            ]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.metrics.clear()
+
+
+class JsonSink:
+    def __init__(self, path: str = DEFAULT_JSON_PATH):
+        """
+        Appends each event to a file as a line of JSON.
+        """
+        from os.path import abspath, expanduser
+
+        self.path = abspath(expanduser(path))
+        self.lock = Lock()
+
+    def emit(self, event: dict) -> None:
+        from json import dumps
+
+        line = dumps(event, default=str)
+
+        with self.lock:
+            with open(self.path, 'a') as stream:
+                stream.write(line + '\n')
+
+
+class Call:
+    def __init__(self, service: str, region: str, command: str):
+        """
+        The measurements of one `query_aws` call. Pages, response bytes, and retries are added as they happen.
+        """
+        from time import perf_counter
+
+        self.event = _tags.get() | {
+            'kind': 'call',
+            'region': region,
+            'service': service,
+            'command': command,
+            'pages': 0,
+            'bytes': 0,
+            'retries': 0,
+            'throttles': 0,
+            'sleep_seconds': 0.0,
+            'page_seconds': []
+        }
+
+        self.lock = Lock()
+        self.started = perf_counter()
+
+    def record_page(self, seconds: float, response) -> None:
+        """
+        Records a response received after `seconds`.
+        """
+        size = 0
+        if isinstance(response, dict):
+            size = int(response.get('ResponseMetadata', {}).get('HTTPHeaders', {}).get('content-length') or 0)
+
+        with self.lock:
+            self.event['pages'] += 1
+            self.event['bytes'] += size
+            self.event['page_seconds'].append(round(seconds, 6))
+
+    def record_retry(self, kind: str, delay: float) -> None:
+        with self.lock:
+            self.event['retries'] += 1
+            self.event['sleep_seconds'] += delay
+
+            if kind == 'throttle':
+                self.event['throttles'] += 1
+
+    def finish(self, error: Exception = None) -> None:
+        from time import perf_counter
+
+        self.event['seconds'] = round(perf_counter() - self.started, 6)
+        self.event['error'] = type(error).__name__ if error else None
+
+        emit(self.event)
+
+
+def enabled() -> bool:
+    from CloudHarvestCoreTasks.environment import Environment
+    return Environment.get('platforms.aws.telemetry.enabled') is not False
+
+
+def start_call(service: str, region: str, command: str) -> Call or None:
+    """
+    Starts measuring a call, or returns None when telemetry is disabled.
+    """
+    return Call(service=service, region=region, command=command) if enabled() else None
+
+
+@contextmanager
+def measure_call(service: str, region: str, command: str):
+    """
+    Measures a call made within the block and yields its Call, or None when telemetry is disabled. The event is emitted
+    when the block exits, including when a generator using it is closed early.
+    """
+    call = start_call(service=service, region=region, command=command)
+
+    if call is None:
+        yield None
+        return
+
+    error = None
+
+    try:
+        yield call
+
+    except Exception as e:
+        error = e
+        raise
+
+    finally:
+        call.finish(error)
+
+
+def timed(call: Call or None, function):
+    """
+    Returns a function which records the duration and response of each call to `function` as a page of `call`.
+    """
+    if call is None:
+        return function
+
+    def measured(*args, **kwargs):
+        from time import perf_counter
+
+        started = perf_counter()
+        response = function(*args, **kwargs)
+        call.record_page(perf_counter() - started, response)
+
+        return response
+
+    return measured
+
+
+def async_timed(call: Call or None, function):
+    """
+    The asyncio counterpart of `timed`, for a function which returns an awaitable, such as an aiobotocore client method.
+    """
+    if call is None:
+        return function
+
+    async def measured(*args, **kwargs):
+        from time import perf_counter
+
+        started = perf_counter()
+        response = await function(*args, **kwargs)
+        call.record_page(perf_counter() - started, response)
+
+        return response
+
+    return measured
+
+
+@contextmanager
+def measure(kind: str, **tags):
+    """
+    Measures the duration of a block, such as acquiring credentials, and emits it as an event of `kind`. The block
+    receives a dictionary which may be used to add tags discovered while it runs, such as where a profile came from.
+    """
+    from time import perf_counter
+
+    event = _tags.get() | tags | {'kind': kind}
+
+    if not enabled():
+        yield event
+        return
+
+    started = perf_counter()
+    error = None
+
+    try:
+        yield event
+
+    except Exception as e:
+        error = e
+        raise
+
+    finally:
+        emit(event | {'seconds': round(perf_counter() - started, 6), 'error': type(error).__name__ if error else None})
+
+
+@contextmanager
+def tags(**values):
+    """
+    Applies tags, such as the account and template, to every event recorded within the block.
+    """
+    token = _tags.set(_tags.get() | {k: v for k, v in values.items() if v is not None})
+
+    try:
+        yield
+
+    finally:
+        _tags.reset(token)
+
+
+def tagged(method):
+    """
+    Decorates a task's `method` (or `async_method`) so the events it records are tagged with the task's account and
+    template.
+    """
+    from functools import wraps
+    from inspect import iscoroutinefunction
+
+    def task_tags(task) -> dict:
+        return {'account': task.account, 'template': getattr(task.task_chain, 'name', None)}
+
+    if iscoroutinefunction(method):
+        @wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            with tags(**task_tags(self)):
+                return await method(self, *args, **kwargs)
+
+        return async_wrapper
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with tags(**task_tags(self)):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def bind(function):
+    """
+    Returns a function which runs `function` with the current tags. Used for work submitted to a thread pool, where the
+    tags of the submitting thread would otherwise be lost.
+    """
+    from contextvars import copy_context
+
+    context = copy_context()
+
+    def bound(*args, **kwargs):
+        # A context may only be entered by one thread at a time
+        return context.copy().run(function, *args, **kwargs)
+
+    return bound
+
+
+def emit(event: dict) -> None:
+    """
+    Passes an event to every sink. A failing sink is logged and does not affect the call being measured.
+    """
+    for sink in get_sinks():
+        try:
+            sink.emit(event)
+
+        except Exception as e:
+            logger.debug(f'telemetry sink {type(sink).__name__} failed: {e}')
+
+
+def get_sinks() -> list:
+    """
+    Returns the sinks, creating the configured sinks if they do not exist yet.
+    """
+    if Telemetry.sinks is None:
+        with Telemetry.lock:
+            if Telemetry.sinks is None:
+                from CloudHarvestCoreTasks.environment import Environment
+
+                sinks = []
+                for name in Environment.get('platforms.aws.telemetry.sinks') or ['memory']:
+                    if name == 'memory':
+                        sinks.append(MemorySink())
+
+                    elif name == 'json':
+                        sinks.append(JsonSink(Environment.get('platforms.aws.telemetry.json_path') or DEFAULT_JSON_PATH))
+
+                    else:
+                        logger.warning(f'unknown telemetry sink `{name}`')
+
+                Telemetry.sinks = sinks
+
+    return Telemetry.sinks
+
+
+def add_sink(sink) -> None:
+    """
+    Registers an additional sink.
+    """
+    sinks = get_sinks()
+
+    with Telemetry.lock:
+        Telemetry.sinks = sinks + [sink]
+
+
+def snapshot(kind: str = None, sort: str = 'seconds', limit: int = None) -> list:
+    """
+    Returns the aggregated metrics of the memory sink.
+
+    Arguments
+        kind (str, optional): Only return metrics of this kind, such as 'call' or 'get_profile'.
+        sort (str, optional): The metric to sort by, descending. Use 'throttles' to find the most throttled APIs.
+        limit (int, optional): The maximum number of metrics to return.
+    """
+    metrics = [
+        metric
+        for sink in get_sinks() if isinstance(sink, MemorySink)
+        for metric in sink.snapshot()
+        if kind is None or metric['kind'] == kind
+    ]
+
+    metrics.sort(key=lambda metric: metric.get(sort) or 0, reverse=True)
+
+    return metrics[:limit] if limit else metrics
+
+
+def export_json(path: str, **kwargs) -> str:
+    """
+    Writes the aggregated metrics to a JSON file. Keyword arguments are passed to `snapshot()`.
+
+    Returns
+        str: The path to the file.
+    """
+    from json import dump
+    from os.path import abspath, expanduser
+
+    path = abspath(expanduser(path))
+
+    with open(path, 'w') as stream:
+        dump(snapshot(**kwargs), stream, default=str, indent=2)
+
+    return path
+
+
+def reset() -> None:
+    """
+    Clears the aggregated metrics.
+    """
+    for sink in get_sinks():
+        if isinstance(sink, MemorySink):
+            sink.clear()
+
+
+def _tag_names(kind: str) -> tuple:
+    return CALL_TAGS if kind == 'call' else CREDENTIAL_TAGS
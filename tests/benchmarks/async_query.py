@@ -0,0 +1,116 @@
+"""
+Compares the thread-based and asyncio backends with many requests in flight at once. Each request is a paginated
+`list_tables` call answered by the local stub endpoint after a simulated API latency.
+
+- threads: `query_aws` with one thread per concurrent request, which is how the thread-based backend reaches the same
+  concurrency.
+- asyncio: `async_query_aws` with every request on one event loop. Requires the `async` extra (aiobotocore).
+
+Each backend runs in its own process, so the stub endpoint and the other backend do not affect its memory or threads.
+
+    python -m tests.benchmarks.async_query [requests] [latency]
+"""
+from time import perf_counter
+
+from tests.benchmarks.endpoint import STUB_CREDENTIALS, stub_endpoint
+
+
+def run_threads(requests: int):
+    from concurrent.futures import ThreadPoolExecutor
+    from CloudHarvestPluginAws.tasks.aws import query_aws
+
+    with ThreadPoolExecutor(max_workers=requests) as executor:
+        futures = [executor.submit(query_aws, 'dynamodb', 'list_tables', {}, credentials=STUB_CREDENTIALS, region='us-east-1')
+                   for _ in range(requests)]
+
+        return [future.result() for future in futures]
+
+
+def run_async(requests: int):
+    from asyncio import gather, run
+    from CloudHarvestPluginAws.aio import close_clients
+    from CloudHarvestPluginAws.tasks.aws import async_query_aws
+
+    async def main():
+        try:
+            return await gather(*(async_query_aws('dynamodb', 'list_tables', {}, credentials=STUB_CREDENTIALS, region='us-east-1')
+                                  for _ in range(requests)))
+
+        finally:
+            await close_clients()
+
+    return run(main())
+
+
+def measure(function, requests: int) -> tuple:
+    """
+    Returns the elapsed seconds, the peak resident memory in MB above the starting point, and the peak number of threads.
+    """
+    from threading import active_count, Event, Thread
+
+    def rss() -> float:
+        # Linux only; the resident set includes the stack of every thread, which tracemalloc does not
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * 4096 / 1024 / 1024
+
+    baseline = rss()
+    peak_rss = baseline
+    peak_threads = active_count()
+    done = Event()
+
+    def sample():
+        nonlocal peak_rss, peak_threads
+        while not done.wait(0.01):
+            peak_rss = max(peak_rss, rss())
+            peak_threads = max(peak_threads, active_count())
+
+    sampler = Thread(target=sample, daemon=True)
+    sampler.start()
+
+    began = perf_counter()
+    function(requests)
+    elapsed = perf_counter() - began
+
+    done.set()
+    sampler.join()
+
+    return elapsed, peak_rss - baseline, peak_threads
+
+
+def run_backend(backend: str, requests: int) -> None:
+    from logging import ERROR, getLogger
+
+    # urllib3 warns each time a thread opens more connections than the pooled client keeps
+    getLogger('urllib3').setLevel(ERROR)
+
+    function = run_threads if backend == 'threads' else run_async
+
+    # Load the service model so client creation is not counted
+    function(1)
+
+    elapsed, peak, threads = measure(function, requests)
+    print(f'{backend:<10}{requests:>10}{elapsed:>10.2f}{requests / elapsed:>10.0f}{peak:>10.1f}{threads:>10}', flush=True)
+
+
+def main(requests: int = 1000, latency: float = 0.5):
+    from os import environ
+    from subprocess import run
+    from sys import executable
+
+    with stub_endpoint(delay=latency) as endpoint_url:
+        print(f'{"backend":<10}{"requests":>10}{"seconds":>10}{"req/s":>10}{"peak MB":>10}{"threads":>10}', flush=True)
+
+        for backend in ('threads', 'asyncio'):
+            run([executable, '-m', 'tests.benchmarks.async_query', str(requests), str(latency), backend],
+                env=environ | {'AWS_ENDPOINT_URL_DYNAMODB': endpoint_url},
+                check=True)
+
+
+if __name__ == '__main__':
+    from sys import argv
+
+    if len(argv) > 3:
+        run_backend(argv[3], int(argv[1]))
+
+    else:
+        main(int(argv[1]) if len(argv) > 1 else 1000, float(argv[2]) if len(argv) > 2 else 0.5)
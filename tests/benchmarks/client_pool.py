@@ -0,0 +1,56 @@
+"""
+Compares the per-call latency of building a new boto3 session and client for every call (the previous behavior of
+`query_aws`) with retrieving a client from the pool in `CloudHarvestPluginAws.clients`.
+
+    python -m tests.benchmarks.client_pool [iterations]
+"""
+from statistics import mean, median
+from time import perf_counter
+
+from tests.benchmarks.endpoint import STUB_CREDENTIALS, stub_endpoint
+
+
+def new_client_per_call(endpoint_url: str):
+    from boto3 import Session
+    client = Session(**STUB_CREDENTIALS).client('dynamodb', region_name='us-east-1', endpoint_url=endpoint_url)
+    return client.list_tables()
+
+
+def pooled_client(endpoint_url: str):
+    from CloudHarvestPluginAws.clients import get_client
+    client = get_client('dynamodb', region='us-east-1', credentials=STUB_CREDENTIALS, endpoint_url=endpoint_url)
+    return client.list_tables()
+
+
+def measure(function, endpoint_url: str, iterations: int) -> list:
+    timings = []
+    for _ in range(iterations):
+        start = perf_counter()
+        function(endpoint_url)
+        timings.append((perf_counter() - start) * 1000)
+
+    return timings
+
+
+def main(iterations: int = 200):
+    with stub_endpoint() as endpoint_url:
+        # Warm both paths so one-time imports are not counted
+        new_client_per_call(endpoint_url)
+        pooled_client(endpoint_url)
+
+        results = {
+            'new client per call': measure(new_client_per_call, endpoint_url, iterations),
+            'pooled client': measure(pooled_client, endpoint_url, iterations),
+        }
+
+    print(f'{"path":<22}{"mean ms":>10}{"median ms":>12}')
+    for name, timings in results.items():
+        print(f'{name:<22}{mean(timings):>10.2f}{median(timings):>12.2f}')
+
+    speedup = mean(results['new client per call']) / mean(results['pooled client'])
+    print(f'pooled clients are {speedup:.1f}x faster per call')
+
+
+if __name__ == '__main__':
+    from sys import argv
+    main(int(argv[1]) if len(argv) > 1 else 200)
@@ -0,0 +1,122 @@
+"""
+Compares the memory held by a large `AwsTask` result with and without the `compact` directive. The records are synthetic
+EBS snapshots decoded from JSON one page at a time, so, as with botocore, every value is a separate string object.
+
+- default: Every record receives its own 'Harvest' metadata dictionary and values.
+- shared: Every record receives its own metadata dictionary, but its values are shared.
+- interned: Shared metadata values, and repeated strings such as states and regions are pooled.
+- columnar: Shared metadata values, pooled strings, and the records are stored as one list per key.
+
+Each mode runs in its own process and reports the memory held by live objects once the result is stored, the growth of
+the resident set, and the seconds spent storing the result. Strings are pooled as each page is received, as `query_aws`
+does, so the duplicates are freed before the next page is decoded. A columnar result is built from the list of records,
+so its savings appear in the live memory, which the process reuses, rather than in the resident set.
+
+    python -m tests.benchmarks.compact_results [records]
+
+The number of records defaults to 500,000. Each process peaks at about 2.5 GB for the default mode.
+"""
+from time import perf_counter
+
+MODES = {
+    'default': None,
+    'shared': {'intern': False},
+    'interned': {'intern': True},
+    'columnar': {'intern': True, 'columnar': True},
+}
+
+PAGE_SIZE = 1000
+
+
+def snapshots(count: int, string_pool=None) -> list:
+    """
+    Returns synthetic snapshots, decoding each page from JSON as botocore does. As in `query_aws`, the strings of each
+    page are pooled as the page is received.
+    """
+    from json import dumps, loads
+
+    states = ('completed', 'pending', 'error')
+    tiers = ('standard', 'archive')
+    regions = ('us-east-1', 'us-west-2', 'eu-west-1')
+
+    records = []
+
+    for start in range(0, count, PAGE_SIZE):
+        page = [
+            {
+                'SnapshotId': f'snap-{index:017x}',
+                'VolumeId': f'vol-{index // 4:017x}',
+                'State': states[index % 3],
+                'Progress': '100%',
+                'OwnerId': '123456789012',
+                'Description': f'Created by CreateImage for ami-{index // 2:017x}',
+                'VolumeSize': 8 * (index % 16 + 1),
+                'Encrypted': index % 2 == 0,
+                'StorageTier': tiers[index % 2],
+                'AvailabilityZone': f'{regions[index % 3]}a',
+                'KmsKeyId': f'arn:aws:kms:{regions[index % 3]}:123456789012:key/shared',
+                'Tags': [{'Key': 'Environment', 'Value': 'production'}, {'Key': 'Team', 'Value': 'platform'}],
+            }
+            for index in range(start, min(count, start + PAGE_SIZE))
+        ]
+
+        page = loads(dumps(page))
+
+        if string_pool is not None:
+            string_pool.record(page)
+
+        records.extend(page)
+
+    return records
+
+
+def rss() -> float:
+    # Linux only
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * 4096 / 1024 / 1024
+
+
+def run_mode(mode: str, count: int) -> None:
+    from gc import collect
+    from tracemalloc import get_traced_memory, start
+    from CloudHarvestPluginAws.tasks import AwsTask
+
+    task = AwsTask(name='benchmark', service='ec2', type='snapshots', account='123456789012', region='us-east-1',
+                   command='describe_snapshots', compact=MODES[mode] if MODES[mode] is not None else False)
+    task.account_alias = 'example'
+
+    collect()
+    baseline = rss()
+    start()
+
+    records = snapshots(count, string_pool=task.string_pool)
+
+    began = perf_counter()
+    task._store_result(records)
+    elapsed = perf_counter() - began
+
+    del records
+    collect()
+
+    live = get_traced_memory()[0] / 1024 / 1024
+    print(f'{mode:<10}{len(task.result):>10}{live:>10.1f}{live * 1024 * 1024 / count:>14.0f}{rss() - baseline:>10.1f}{elapsed:>10.2f}')
+
+
+def main(count: int = 500000):
+    from subprocess import run
+    from sys import executable
+
+    print(f'{"mode":<10}{"records":>10}{"live MB":>10}{"bytes/record":>14}{"RSS MB":>10}{"seconds":>10}', flush=True)
+
+    for mode in MODES:
+        run([executable, '-m', 'tests.benchmarks.compact_results', str(count), mode], check=True)
+
+
+if __name__ == '__main__':
+    from sys import argv
+
+    if len(argv) > 2:
+        run_mode(argv[2], int(argv[1]))
+
+    else:
+        main(int(argv[1]) if len(argv) > 1 else 500000)
@@ -0,0 +1,48 @@
+"""
+Compares writing profiles to the AWS credentials file one at a time with `Profile.write_to_credentials_file()` against
+writing them in a single pass with `write_profiles_to_credentials_file()`.
+
+    python -m tests.benchmarks.credentials_file [profiles]
+"""
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+
+def build_profiles(count: int) -> list:
+    from CloudHarvestPluginAws.credentials import Profile
+
+    profiles = []
+    for index in range(count):
+        profile = Profile(account_number=str(index), role_name='harvest')
+        profile.aws_access_key_id = f'ASIA{index:016d}'
+        profile.aws_secret_access_key = 'x' * 40
+        profile.aws_session_token = 'y' * 400
+        profiles.append(profile)
+
+    return profiles
+
+
+def main(count: int = 1000):
+    from CloudHarvestPluginAws.credentials import write_profiles_to_credentials_file
+
+    profiles = build_profiles(count)
+
+    with TemporaryDirectory() as directory:
+        start = perf_counter()
+        for profile in profiles:
+            profile.write_to_credentials_file(path=f'{directory}/per-profile')
+        per_profile = perf_counter() - start
+
+        start = perf_counter()
+        write_profiles_to_credentials_file(profiles=profiles, path=f'{directory}/bulk')
+        bulk = perf_counter() - start
+
+    print(f'{"path":<14}{"seconds":>10}')
+    print(f'{"per profile":<14}{per_profile:>10.3f}')
+    print(f'{"bulk":<14}{bulk:>10.3f}')
+    print(f'bulk writes are {per_profile / bulk:.0f}x faster for {count} profiles')
+
+
+if __name__ == '__main__':
+    from sys import argv
+    main(int(argv[1]) if len(argv) > 1 else 1000)
@@ -0,0 +1,65 @@
+"""
+Compares the peak memory of downloading an RDS log file with `query_aws`, which joins every portion into one string, against
+`download_log_file()`, which writes each portion to the spool directory as it is received. Responses are served by a
+botocore Stubber so no AWS account is required.
+
+    python -m tests.benchmarks.rds_logs [megabytes]
+"""
+from time import perf_counter
+
+
+def stub_portions(stubber, megabytes: int):
+    portion = ('x' * 1023 + '\n') * 1024
+
+    for index in range(megabytes):
+        stubber.add_response('download_db_log_file_portion',
+                             {'LogFileData': portion, 'Marker': str(index + 1), 'AdditionalDataPending': index < megabytes - 1})
+
+
+def measure(function) -> tuple:
+    from tracemalloc import get_traced_memory, start, stop
+
+    start()
+    began = perf_counter()
+    function()
+    elapsed = perf_counter() - began
+    peak = get_traced_memory()[1]
+    stop()
+
+    return elapsed, peak / 1024 / 1024
+
+
+def main(megabytes: int = 64):
+    from os import remove
+    from botocore.stub import Stubber
+    from CloudHarvestPluginAws.clients import get_client
+    from CloudHarvestPluginAws.logs import download_log_file
+    from CloudHarvestPluginAws.tasks.aws import query_aws
+
+    client = get_client('rds', 'us-east-1')
+    arguments = {'DBInstanceIdentifier': 'db', 'LogFileName': 'error/postgres.log'}
+
+    print(f'{"path":<20}{"megabytes":>10}{"seconds":>10}{"peak MB":>10}')
+
+    for size in (megabytes // 4, megabytes):
+        with Stubber(client) as stubber:
+            stub_portions(stubber, size)
+            elapsed, peak = measure(lambda: query_aws('rds', 'download_db_log_file_portion', arguments, region='us-east-1'))
+
+        print(f'{"query_aws":<20}{size:>10}{elapsed:>10.2f}{peak:>10.1f}')
+
+        handle = {}
+        with Stubber(client) as stubber:
+            stub_portions(stubber, size)
+            elapsed, peak = measure(lambda: handle.update(download_log_file(instance='db',
+                                                                            log_file='error/postgres.log',
+                                                                            region='us-east-1',
+                                                                            account='benchmark')))
+
+        remove(handle['LogPath'])
+        print(f'{"download_log_file":<20}{size:>10}{elapsed:>10.2f}{peak:>10.1f}')
+
+
+if __name__ == '__main__':
+    from sys import argv
+    main(int(argv[1]) if len(argv) > 1 else 64)
@@ -0,0 +1,264 @@
+"""
+Runs every template in `templates/services/aws` against the offline backend and reports the wall time, API calls, peak
+resident memory, and records per second of each. No AWS account is required.
+
+The harness runs each template's `all` tasks in order: `aws`, `aws_tags`, and `aws_s3_buckets` tasks are executed, `set`
+tasks are evaluated, and `dataset` tasks pass their data through unchanged. Other tasks, such as `wait`, are skipped.
+Tasks which `iterate` are run for the first `--iterate` items only.
+
+    python -m tests.benchmarks.templates [--large] [--latency SECONDS] [--throttle RATE] [--iterate ITEMS] [pattern ...]
+
+The large profile returns 100,000 EC2 snapshots and 50,000 Route 53 record sets per hosted zone.
+"""
+from time import perf_counter
+
+ACCOUNT = '000000000000'
+REGION = 'us-east-1'
+
+LARGE_COUNTS = {
+    'ec2.describe_snapshots': 100000,
+    'ec2.describe_instances': 10000,
+    'ec2.describe_volumes': 20000,
+    'rds.describe_db_snapshots': 20000,
+    'route53.list_resource_record_sets': 50000,
+}
+
+
+class Template:
+    def __init__(self, path: str, root: str):
+        """
+        A template file, with the service and type taken from its path.
+        """
+        from os.path import relpath, splitext
+        from yaml import safe_load
+
+        with open(path) as stream:
+            self.harvest = safe_load(stream)['harvest']
+
+        self.service, filename = relpath(path, root).split('/')[-2:]
+        self.type = splitext(filename)[0]
+        self.name = self.harvest.get('name') or f'{self.service}.{self.type}'
+        self.tasks = (self.harvest.get('tasks') or {}).get('all') or []
+        self.region = None if self.harvest.get('global') else REGION
+
+
+def find_templates(patterns: list = None) -> list:
+    from fnmatch import fnmatch
+    from glob import glob
+    from os.path import dirname, join
+
+    import CloudHarvestPluginAws
+
+    root = join(dirname(CloudHarvestPluginAws.__file__), 'templates', 'services', 'aws')
+    templates = [Template(path, root) for path in sorted(glob(join(root, '**', '*.yaml'), recursive=True))]
+
+    if patterns:
+        templates = [template for template in templates
+                     if any(fnmatch(f'{template.service}.{template.type}', pattern) for pattern in patterns)]
+
+    return templates
+
+
+def resolve(value, variables: dict, item=None):
+    """
+    Replaces `var.` and `item.` references with their values.
+    """
+    if isinstance(value, dict):
+        return {k: resolve(v, variables, item) for k, v in value.items()}
+
+    elif isinstance(value, list):
+        return [resolve(v, variables, item) for v in value]
+
+    elif isinstance(value, str):
+        if value.startswith('var.'):
+            return variables.get(value[4:])
+
+        elif value.startswith('item.') and item is not None:
+            result = item
+            for part in value[5:].split('.'):
+                result = result.get(part) if isinstance(result, dict) else None
+
+            return result
+
+    return value
+
+
+def evaluate(expression: str):
+    """
+    Evaluates the datetime expressions used by `set` tasks, such as '{{ datetime_ago(days=1).isoformat() }}'.
+    """
+    from datetime import datetime, timedelta, timezone
+
+    namespace = {
+        'datetime_now': lambda: datetime.now(tz=timezone.utc),
+        'datetime_ago': lambda **kwargs: datetime.now(tz=timezone.utc) - timedelta(**kwargs),
+    }
+
+    expression = expression.strip()
+    if expression.startswith('{{') and expression.endswith('}}'):
+        return eval(expression[2:-2], {'__builtins__': {}}, namespace)
+
+    return expression
+
+
+def store(variables: dict, result_as, result, item=None) -> None:
+    if not result_as:
+        return
+
+    if isinstance(result_as, str):
+        variables[result_as] = result
+        return
+
+    records = result if isinstance(result, list) else [result]
+    include = resolve(result_as.get('include') or {}, variables, item)
+
+    if include:
+        records = [record | include if isinstance(record, dict) else record for record in records]
+
+    if result_as.get('mode') in ('append', 'extend'):
+        variables.setdefault(result_as['name'], []).extend(records)
+
+    else:
+        variables[result_as['name']] = records
+
+
+def run_aws(kind: str, task: dict, template: Template, variables: dict, iterate_limit: int) -> int:
+    """
+    Runs an `aws`, `aws_tags`, or `aws_s3_buckets` task and returns the number of records it produced.
+    """
+    from inspect import signature
+    from CloudHarvestPluginAws.tasks import AwsS3BucketsTask, AwsTask, AwsTagsTask
+
+    task_class = {'aws_tags': AwsTagsTask, 'aws_s3_buckets': AwsS3BucketsTask}.get(kind, AwsTask)
+    accepted = set(signature(AwsTask.__init__).parameters) | set(signature(task_class.__init__).parameters) | {'name', 'description'}
+
+    items = [None]
+    if task.get('iterate'):
+        items = (resolve(task['iterate'], variables) or [])[:iterate_limit]
+
+    records = 0
+    for item in items:
+        arguments = {k: resolve(v, variables, item) for k, v in task.items() if k in accepted}
+        arguments = {
+            'service': template.service,
+            'type': template.type,
+            'account': ACCOUNT,
+            'region': None if task.get('global_service') else template.region,
+            'role': 'harvest',
+        } | arguments
+
+        result = task_class(**arguments).method().result
+
+        if task.get('result_to_list_with_key') and isinstance(result, list):
+            result = [{task['result_to_list_with_key']: value} for value in result]
+
+        records += len(result) if isinstance(result, list) else 1
+
+        if task.get('result_to_dict_key'):
+            result = {task['result_to_dict_key']: result}
+
+        store(variables, task.get('result_as'), result, item)
+
+    return records
+
+
+def run_template(template: Template, iterate_limit: int) -> int:
+    """
+    Runs a template's tasks and returns the number of records produced by its AWS tasks.
+    """
+    from CloudHarvestPluginAws.telemetry import tags
+
+    variables = {}
+    records = 0
+
+    with tags(account=ACCOUNT, template=template.name):
+        for step in template.tasks:
+            kind, task = next(iter(step.items()))
+
+            if kind in ('aws', 'aws_tags', 'aws_s3_buckets'):
+                records += run_aws(kind, task, template, variables, iterate_limit)
+
+            elif kind == 'set':
+                variables[task['identifier']] = evaluate(task['value'])
+
+                if task.get('cast') == 'datetime':
+                    from datetime import datetime
+                    variables[task['identifier']] = datetime.fromisoformat(variables[task['identifier']])
+
+            elif kind == 'dataset':
+                store(variables, task.get('result_as'), resolve(task.get('data'), variables))
+
+    return records
+
+
+def measure(function) -> tuple:
+    """
+    Returns the function's result, the elapsed seconds, and the peak resident memory in MB above the starting point.
+    """
+    from threading import Event, Thread
+
+    def rss() -> float:
+        # Linux only
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * 4096 / 1024 / 1024
+
+    baseline = rss()
+    peak = baseline
+    done = Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(0.01):
+            peak = max(peak, rss())
+
+    sampler = Thread(target=sample, daemon=True)
+    sampler.start()
+
+    began = perf_counter()
+    result = function()
+    elapsed = perf_counter() - began
+
+    done.set()
+    sampler.join()
+
+    return result, elapsed, max(peak, rss()) - baseline
+
+
+def main(patterns: list = None, large: bool = False, latency: float = 0, throttle: float = 0, iterate_limit: int = 5):
+    from CloudHarvestPluginAws.offline import OfflineBackend, offline
+
+    backend = OfflineBackend(latency=latency, throttle_rate=throttle, counts=LARGE_COUNTS if large else None)
+
+    print(f'{"template":<36}{"seconds":>10}{"calls":>10}{"peak MB":>10}{"records":>10}{"rec/s":>12}  error', flush=True)
+
+    with offline(backend):
+        for template in find_templates(patterns):
+            calls = backend.call_count
+            error = ''
+
+            try:
+                records, elapsed, peak = measure(lambda: run_template(template, iterate_limit))
+
+            except Exception as e:
+                records, elapsed, peak = 0, 0.0, 0.0
+                error = f'{type(e).__name__}: {e}'[:80]
+
+            rate = records / elapsed if elapsed else 0
+            print(f'{template.service + "." + template.type:<36}{elapsed:>10.2f}{backend.call_count - calls:>10}'
+                  f'{peak:>10.1f}{records:>10}{rate:>12.0f}  {error}', flush=True)
+
+        print(f'{backend.call_count} API calls, {backend.throttled} throttled')
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='Runs every AWS template against the offline backend.')
+    parser.add_argument('patterns', nargs='*', help='Only run templates matching these patterns, such as "ec2.*".')
+    parser.add_argument('--large', action='store_true', help='Return large result sets from the largest listings.')
+    parser.add_argument('--latency', type=float, default=0, help='Seconds each request takes.')
+    parser.add_argument('--throttle', type=float, default=0, help='The fraction of requests which are throttled.')
+    parser.add_argument('--iterate', type=int, default=5, help='The number of items each iterating task runs for.')
+
+    args = parser.parse_args()
+    main(args.patterns, large=args.large, latency=args.latency, throttle=args.throttle, iterate_limit=args.iterate)
@@ -0,0 +1,91 @@
+from CloudHarvestPluginAws.tasks.aws import AwsTask, async_query_aws, async_query_aws_pages
+
+import unittest
+
+
+class TestAsyncQueryAws(unittest.TestCase):
+    def setUp(self):
+        from importlib.util import find_spec
+
+        if find_spec('aiobotocore') is None:
+            self.skipTest('the asyncio backend requires aiobotocore')
+
+    def test_async_query_aws(self):
+        from asyncio import run
+        from aiobotocore.stub import AioStubber
+        from CloudHarvestPluginAws.aio import close_clients, get_client
+
+        async def query():
+            with AioStubber(await get_client('rds', region='us-east-1')) as stubber:
+                for _ in range(2):
+                    stubber.add_response('describe_db_instances', {'DBInstances': [{'DBInstanceIdentifier': 'a'}], 'Marker': 'next'}, {})
+                    stubber.add_response('describe_db_instances', {'DBInstances': [{'DBInstanceIdentifier': 'b'}]}, {'Marker': 'next'})
+
+                stubber.add_response('describe_account_attributes', {'AccountQuotas': []}, {})
+
+                # The pages are combined the same way as query_aws
+                combined = await async_query_aws(service='rds', command='describe_db_instances', arguments={}, region='us-east-1')
+
+                # Each page is yielded separately
+                pages = [page async for page in async_query_aws_pages(service='rds', command='describe_db_instances', arguments={}, region='us-east-1')]
+
+                quotas = await async_query_aws(service='rds', command='describe_account_attributes', arguments={},
+                                               region='us-east-1', result_path='AccountQuotas')
+
+            await close_clients()
+
+            return combined, pages, quotas
+
+        combined, pages, quotas = run(query())
+
+        self.assertEqual(combined, [{'DBInstanceIdentifier': 'a'}, {'DBInstanceIdentifier': 'b'}])
+        self.assertEqual(pages, [[{'DBInstanceIdentifier': 'a'}], [{'DBInstanceIdentifier': 'b'}]])
+        self.assertEqual(quotas, [])
+
+    def test_client_pool(self):
+        from asyncio import gather, run
+        from CloudHarvestPluginAws.aio import CachedAioClients, close_clients, get_client
+
+        async def clients():
+            # Concurrent requests for the same client share it
+            first, second = await gather(get_client('rds', region='us-east-1'), get_client('rds', region='us-east-1'))
+            other = await get_client('rds', region='us-west-2')
+
+            await close_clients()
+
+            return first, second, other
+
+        first, second, other = run(clients())
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+        # The clients of a closed event loop are not kept
+        self.assertEqual(CachedAioClients.clients, {})
+
+    def test_async_fan_out(self):
+        from asyncio import run
+        from aiobotocore.stub import AioStubber
+        from CloudHarvestPluginAws.aio import close_clients, get_client
+
+        task = object.__new__(AwsTask)
+        task.arguments = {'DBInstanceIdentifier': 'each.Id'}
+        task.fan_out = {'items': [{'Id': 'a'}, {'Id': 'b'}], 'result_key': 'Instances', 'include': {'Id': 'each.Id'}}
+
+        options = {'service': 'rds', 'command': 'describe_db_instances', 'region': 'us-east-1', 'max_retries': 0}
+
+        async def fan_out():
+            with AioStubber(await get_client('rds', region='us-east-1')) as stubber:
+                for identifier in ('a', 'b'):
+                    stubber.add_response('describe_db_instances', {'DBInstances': [{'DBInstanceIdentifier': identifier}]},
+                                         {'DBInstanceIdentifier': identifier})
+
+                result = await task._async_fan_out(options=options)
+
+            await close_clients()
+
+            return result
+
+        # Results are returned in the same order as the items
+        self.assertEqual(run(fan_out()), [{'Instances': [{'DBInstanceIdentifier': 'a'}], 'Id': 'a'},
+                                          {'Instances': [{'DBInstanceIdentifier': 'b'}], 'Id': 'b'}])
@@ -0,0 +1,30 @@
+from CloudHarvestPluginAws.cache import TtlCache
+
+import unittest
+
+
+class TestTtlCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TtlCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        # Reading 'a' makes 'b' the least recently used entry
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats(), {'size': 2, 'hits': 2, 'misses': 1, 'evictions': 1})
+
+    def test_ttl(self):
+        from time import sleep
+
+        cache = TtlCache(ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=0.01)
+        sleep(0.02)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.items(), [('a', 1)])
@@ -0,0 +1,79 @@
+from CloudHarvestPluginAws.coalesce import coalesce
+
+import unittest
+
+
+def describe_instances(ids: list) -> list:
+    # Two instances share each reservation, like a describe_instances response
+    reservations = {}
+    for instance_id in ids:
+        reservations.setdefault(int(instance_id[2:]) // 2, []).append({'InstanceId': instance_id})
+
+    return [{'ReservationId': f'r-{index}', 'Instances': instances} for index, instances in reservations.items()]
+
+
+class TestCoalesce(unittest.TestCase):
+    def test_coalesce(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        calls = []
+
+        def execute(ids):
+            from time import sleep
+
+            calls.append(ids)
+            sleep(0.1)
+            return describe_instances(ids)
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(lambda index: coalesce(key=('test',),
+                                                               ids=[f'i-{index}'],
+                                                               execute=execute,
+                                                               path='Instances.InstanceId',
+                                                               window=0.2),
+                                        range(20)))
+
+        # The first request is sent immediately; the others arrive while it is pending and share one call
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(calls[0]), 1)
+        self.assertEqual(sorted(calls[0] + calls[1]), sorted(f'i-{index}' for index in range(20)))
+
+        # Every request receives only its own instance
+
+        for index, result in enumerate(results):
+            self.assertEqual(len(result), 1)
+            self.assertEqual(result[0]['Instances'], [{'InstanceId': f'i-{index}'}])
+
+    def test_single_request(self):
+        from time import monotonic
+
+        # A request with nothing else pending does not wait for the window
+        start = monotonic()
+        result = coalesce(key=('single',), ids=['i-1'], execute=describe_instances, path='Instances.InstanceId', window=5)
+
+        self.assertLess(monotonic() - start, 1)
+        self.assertEqual(result[0]['Instances'], [{'InstanceId': 'i-1'}])
+
+    def test_batch_failure(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        def execute(ids):
+            if 'i-missing' in ids:
+                raise Exception('InvalidInstanceID.NotFound')
+
+            return describe_instances(ids)
+
+        def request(instance_id):
+            try:
+                return coalesce(key=('failure',), ids=[instance_id], execute=execute, path='Instances.InstanceId', window=0.2)
+
+            except Exception as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = list(executor.map(request, ['i-1', 'i-missing', 'i-2']))
+
+        # The missing instance does not fail the other requests
+        self.assertEqual(results[0][0]['Instances'], [{'InstanceId': 'i-1'}])
+        self.assertEqual(results[1], 'InvalidInstanceID.NotFound')
+        self.assertEqual(results[2][0]['Instances'], [{'InstanceId': 'i-2'}])
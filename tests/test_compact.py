@@ -0,0 +1,70 @@
+from CloudHarvestPluginAws.compact import ColumnarRecords, StringPool, compact_records
+
+import unittest
+
+
+def records(count: int) -> list:
+    from json import dumps, loads
+
+    # Decoded from JSON so equal strings are separate objects, as they are in botocore responses
+    return loads(dumps([{'SnapshotId': f'snap-{index}', 'State': 'completed', 'Tags': [{'Key': 'Team', 'Value': 'platform'}]}
+                        for index in range(count)]))
+
+
+class TestCompact(unittest.TestCase):
+    def test_shared_metadata(self):
+        result = compact_records(records(3), metadata={'AccountId': '000000000000', 'AccountName': 'example'}, intern=False)
+
+        self.assertEqual(result[0]['Harvest'], {'AccountId': '000000000000', 'AccountName': 'example'})
+        self.assertIs(result[0]['Harvest']['AccountName'], result[2]['Harvest']['AccountName'])
+
+        # Each record's metadata may be modified without changing the other records
+        result[0]['Harvest']['Region'] = 'us-east-1'
+        result[0]['Harvest'].update({'Platform': 'aws', 'Service': 'ec2', 'Type': 'snapshots'})
+
+        self.assertEqual(result[0]['Harvest']['Region'], 'us-east-1')
+        self.assertNotIn('Region', result[1]['Harvest'])
+        self.assertEqual(result[2]['Harvest'], {'AccountId': '000000000000', 'AccountName': 'example'})
+
+    def test_string_pool(self):
+        result = StringPool().record(records(3))
+
+        self.assertIs(result[0]['State'], result[2]['State'])
+        self.assertIs(result[0]['Tags'][0]['Value'], result[2]['Tags'][0]['Value'])
+
+        # Keys with too many distinct values are no longer pooled
+        pool = StringPool(max_distinct=2)
+        pool.record(records(3))
+
+        self.assertIn('SnapshotId', pool.saturated)
+        self.assertNotIn('State', pool.saturated)
+
+    def test_columnar(self):
+        original = records(3) + [{'SnapshotId': 'snap-3', 'Encrypted': True}]
+        result = compact_records(records(3) + [{'SnapshotId': 'snap-3', 'Encrypted': True}],
+                                 metadata={'AccountId': '000000000000'}, columnar=True)
+
+        self.assertIsInstance(result, ColumnarRecords)
+        self.assertEqual(len(result), 4)
+        self.assertEqual(result[-1], original[-1] | {'Harvest': {'AccountId': '000000000000'}})
+
+        # Rows receive their own copy of the metadata
+        result[0]['Harvest']['Region'] = 'us-east-1'
+        self.assertNotIn('Region', result[0]['Harvest'])
+        self.assertNotIn('Region', result[1]['Harvest'])
+        self.assertEqual([record['SnapshotId'] for record in result], [record['SnapshotId'] for record in original])
+        self.assertEqual(result.column('Encrypted'), [None, None, None, True])
+
+    def test_query_aws(self):
+        from CloudHarvestPluginAws.offline import OfflineBackend, offline
+        from CloudHarvestPluginAws.tasks.aws import query_aws
+
+        pool = StringPool(max_distinct=1000)
+
+        with offline(OfflineBackend(counts={'ec2.describe_snapshots': 1500})):
+            result = query_aws(service='ec2', command='describe_snapshots', arguments={}, region='us-east-1', string_pool=pool)
+
+        # The pages were pooled as they were received
+        self.assertEqual(len(result), 1500)
+        self.assertEqual(list(pool.pools['StorageTier']), [result[0]['StorageTier']])
+        self.assertIn('SnapshotId', pool.saturated)
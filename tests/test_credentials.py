@@ -32,3 +32,287 @@ class TestProfiles(unittest.TestCase):
         self.assertIsNotNone(profile.expiration)
         self.assertIsNotNone(profile.role_name)
         self.assertIsNotNone(profile.role_arn)
+
+
+class TestProfileAcquisition(unittest.TestCase):
+    """
+    These tests do not require AWS; the STS call is replaced with a mock.
+    """
+    def setUp(self):
+        from CloudHarvestPluginAws.credentials import CachedProfiles
+        CachedProfiles.profiles.clear()
+        CachedProfiles.aliases.clear()
+
+    def test_single_flight(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from datetime import datetime, timedelta, timezone
+        from time import sleep
+        from unittest.mock import patch
+        from CloudHarvestPluginAws.credentials import Profile, get_profile
+
+        calls = []
+
+        def refresh_credentials(profile):
+            calls.append(profile.account_number)
+            sleep(0.1)
+            profile.expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+            return profile
+
+        with patch.object(Profile, 'refresh_credentials', refresh_credentials):
+            with ThreadPoolExecutor(max_workers=20) as executor:
+                profiles = list(executor.map(lambda _: get_profile('1', 'harvest'), range(20)))
+
+        # Only one caller assumed the role; the others waited for it and received the same profile
+        self.assertEqual(calls, ['000000000001'])
+        self.assertTrue(all(profile is profiles[0] for profile in profiles))
+
+    def test_refresh_does_not_block_readers(self):
+        from datetime import datetime, timedelta, timezone
+        from threading import Event, Thread
+        from unittest.mock import patch
+        from CloudHarvestPluginAws.credentials import Profile, get_profile
+
+        started = Event()
+        release = Event()
+
+        def refresh_credentials(profile):
+            if profile.aws_access_key_id is None and started.is_set():
+                release.wait(5)
+
+            profile.aws_access_key_id = datetime.now(timezone.utc).isoformat()
+            profile.expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+            started.set()
+            return profile
+
+        with patch.object(Profile, 'refresh_credentials', refresh_credentials):
+            original = get_profile('1', 'harvest')
+
+            # A slow refresh holds the acquisition lock; readers of the unexpired profile do not wait for it
+            refresher = Thread(target=get_profile, args=('1', 'harvest', True))
+            refresher.start()
+
+            self.assertIs(get_profile('1', 'harvest'), original)
+
+            release.set()
+            refresher.join()
+
+        # The refreshed credentials are a new profile; the previous one is not modified
+        refreshed = get_profile('1', 'harvest')
+        self.assertIsNot(refreshed, original)
+        self.assertNotEqual(refreshed.aws_access_key_id, original.aws_access_key_id)
+
+    def test_idle_profiles_are_not_refreshed(self):
+        from datetime import datetime, timedelta, timezone
+        from time import sleep
+        from unittest.mock import patch
+        from CloudHarvestPluginAws.credentials import CredentialRefresher, Profile, get_profile
+
+        refreshes = []
+        settings = {'platforms.aws.credentials_refresh_idle_minutes': 0.001}
+
+        def refresh_credentials(profile):
+            refreshes.append(profile.account_number)
+
+            # Due for a background refresh immediately
+            profile.expiration = datetime.now(timezone.utc) + timedelta(minutes=5)
+            return profile
+
+        with patch.object(Profile, 'refresh_credentials', refresh_credentials), \
+                patch('CloudHarvestCoreTasks.environment.Environment.get', side_effect=lambda name, *args, **kwargs: settings.get(name)):
+            get_profile('4', 'harvest')
+            CredentialRefresher.used[('000000000004', 'harvest')] -= 60
+
+            for _ in range(50):
+                if ('000000000004', 'harvest') not in CredentialRefresher.scheduled:
+                    break
+
+                sleep(0.01)
+
+        self.assertEqual(refreshes, ['000000000004'])
+        self.assertNotIn(('000000000004', 'harvest'), CredentialRefresher.scheduled)
+
+    def test_prefetch_profiles(self):
+        from datetime import datetime, timedelta, timezone
+        from unittest.mock import patch
+        from CloudHarvestPluginAws.credentials import Profile, prefetch_profiles
+
+        def refresh_credentials(profile):
+            if profile.account_number == '000000000003':
+                raise Exception('AccessDenied')
+
+            profile.expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+            return profile
+
+        with patch.object(Profile, 'refresh_credentials', refresh_credentials):
+            profiles = prefetch_profiles(['1', '2', '3', 2], role_name='harvest')
+
+        self.assertEqual(sorted(profiles.keys()), ['000000000001', '000000000002'])
+
+    def test_profiles_are_keyed_by_role(self):
+        from datetime import datetime, timedelta, timezone
+        from unittest.mock import patch
+        from CloudHarvestPluginAws.credentials import Profile, get_profile
+
+        def refresh_credentials(profile):
+            profile.aws_access_key_id = profile.role_name
+            profile.expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+            return profile
+
+        with patch.object(Profile, 'refresh_credentials', refresh_credentials):
+            self.assertEqual(get_profile('1', 'role_a').aws_access_key_id, 'role_a')
+            self.assertEqual(get_profile('1', 'role_b').aws_access_key_id, 'role_b')
+
+    def test_profile_store(self):
+        from datetime import datetime, timedelta, timezone
+        from importlib.util import find_spec
+        from tempfile import TemporaryDirectory
+        from unittest.mock import patch
+        from CloudHarvestPluginAws.credentials import CachedProfiles, Profile, get_account_name, get_profile
+
+        if find_spec('cryptography') is None:
+            self.skipTest('credentials are only stored with a key, which requires cryptography')
+
+        with TemporaryDirectory() as directory:
+            settings = {'platforms.aws.profile_cache.path': f'{directory}/profiles.db',
+                        'platforms.aws.profile_cache.key': 'Fw1wEYB6gtHXMnrbKLqXkcbJYoTUVmu9wDJ_5j9vfOk='}
+
+            profile = Profile(account_number='1', role_name='harvest')
+            profile.aws_access_key_id = 'key'
+            profile.expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+
+            with patch('CloudHarvestCoreTasks.environment.Environment.get', side_effect=lambda name, *args, **kwargs: settings.get(name)):
+                from CloudHarvestPluginAws.profile_store import ProfileStore, save_alias, save_profile
+                save_profile(profile)
+                save_alias('000000000001', 'my-account')
+
+                # A new process starts with an empty in-memory cache
+                CachedProfiles.profiles.clear()
+
+                with patch.object(Profile, 'refresh_credentials', side_effect=Exception('STS should not be called')):
+                    cached = get_profile('1', 'harvest')
+
+                self.assertEqual(cached.aws_access_key_id, 'key')
+                self.assertEqual(cached.account_alias, 'my-account')
+                self.assertEqual(get_account_name('000000000001', credentials={}), 'my-account')
+
+                ProfileStore.connection.close()
+                ProfileStore.connection = None
+
+    def test_profile_store_key(self):
+        from datetime import datetime, timedelta, timezone
+        from importlib.util import find_spec
+        from tempfile import TemporaryDirectory
+        from unittest.mock import patch
+        from CloudHarvestPluginAws.credentials import Profile
+        from CloudHarvestPluginAws.exceptions import HarvestAwsException
+        from CloudHarvestPluginAws.profile_store import ProfileStore, load_alias, load_profile, save_alias, save_profile
+
+        profile = Profile(account_number='1', role_name='harvest')
+        profile.aws_access_key_id = 'key'
+        profile.expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+
+        with TemporaryDirectory() as directory:
+            settings = {'platforms.aws.profile_cache.path': f'{directory}/profiles.db'}
+
+            with patch('CloudHarvestCoreTasks.environment.Environment.get', side_effect=lambda name, *args, **kwargs: settings.get(name)):
+                try:
+                    # Without a key, credentials are not stored in plain text, but aliases are
+                    with self.assertLogs('harvest', level='WARNING'):
+                        save_profile(profile)
+
+                    save_alias('000000000001', 'my-account')
+
+                    self.assertEqual(ProfileStore.connection.execute('SELECT COUNT(*) FROM profiles').fetchone()[0], 0)
+                    self.assertIsNone(load_profile('000000000001', 'harvest'))
+                    self.assertEqual(load_alias('000000000001'), 'my-account')
+
+                    ProfileStore.connection.close()
+                    ProfileStore.connection = None
+
+                    settings['platforms.aws.profile_cache.key'] = 'Fw1wEYB6gtHXMnrbKLqXkcbJYoTUVmu9wDJ_5j9vfOk='
+
+                    if find_spec('cryptography') is None:
+                        # The credentials are not stored in plain text
+                        self.assertRaises(HarvestAwsException, load_profile, '000000000001', 'harvest')
+                        self.assertRaises(HarvestAwsException, save_profile, profile)
+
+                    else:
+                        # The stored credentials are encrypted
+                        save_profile(profile)
+
+                        row = ProfileStore.connection.execute('SELECT aws_access_key_id FROM profiles').fetchone()
+                        self.assertNotEqual(row[0], 'key')
+                        self.assertEqual(load_profile('000000000001', 'harvest').aws_access_key_id, 'key')
+
+                finally:
+                    if ProfileStore.connection is not None:
+                        ProfileStore.connection.close()
+
+                    ProfileStore.connection = ProfileStore.error = ProfileStore.fernet = None
+
+    def test_read_credentials_file(self):
+        from os import utime
+        from tempfile import TemporaryDirectory
+        from time import time
+        from unittest.mock import patch
+        from CloudHarvestPluginAws.credentials import read_credentials_file
+
+        validated = []
+
+        def query_aws(service, command, arguments, credentials=None, **kwargs):
+            validated.append(credentials['aws_access_key_id'])
+            return {'Account': credentials['aws_access_key_id'], 'Arn': 'arn:aws:sts::1:assumed-role/harvest/session'}
+
+        def write(path: str, sections: dict, mtime: float):
+            with open(path, 'w') as file:
+                for name, key in sections.items():
+                    file.write(f'[{name}]\naws_access_key_id = {key}\naws_secret_access_key = secret\n')
+
+            utime(path, (mtime, mtime))
+
+        with TemporaryDirectory() as directory, \
+                patch('CloudHarvestPluginAws.tasks.aws.query_aws', query_aws), \
+                patch('CloudHarvestPluginAws.credentials.get_account_name', return_value='alias'):
+            path = f'{directory}/credentials'
+            write(path, {'one': '1', 'two': '2'}, mtime=time())
+
+            self.assertEqual(sorted(read_credentials_file(path).keys()), ['000000000001', '000000000002'])
+            self.assertEqual(sorted(validated), ['1', '2'])
+
+            # An unchanged file is not read again
+            validated.clear()
+            read_credentials_file(path)
+            self.assertEqual(validated, [])
+
+            # Only the changed section is validated
+            write(path, {'one': '1', 'two': '3'}, mtime=time() + 10)
+            self.assertEqual(sorted(read_credentials_file(path).keys()), ['000000000001', '000000000003'])
+            self.assertEqual(validated, ['3'])
+
+    def test_write_profiles_to_credentials_file(self):
+        from configparser import ConfigParser
+        from tempfile import TemporaryDirectory
+        from CloudHarvestPluginAws.credentials import Profile, write_profiles_to_credentials_file
+
+        profiles = []
+        for account_number in ('1', '2'):
+            profile = Profile(account_number=account_number, role_name='harvest')
+            profile.aws_access_key_id = f'key-{account_number}'
+            profile.aws_secret_access_key = 'secret'
+            profile.aws_session_token = 'token'
+            profiles.append(profile)
+
+        with TemporaryDirectory() as directory:
+            path = f'{directory}/credentials'
+
+            with open(path, 'w') as file:
+                file.write('[existing]\naws_access_key_id = existing\n')
+
+            write_profiles_to_credentials_file(profiles=profiles, path=path)
+
+            config = ConfigParser()
+            config.read(path)
+
+            # Existing sections are preserved
+            self.assertEqual(config.sections(), ['existing', '000000000001-harvest', '000000000002-harvest'])
+            self.assertEqual(config.get('000000000002-harvest', 'aws_access_key_id'), 'key-2')
@@ -0,0 +1,56 @@
+from CloudHarvestPluginAws.filters import build_filter_arguments, filter_records, project_record
+
+import unittest
+
+
+class TestFilters(unittest.TestCase):
+    def test_build_filter_arguments(self):
+        from boto3 import Session
+        client = Session().client('ec2', region_name='us-east-1')
+
+        arguments, remaining = build_filter_arguments(
+            client=client,
+            command='describe_snapshots',
+            arguments={'MaxResults': 100},
+            filters={'OwnerIds': 'self', 'status': ['completed', 'pending']}
+        )
+
+        self.assertEqual(arguments, {
+            'MaxResults': 100,
+            'OwnerIds': ['self'],
+            'Filters': [{'Name': 'status', 'Values': ['completed', 'pending']}]
+        })
+        self.assertEqual(remaining, {})
+
+        # Booleans are lower case, and record paths which are not EC2 filter names are applied to each page
+        arguments, remaining = build_filter_arguments(client, 'describe_volumes', {},
+                                                      {'encrypted': False, 'tag:Team': 'a', 'attachment.status': 'attached',
+                                                       'Attachments.State': 'attached', 'VolumeType': 'gp3'})
+
+        self.assertEqual(arguments, {'Filters': [{'Name': 'encrypted', 'Values': ['false']},
+                                                 {'Name': 'tag:Team', 'Values': ['a']},
+                                                 {'Name': 'attachment.status', 'Values': ['attached']}]})
+        self.assertEqual(remaining, {'Attachments.State': 'attached', 'VolumeType': 'gp3'})
+
+        # Route 53 does not support server-side filters, so the filter is returned to be applied to each page
+        client = Session().client('route53', region_name='us-east-1')
+        arguments, remaining = build_filter_arguments(client, 'list_hosted_zones', {}, {'Config.PrivateZone': False})
+
+        self.assertEqual(arguments, {})
+        self.assertEqual(remaining, {'Config.PrivateZone': False})
+
+    def test_filter_records(self):
+        records = [
+            {'Id': 1, 'Config': {'PrivateZone': True}, 'Tags': ['a', 'b']},
+            {'Id': 2, 'Config': {'PrivateZone': False}, 'Tags': ['c']},
+        ]
+
+        self.assertEqual([r['Id'] for r in filter_records(records, {'Config.PrivateZone': False})], [2])
+        self.assertEqual([r['Id'] for r in filter_records(records, {'Id': [1, 2]})], [1, 2])
+        self.assertEqual([r['Id'] for r in filter_records(records, {'Tags': 'b'})], [1])
+
+    def test_project_record(self):
+        record = {'InstanceId': 'i-1', 'State': {'Code': 16, 'Name': 'running'}, 'Large': 'x' * 100}
+
+        self.assertEqual(project_record(record, ['InstanceId', 'State.Name', 'Missing']),
+                         {'InstanceId': 'i-1', 'State': {'Name': 'running'}})
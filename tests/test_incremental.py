@@ -0,0 +1,90 @@
+from CloudHarvestPluginAws.incremental import apply_watermark, changed_records, clear_state, commit_state, commit_states, discard_states, get_state, set_state, stage_state
+
+import unittest
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        clear_state()
+
+    def test_apply_watermark(self):
+        from datetime import datetime, timedelta, timezone
+
+        watermark = datetime(2024, 1, 2, tzinfo=timezone.utc)
+
+        # No watermark means a full collection
+        self.assertEqual(apply_watermark({'StartTime': 'x'}, 'StartTime', None), {'StartTime': 'x'})
+
+        # The watermark is later than the template's StartTime
+        arguments = apply_watermark({'StartTime': datetime(2024, 1, 1)}, 'StartTime', watermark, overlap=60)
+        self.assertEqual(arguments['StartTime'], watermark - timedelta(seconds=60))
+
+        # The template's StartTime is already later than the watermark
+        arguments = apply_watermark({'StartTime': '2024-01-03T00:00:00+00:00'}, 'StartTime', watermark)
+        self.assertEqual(arguments['StartTime'], '2024-01-03T00:00:00+00:00')
+
+        # APIs such as describe_cases expect ISO 8601 strings
+        self.assertEqual(apply_watermark({}, 'afterTime', watermark, format='iso'), {'afterTime': watermark.isoformat()})
+
+    def test_changed_records(self):
+        records = [{'Id': 'a', 'State': 'available'}, {'Id': 'b', 'State': 'available'}]
+
+        changed, fingerprints = changed_records(records, previous=None, identifier='Id')
+        self.assertEqual(changed, records)
+
+        records[1] = {'Id': 'b', 'State': 'deleting'}
+        records.append({'Id': 'c', 'State': 'available'})
+
+        changed, fingerprints = changed_records(records, previous=fingerprints, identifier='Id')
+        self.assertEqual([record['Id'] for record in changed], ['b', 'c'])
+
+        # Only the keys in the fingerprint are compared
+        _, fingerprints = changed_records(records, previous=None, identifier='Id', keys=['Id'])
+        changed, _ = changed_records([{'Id': 'b', 'State': 'deleted'}], previous=fingerprints, identifier='Id', keys=['Id'])
+        self.assertEqual(changed, [])
+
+    def test_state(self):
+        from datetime import datetime, timezone
+
+        key = ('000000000000', 'us-east-1', 'rds.events.describe_events')
+        self.assertIsNone(get_state(key))
+
+        watermark = datetime.now(timezone.utc)
+        set_state(key, watermark=watermark)
+        self.assertEqual(get_state(key)['watermark'], watermark)
+
+        clear_state(key)
+        self.assertIsNone(get_state(key))
+
+    def test_staged_state(self):
+        from datetime import datetime, timezone
+
+        key = ('000000000000', 'us-east-1', 'rds.events.describe_events')
+
+        # Staged state is not used until it is committed
+        stage_state(key, watermark=datetime.now(timezone.utc))
+        self.assertIsNone(get_state(key))
+
+        self.assertTrue(commit_state(key))
+        self.assertIsNotNone(get_state(key)['watermark'])
+        self.assertFalse(commit_state(key))
+
+    def test_commit_states(self):
+        from datetime import datetime, timezone
+
+        events = ('000000000000', 'us-east-1', 'rds.events.describe_events')
+        snapshots = ('000000000000', 'us-east-1', 'rds.snapshots.describe_db_snapshots')
+        other_region = ('000000000000', 'us-west-2', 'rds.events.describe_events')
+
+        for key in (events, snapshots, other_region):
+            stage_state(key, watermark=datetime.now(timezone.utc), owner=('rds', key[2].split('.')[1]))
+
+        # Only the state staged by the unit's service type, account, and region is stored
+        self.assertEqual(commit_states(account='0', region='us-east-1', service='rds', type='events'), 1)
+        self.assertIsNotNone(get_state(events))
+        self.assertIsNone(get_state(snapshots))
+
+        self.assertEqual(discard_states(account='000000000000', region='us-east-1'), 1)
+        self.assertEqual(commit_states(account='000000000000', region='us-east-1'), 0)
+        self.assertIsNone(get_state(snapshots))
+        self.assertIsNone(get_state(other_region))
@@ -0,0 +1,129 @@
+from CloudHarvestPluginAws.logs import download_log_file, download_log_text, iter_log_file, read_log_file
+
+import unittest
+
+
+class TestLogs(unittest.TestCase):
+    def setUp(self):
+        from tempfile import TemporaryDirectory
+        from unittest.mock import patch
+
+        self.directory = TemporaryDirectory()
+        settings = {'platforms.aws.rds_logs.spool_path': self.directory.name}
+
+        self.patcher = patch('CloudHarvestCoreTasks.environment.Environment.get',
+                             side_effect=lambda name, *args, **kwargs: settings.get(name))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.directory.cleanup()
+
+    def stub(self, stubber, marker: str, data: str, next_marker: str, pending: bool):
+        stubber.add_response('download_db_log_file_portion',
+                             {'LogFileData': data, 'Marker': next_marker, 'AdditionalDataPending': pending},
+                             {'DBInstanceIdentifier': 'db', 'LogFileName': 'error/postgres.log', 'Marker': marker})
+
+    def test_download_log_file(self):
+        from botocore.stub import Stubber
+        from CloudHarvestPluginAws.clients import get_client
+
+        for compress in (False, True):
+            with Stubber(get_client('rds', 'us-east-1')) as stubber:
+                self.stub(stubber, '0', 'first\n', '1', True)
+                self.stub(stubber, '1', 'second\n', '2', False)
+
+                handle = download_log_file('db', 'error/postgres.log', region='us-east-1', account='1', compress=compress)
+
+            self.assertEqual(handle['Portions'], 2)
+            self.assertEqual(handle['LogPath'].endswith('.gz'), compress)
+            self.assertEqual(read_log_file(handle['LogPath']), 'first\nsecond\n')
+            self.assertEqual(read_log_file(handle['LogPath'], offset=6, size=3), 'sec')
+
+            # Chunks are extended to the end of the line they stop in
+            self.assertEqual(list(iter_log_file(handle['LogPath'], chunk_size=2)), ['first\n', 'second\n'])
+            self.assertEqual(list(iter_log_file(handle['LogPath'], chunk_size=7)), ['first\nsecond\n'])
+
+    def test_resume(self):
+        from botocore.exceptions import ClientError
+        from botocore.stub import Stubber
+        from CloudHarvestPluginAws.clients import get_client
+
+        with Stubber(get_client('rds', 'us-east-1')) as stubber:
+            self.stub(stubber, '0', 'first\n', '1', True)
+            stubber.add_client_error('download_db_log_file_portion', service_error_code='DBLogFileNotFoundFault')
+
+            with self.assertRaises(ClientError):
+                download_log_file('db', 'error/postgres.log', region='us-east-1', account='1')
+
+        # The next attempt starts from the marker of the last portion which was written
+        with Stubber(get_client('rds', 'us-east-1')) as stubber:
+            self.stub(stubber, '1', 'second\n', '2', False)
+
+            handle = download_log_file('db', 'error/postgres.log', region='us-east-1', account='1')
+
+        self.assertEqual(handle['Portions'], 1)
+        self.assertEqual(read_log_file(handle['LogPath']), 'first\nsecond\n')
+
+    def test_download_log_text(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from os.path import exists
+        from botocore.stub import Stubber
+        from CloudHarvestPluginAws.clients import get_client
+
+        with Stubber(get_client('rds', 'us-east-1')) as stubber:
+            for _ in range(2):
+                self.stub(stubber, '0', 'first\n', '1', True)
+                self.stub(stubber, '1', 'second\n', '2', False)
+
+            # Concurrent downloads of the same file do not write to the same spool file at once
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                handles = list(executor.map(lambda _: download_log_text('db', 'error/postgres.log', region='us-east-1', account='1'),
+                                            range(2)))
+
+        self.assertEqual([handle['Log'] for handle in handles], ['first\nsecond\n'] * 2)
+        self.assertNotIn('LogPath', handles[0])
+        self.assertFalse(exists(f'{self.directory.name}/1/us-east-1/db/error_postgres.log'))
+
+    def test_logs_download_report(self):
+        from os.path import dirname, join
+        from botocore.stub import Stubber
+        from yaml import SafeLoader, load
+        import CloudHarvestPluginAws
+        from CloudHarvestPluginAws.clients import get_client
+
+        directory = join(dirname(CloudHarvestPluginAws.__file__), 'templates', 'reports', 'aws', 'rds')
+
+        with open(join(directory, '_get_logs.yaml')) as stream:
+            task = load(stream, Loader=SafeLoader)['report']['tasks'][0]['aws_rds_logs']
+
+        with open(join(directory, 'logs-download.yaml')) as stream:
+            join_stage = load(stream, Loader=SafeLoader)['report']['tasks'][-1]['dataset']['stages'][0]['join']
+
+        variables = {'account': '1', 'region': 'us-east-1', 'instance': 'db', 'log_file': 'error/postgres.log'}
+
+        def resolve(value: str):
+            return variables[value[4:]] if isinstance(value, str) and value.startswith('var.') else value
+
+        # The helper report downloads a single file, so its result is one row
+        self.assertIn('file', task)
+        self.assertNotIn('compress', task)
+
+        with Stubber(get_client('rds', 'us-east-1')) as stubber:
+            self.stub(stubber, '0', 'first\n', '1', True)
+            self.stub(stubber, '1', 'second\n', '2', False)
+
+            row = download_log_text(instance=resolve(task['file']['DBInstanceIdentifier']),
+                                    log_file=resolve(task['file']['LogFileName']),
+                                    region=resolve(task['region']),
+                                    account=resolve(task['account']))
+
+        row |= {key: resolve(value) for key, value in task['result_as']['include'].items()}
+
+        # logs-download joins each descriptor with the downloaded rows
+        descriptor = {'DBInstanceArn': 'db', 'FileName': 'error/postgres.log'}
+        matches = [row for row in [row]
+                   if [descriptor[key] for key in join_stage['left_keys']] == [row[key] for key in join_stage['right_keys']]]
+
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0]['Log'], 'first\nsecond\n')
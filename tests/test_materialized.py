@@ -0,0 +1,161 @@
+from CloudHarvestPluginAws import materialized
+from CloudHarvestPluginAws.materialized import MemoryStore, get_report, refresh, report_queries, set_source
+
+import unittest
+
+
+def walk(record: dict, path: str):
+    for part in path.split('.'):
+        record = record.get(part) if isinstance(record, dict) else None
+
+    return record
+
+
+def evaluate(record: dict, expression):
+    if isinstance(expression, str) and expression.startswith('$'):
+        return walk(record, expression[1:])
+
+    elif isinstance(expression, list):
+        return [evaluate(record, value) for value in expression]
+
+    # Operators such as $dateToString are not needed by these tests
+    return None if isinstance(expression, dict) else expression
+
+
+class Collection:
+    """
+    Runs the `$match`, `$addFields`, `$project`, `$unwind`, `$lookup`, and `$sort` stages used by the report templates over
+    a list of records. `$lookup` reads the other collections of `database`.
+    """
+    def __init__(self, records: list, database: dict = None):
+        self.records = records
+        self.database = database if database is not None else {}
+        self.pipelines = []
+
+    def aggregate(self, pipeline: list):
+        self.pipelines.append(pipeline)
+        rows = [dict(record) for record in self.records]
+
+        for stage in pipeline:
+            operator, value = next(iter(stage.items()))
+
+            if operator == '$match':
+                rows = [row for row in rows if all(walk(row, path) == expected for path, expected in value.items())]
+
+            elif operator == '$addFields':
+                rows = [row | {field: evaluate(row, expression) for field, expression in value.items()} for row in rows]
+
+            elif operator == '$project':
+                rows = [{field: walk(row, field) if expression == 1 else evaluate(row, expression) for field, expression in value.items()}
+                        for row in rows]
+
+            elif operator == '$unwind':
+                field = value['path'][1:]
+                rows = [row | {field: item} for row in rows for item in (row.get(field) or [None])]
+
+            elif operator == '$lookup':
+                foreign = self.database[value['from']].records
+                rows = [row | {value['as']: [record for record in foreign if walk(record, value['foreignField']) == walk(row, value['localField'])]}
+                        for row in rows]
+
+            elif operator == '$sort':
+                for path, direction in reversed(list(value.items())):
+                    rows.sort(key=lambda row: str(walk(row, path)), reverse=direction == -1)
+
+        return iter(rows)
+
+
+def instance(instance_id: str, account: str, region: str, state: str = 'running') -> dict:
+    return {'InstanceId': instance_id, 'State': {'Name': state}, 'Harvest': {'AccountId': account, 'Account': f'account-{account}', 'Region': region}}
+
+
+class TestMaterialized(unittest.TestCase):
+    def setUp(self):
+        self.collection = Collection([
+            instance('i-1', '1', 'us-east-1'),
+            instance('i-2', '1', 'us-west-2'),
+            instance('i-3', '2', 'us-east-1'),
+        ])
+
+        self.store = MemoryStore()
+        set_source({'aws.ec2.instances': self.collection}, store=self.store)
+
+    def tearDown(self):
+        materialized.MaterializedReports.source = None
+        materialized.MaterializedReports.store = None
+
+    def test_report_queries(self):
+        queries = report_queries('reports.aws.ec2.instances')
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual((queries[0]['collection'], queries[0]['result_as'], queries[0]['partitioned']), ('aws.ec2.instances', 'result', True))
+
+        # Both queries of the parameters report are materialized; their rows are combined by a later dataset task
+        self.assertEqual([query['result_as'] for query in report_queries('reports.aws.rds.parameters')],
+                         ['cluster_parameter_groups', 'instance_parameter_groups'])
+
+    def test_refresh(self):
+        rows = get_report('reports.aws.ec2.instances')['result']
+
+        self.assertEqual([row['Instance'] for row in rows], ['i-1', 'i-2', 'i-3'])
+        self.assertNotIn(materialized.PARTITION_FIELD, rows[0])
+
+        # Reads do not query the collection
+        get_report('reports.aws.ec2.instances')
+        self.assertEqual(len(self.collection.pipelines), 1)
+
+        # A collection pass for one account and region only refreshes those rows
+        self.collection.records[0] = instance('i-1', '1', 'us-east-1', state='stopped')
+        self.collection.records.append(instance('i-4', '1', 'us-east-1'))
+
+        self.assertEqual(refresh(account='1', region='us-east-1', service='ec2', type='instances'), 1)
+        self.assertEqual(self.collection.pipelines[-1][0], {'$match': {'Harvest.AccountId': '1', 'Harvest.Region': 'us-east-1'}})
+
+        rows = get_report('reports.aws.ec2.instances')['result']
+        self.assertEqual([(row['Instance'], row['Status']) for row in rows],
+                         [('i-1', 'stopped'), ('i-4', 'running'), ('i-2', 'running'), ('i-3', 'running')])
+
+        # Other services are not affected
+        self.assertEqual(refresh(account='1', region='us-east-1', service='rds', type='instances'), 0)
+
+    def test_sorted_report(self):
+        def case(display_id: str, account: str, alias: str) -> dict:
+            return {'displayId': display_id, 'subject': display_id, 'status': 'opened',
+                    'Harvest': {'Active': True, 'AccountId': account, 'Account': alias, 'Region': 'us-east-1'}}
+
+        cases = Collection([case('3', '1', 'zeta'), case('2', '2', 'alpha')])
+        set_source({'aws.support.cases': cases}, store=self.store)
+
+        self.assertTrue(report_queries('reports.aws.support.communications')[0]['partitioned'])
+
+        # Rows are stored by account and region, which is not the order of the report's $sort
+        cases.records.append(case('1', '1', 'zeta'))
+        get_report('reports.aws.support.communications')
+
+        cases.records.append(case('0', '1', 'zeta'))
+        refresh(account='1', region='us-east-1', service='support', type='cases')
+
+        rows = get_report('reports.aws.support.communications')['result']
+        self.assertEqual([(row['Account'], row['DisplayId']) for row in rows],
+                         [('alpha', '2'), ('zeta', '0'), ('zeta', '1'), ('zeta', '3')])
+
+    def test_joined_collection(self):
+        def subscription(arn: str, topic: str) -> dict:
+            return {'SubscriptionArn': arn, 'Attributes': {'TopicArn': topic},
+                    'Harvest': {'AccountId': '1', 'Account': 'account-1', 'Region': 'us-east-1'}}
+
+        database = {}
+        subscriptions = Collection([subscription('s-1', 't-1')], database=database)
+        topics = Collection([{'TopicArn': 't-1', 'DisplayName': 'before', 'Harvest': {'AccountId': '2', 'Region': 'us-west-2'}}])
+        database.update({'aws.sns.subscriptions': subscriptions, 'aws.sns.topics': topics})
+        set_source(database, store=self.store)
+
+        self.assertEqual(report_queries('reports.aws.sns.subscriptions')[0]['joins'], ('aws.sns.topics',))
+        self.assertEqual(get_report('reports.aws.sns.subscriptions')['result'][0]['TopicName'], 'before')
+
+        # A topic in another account and region changes, so the whole report is rebuilt
+        topics.records[0] = topics.records[0] | {'DisplayName': 'after'}
+
+        self.assertEqual(refresh(account='2', region='us-west-2', service='sns', type='topics'), 1)
+        self.assertNotIn('$match', subscriptions.pipelines[-1][0])
+        self.assertEqual(get_report('reports.aws.sns.subscriptions')['result'][0]['TopicName'], 'after')
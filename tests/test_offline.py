@@ -0,0 +1,53 @@
+from CloudHarvestPluginAws.offline import OfflineBackend, offline
+
+import unittest
+from unittest.mock import patch
+
+
+class TestOffline(unittest.TestCase):
+    def test_pagination(self):
+        from CloudHarvestPluginAws.tasks.aws import query_aws
+
+        with offline(OfflineBackend(counts={'ec2.describe_snapshots': 2500})) as backend:
+            result = query_aws(service='ec2', command='describe_snapshots', arguments={}, region='us-east-1')
+
+        self.assertEqual(len(result), 2500)
+        self.assertEqual(backend.calls['ec2.describe_snapshots'], 3)
+
+        # Records are distinct
+        self.assertEqual(len({record['SnapshotId'] for record in result}), 2500)
+
+    @patch('time.sleep')
+    def test_throttling(self, sleep):
+        from CloudHarvestPluginAws.retry import RetryStats
+        from CloudHarvestPluginAws.tasks.aws import query_aws
+
+        stats = RetryStats()
+
+        with offline(OfflineBackend(throttle_rate=0.5, seed=1, counts={'dynamodb.list_tables': 5})) as backend:
+            result = query_aws(service='dynamodb', command='list_tables', arguments={}, region='us-east-1', retry_stats=stats)
+
+        self.assertEqual(len(result), 5)
+        self.assertGreater(backend.throttled, 0)
+        self.assertEqual(stats.throttles, backend.throttled)
+
+    @patch('time.sleep')
+    def test_no_retries(self, sleep):
+        from CloudHarvestPluginAws.tasks.aws import query_aws
+
+        # max_retries=0 makes a single attempt
+        with offline(OfflineBackend(throttle_rate=1, counts={'dynamodb.list_tables': 5})) as backend:
+            with self.assertRaises(Exception):
+                query_aws(service='dynamodb', command='list_tables', arguments={}, region='us-east-1', max_retries=0)
+
+        self.assertEqual(backend.throttled, 1)
+
+    def test_fixtures(self):
+        from CloudHarvestPluginAws.tasks.aws import query_aws
+
+        fixtures = {'sqs.list_queues': {'QueueUrls': ['https://sqs.us-east-1.amazonaws.com/000000000000/queue']}}
+
+        with offline(OfflineBackend(fixtures=fixtures)):
+            result = query_aws(service='sqs', command='list_queues', arguments={}, region='us-east-1')
+
+        self.assertEqual(result, fixtures['sqs.list_queues']['QueueUrls'])
@@ -0,0 +1,33 @@
+from CloudHarvestPluginAws.rate_limits import TokenBucket, get_rate_limiter
+
+import unittest
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_acquire(self):
+        bucket = TokenBucket(rate=20, capacity=2)
+
+        # The bucket starts full, so the burst does not wait
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+
+        # The next token is added after 1/20th of a second
+        self.assertGreater(bucket.acquire(), 0)
+
+    def test_acquire_async(self):
+        from asyncio import gather, run
+
+        bucket = TokenBucket(rate=20, capacity=2)
+
+        async def acquire():
+            return await gather(*(bucket.acquire_async() for _ in range(3)))
+
+        # Two requests use the burst and the third waits for the next token
+        self.assertEqual(sorted(waited > 0 for waited in run(acquire())), [False, False, True])
+
+    def test_get_rate_limiter(self):
+        limiter = get_rate_limiter(service='rds', region='us-east-1', account='000000000000', rate=5)
+
+        self.assertIs(limiter, get_rate_limiter(service='rds', region='us-east-1', account='000000000000'))
+        self.assertIsNot(limiter, get_rate_limiter(service='rds', region='us-west-2', account='000000000000', rate=5))
+        self.assertEqual(limiter.rate, 5)
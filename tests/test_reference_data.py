@@ -0,0 +1,44 @@
+from CloudHarvestPluginAws.reference_data import CachedReferenceData, get_reference_data, reference_key
+
+import unittest
+
+
+class TestReferenceData(unittest.TestCase):
+    def setUp(self):
+        CachedReferenceData.results.clear()
+
+    def test_reference_key(self):
+        key = reference_key('partition', 'us-west-2', 'ec2', 'describe_instance_types', arguments={})
+
+        self.assertEqual(key, reference_key('partition', 'us-east-1', 'ec2', 'describe_instance_types', arguments={}))
+        self.assertNotEqual(key, reference_key('partition', 'cn-north-1', 'ec2', 'describe_instance_types', arguments={}))
+        self.assertNotEqual(key, reference_key('region', 'us-west-2', 'ec2', 'describe_instance_types', arguments={}))
+
+        with self.assertRaises(ValueError):
+            reference_key('account', 'us-east-1', 'ec2', 'describe_instance_types')
+
+    def test_get_reference_data(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from time import sleep
+
+        calls = []
+
+        def loader():
+            calls.append(1)
+            sleep(0.05)
+            return [{'InstanceType': 't3.micro', 'SupportedUsageClasses': ['on-demand']}]
+
+        key = reference_key('region', 'us-east-1', 'ec2', 'describe_instance_types', arguments={})
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: get_reference_data(key, loader), range(8)))
+
+        # Every account receives the result but it is only retrieved once
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result == [{'InstanceType': 't3.micro', 'SupportedUsageClasses': ['on-demand']}] for result in results))
+
+        # Each account's copy may be changed without changing the cached result
+        results[0][0]['Harvest'] = {'AccountId': '000000000000'}
+        results[0][0]['SupportedUsageClasses'].append('spot')
+        self.assertNotIn('Harvest', get_reference_data(key, loader)[0])
+        self.assertEqual(get_reference_data(key, loader)[0]['SupportedUsageClasses'], ['on-demand'])
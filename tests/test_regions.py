@@ -0,0 +1,98 @@
+from CloudHarvestPluginAws.regions import CachedRegions, get_enabled_regions, record_error, should_collect
+
+import unittest
+
+
+class TestRegions(unittest.TestCase):
+    def setUp(self):
+        CachedRegions.enabled.clear()
+        CachedRegions.unavailable.clear()
+        CachedRegions.failures.clear()
+        CachedRegions.empty.clear()
+
+    def test_enabled_regions(self):
+        from botocore.stub import Stubber
+        from CloudHarvestPluginAws.clients import get_client
+
+        with Stubber(get_client('account')) as stubber:
+            stubber.add_response('list_regions',
+                                 {'Regions': [{'RegionName': 'us-east-1', 'RegionOptStatus': 'ENABLED_BY_DEFAULT'}]},
+                                 {'RegionOptStatusContains': ['ENABLED', 'ENABLED_BY_DEFAULT']})
+
+            self.assertEqual(get_enabled_regions('000000000000'), frozenset({'us-east-1'}))
+
+            # The regions are cached, so the stub is not called again
+            self.assertTrue(should_collect('000000000000', 'ec2', 'us-east-1'))
+            self.assertFalse(should_collect('000000000000', 'ec2', 'af-south-1'))
+
+            # Global services are always collected
+            self.assertTrue(should_collect('000000000000', 'iam', None))
+
+    def test_enabled_regions_unknown(self):
+        from unittest.mock import MagicMock, patch
+        from CloudHarvestPluginAws.tasks.aws import AwsTask
+
+        def task(service: str) -> AwsTask:
+            task = object.__new__(AwsTask)
+            task.name, task.account, task.role, task.region = 'Task', '000000000000', 'harvest', 'us-east-1'
+            task.service, task.command, task.max_retries, task.rate_limit = service, 'describe', None, None
+            task.result_path, task.filters, task.fields = None, {}, []
+            task.retry_stats, task.string_pool = None, None
+
+            return task
+
+        profile = MagicMock(credentials={}, account_alias='example')
+
+        with patch('CloudHarvestPluginAws.credentials.get_profile', return_value=profile), \
+                patch('CloudHarvestPluginAws.tasks.aws.query_aws', side_effect=Exception('AccessDenied')) as query_aws:
+
+            # Neither API may be called, so every region is collected
+            self.assertIsNotNone(task('ec2')._prepare_options())
+            self.assertEqual(query_aws.call_count, 2)
+
+            # The failed lookup is cached, so the next task does not repeat it
+            self.assertIsNotNone(task('rds')._prepare_options())
+            self.assertEqual(query_aws.call_count, 2)
+
+        self.assertIsNone(get_enabled_regions('000000000000'))
+
+    def test_record_error(self):
+        from botocore.exceptions import ClientError, EndpointConnectionError
+
+        CachedRegions.enabled.set('000000000000', frozenset({'us-east-1'}))
+        CachedRegions.enabled.set('111111111111', frozenset({'us-east-1'}))
+
+        # A single connection error does not skip the region
+        record_error('000000000000', 'sqs', 'us-east-1', EndpointConnectionError(endpoint_url='https://sqs'))
+        self.assertTrue(should_collect('000000000000', 'sqs', 'us-east-1'))
+
+        # Repeated errors skip the region for that account only
+        for _ in range(2):
+            record_error('000000000000', 'sqs', 'us-east-1', EndpointConnectionError(endpoint_url='https://sqs'))
+
+        self.assertFalse(should_collect('000000000000', 'sqs', 'us-east-1'))
+        self.assertTrue(should_collect('111111111111', 'sqs', 'us-east-1'))
+        self.assertTrue(should_collect('000000000000', 'ec2', 'us-east-1'))
+
+        # Authentication errors cause the enabled regions to be retrieved again
+        error = ClientError({'Error': {'Code': 'UnrecognizedClientException'}}, 'DescribeInstances')
+        record_error('000000000000', 'ec2', 'us-east-1', Exception('An unrelated error'))
+        self.assertIn('000000000000', CachedRegions.enabled)
+
+        try:
+            raise Exception('Max retries exceeded') from error
+
+        except Exception as e:
+            record_error('000000000000', 'ec2', 'us-east-1', e)
+
+        self.assertNotIn('000000000000', CachedRegions.enabled)
+
+    def test_is_offered(self):
+        from CloudHarvestPluginAws.regions import is_offered
+
+        self.assertTrue(is_offered('lightsail', 'us-east-1'))
+        self.assertFalse(is_offered('lightsail', 'af-south-1'))
+
+        # Regions newer than the endpoint data and global services are collected
+        self.assertTrue(is_offered('lightsail', 'xx-example-1'))
+        self.assertTrue(is_offered('route53', 'us-east-1'))
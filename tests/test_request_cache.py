@@ -0,0 +1,46 @@
+from CloudHarvestPluginAws.request_cache import CachedRequests, cached_request, is_cacheable, request_key
+
+import unittest
+
+
+class TestRequestCache(unittest.TestCase):
+    def setUp(self):
+        CachedRequests.results.clear()
+
+    def test_request_key(self):
+        credentials = {'aws_access_key_id': 'a', 'aws_secret_access_key': 'b', 'aws_session_token': 'c'}
+        key = request_key(credentials, 'rds', 'us-east-1', 'describe_db_instances', {'Filters': [], 'MaxRecords': 100})
+
+        # The order of the arguments does not matter
+        self.assertEqual(key, request_key(dict(credentials), 'rds', 'us-east-1', 'describe_db_instances', {'MaxRecords': 100, 'Filters': []}))
+        self.assertNotEqual(key, request_key(credentials, 'rds', 'us-west-2', 'describe_db_instances', {'Filters': [], 'MaxRecords': 100}))
+        self.assertNotEqual(key, request_key({}, 'rds', 'us-east-1', 'describe_db_instances', {'Filters': [], 'MaxRecords': 100}))
+
+    def test_is_cacheable(self):
+        self.assertTrue(is_cacheable('describe_db_instances'))
+        self.assertFalse(is_cacheable('download_db_log_file_portion'))
+        self.assertFalse(is_cacheable('get_secret_value'))
+
+    def test_single_flight(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from time import sleep
+
+        calls = []
+
+        def loader():
+            calls.append(1)
+            sleep(0.05)
+            return [{'DBInstanceIdentifier': 'db'}]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: cached_request('key', loader, ttl=60), range(8)))
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result == [{'DBInstanceIdentifier': 'db'}] for result in results))
+        self.assertEqual(CachedRequests.locks, {})
+
+        # Failed requests are not cached
+        with self.assertRaises(ZeroDivisionError):
+            cached_request('failure', lambda: 1 / 0, ttl=60)
+
+        self.assertNotIn('failure', CachedRequests.results)
@@ -0,0 +1,89 @@
+from botocore.exceptions import ClientError, EndpointConnectionError
+from CloudHarvestPluginAws.retry import RetryBudget, RetryStats, async_call_with_retries, call_with_retries, classify_error, decorrelated_jitter
+
+import unittest
+from unittest.mock import patch
+
+
+def client_error(code: str, status: int = 400) -> ClientError:
+    return ClientError({'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}, 'DescribeSnapshots')
+
+
+class TestRetry(unittest.TestCase):
+    def test_classify_error(self):
+        self.assertEqual(classify_error(client_error('RequestLimitExceeded')), 'throttle')
+        self.assertEqual(classify_error(client_error('SlowDown', 503)), 'throttle')
+        self.assertEqual(classify_error(client_error('Anything', 429)), 'throttle')
+        self.assertEqual(classify_error(client_error('InternalError', 500)), 'transient')
+        self.assertEqual(classify_error(EndpointConnectionError(endpoint_url='https://ec2')), 'transient')
+        self.assertIsNone(classify_error(client_error('AccessDenied', 403)))
+        self.assertIsNone(classify_error(ValueError()))
+
+    def test_decorrelated_jitter(self):
+        for _ in range(100):
+            delay = decorrelated_jitter(2, base=1, cap=5)
+            self.assertGreaterEqual(delay, 1)
+            self.assertLessEqual(delay, 5)
+
+    def test_fractional_delays(self):
+        from CloudHarvestPluginAws.retry import _RetryState
+
+        # Delays may be configured as fractions of a second, including as strings
+        for base_delay in (0.5, '0.5'):
+            settings = {'platforms.aws.retries.base_delay': base_delay, 'platforms.aws.retries.max_delay': '2.5'}
+
+            with patch('CloudHarvestCoreTasks.environment.Environment.get',
+                       side_effect=lambda name, *args, **kwargs: settings.get(name)):
+                state = _RetryState(max_retries=3)
+
+            self.assertEqual((state.base, state.cap), (0.5, 2.5))
+
+    def test_retry_budget(self):
+        budget = RetryBudget(capacity=10)
+
+        self.assertTrue(budget.acquire(5))
+        self.assertTrue(budget.acquire(5))
+        self.assertFalse(budget.acquire(5))
+
+        budget.release(100)
+        self.assertEqual(budget.tokens, 10)
+
+    @patch('time.sleep')
+    def test_call_with_retries(self, sleep):
+        errors = [client_error('Throttling'), client_error('ThrottlingException')]
+
+        def function():
+            if errors:
+                raise errors.pop(0)
+
+            return 'success'
+
+        stats = RetryStats()
+        self.assertEqual(call_with_retries(function, max_retries=2, stats=stats), 'success')
+        self.assertEqual(stats.retries, 2)
+        self.assertEqual(stats.throttles, 2)
+        self.assertEqual(sleep.call_count, 2)
+
+        # Errors which are not retryable are raised immediately
+        errors.append(client_error('AccessDenied', 403))
+        with self.assertRaises(ClientError):
+            call_with_retries(function, stats=stats)
+
+        self.assertEqual(stats.retries, 2)
+
+    @patch('asyncio.sleep')
+    def test_async_call_with_retries(self, sleep):
+        from asyncio import run
+
+        errors = [client_error('Throttling')]
+
+        async def function():
+            if errors:
+                raise errors.pop(0)
+
+            return 'success'
+
+        stats = RetryStats()
+        self.assertEqual(run(async_call_with_retries(function, max_retries=2, stats=stats)), 'success')
+        self.assertEqual(stats.throttles, 1)
+        self.assertEqual(sleep.await_count, 1)
@@ -0,0 +1,103 @@
+from CloudHarvestPluginAws.s3 import CachedBucketRegions, DETAILS, bucket_region, enrich_buckets, get_bucket_detail
+
+import unittest
+from unittest.mock import patch
+
+
+def client_error(code: str, headers: dict = None):
+    from botocore.exceptions import ClientError
+
+    return ClientError({'Error': {'Code': code, 'Message': code}, 'ResponseMetadata': {'HTTPHeaders': headers or {}}}, 'S3')
+
+
+class Bucket:
+    """
+    Answers the S3 commands used by the enrichment for buckets in known regions.
+    """
+    regions = {'a': 'us-west-2', 'b': 'us-east-1', 'c': 'eu-west-1', 'd': 'ap-south-1', 'e': 'us-east-1'}
+    locations = {'a': 'us-west-2', 'b': None, 'c': 'EU', 'd': 'ap-south-1'}
+
+    def __init__(self):
+        self.calls = []
+
+    def query_aws(self, service: str, command: str, arguments: dict, region: str = None, **kwargs):
+        bucket = arguments['Bucket']
+        self.calls.append((command, bucket, region))
+
+        if command == 'get_bucket_location':
+            if bucket not in self.locations:
+                raise client_error('AccessDenied')
+
+            return self.locations[bucket]
+
+        if region != self.regions[bucket]:
+            raise client_error('PermanentRedirect', {'x-amz-bucket-region': self.regions[bucket]})
+
+        if command == 'get_bucket_policy_status' and bucket == 'a':
+            raise client_error('NoSuchBucketPolicy')
+
+        if command == 'get_bucket_policy_status' and bucket == 'b':
+            raise client_error('AccessDenied')
+
+        return {'Bucket': bucket, 'Command': command}
+
+
+class TestS3(unittest.TestCase):
+    def setUp(self):
+        CachedBucketRegions.regions.clear()
+
+        self.bucket = Bucket()
+        self.patch = patch('CloudHarvestPluginAws.tasks.aws.query_aws', side_effect=self.bucket.query_aws)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        CachedBucketRegions.regions.clear()
+
+    def test_bucket_region(self):
+        self.assertEqual(bucket_region(None), 'us-east-1')
+        self.assertEqual(bucket_region('EU'), 'eu-west-1')
+        self.assertEqual(bucket_region('ap-south-1'), 'ap-south-1')
+
+    def test_enrich_buckets(self):
+        buckets = enrich_buckets([{'Name': 'a', 'BucketRegion': 'us-west-2'}, {'Name': 'b'}, {'Name': 'c'}],
+                                 details=['Encryption', 'PolicyStatus'], account='1')
+
+        # Only the buckets without a BucketRegion are located, and every call is made in the bucket's region
+        self.assertEqual(sorted(call[1] for call in self.bucket.calls if call[0] == 'get_bucket_location'), ['b', 'c'])
+        self.assertEqual({(call[1], call[2]) for call in self.bucket.calls if call[0] != 'get_bucket_location'},
+                         {('a', 'us-west-2'), ('b', 'us-east-1'), ('c', 'eu-west-1')})
+
+        self.assertEqual([bucket['BucketRegion'] for bucket in buckets], ['us-west-2', 'us-east-1', 'eu-west-1'])
+        self.assertEqual(buckets[1]['Encryption'], {'Bucket': 'b', 'Command': 'get_bucket_encryption'})
+
+        # A missing configuration is an empty result
+        self.assertIsNone(buckets[0]['PolicyStatus'])
+
+        # Regions are cached
+        self.bucket.calls.clear()
+        enrich_buckets([{'Name': 'b'}, {'Name': 'c'}], details=['Versioning'], account='1')
+
+        self.assertNotIn('get_bucket_location', [call[0] for call in self.bucket.calls])
+
+    def test_access_denied(self):
+        buckets = enrich_buckets([{'Name': 'a', 'BucketRegion': 'us-west-2'}, {'Name': 'b'}, {'Name': 'e'}],
+                                 details=['Encryption', 'PolicyStatus'], account='1')
+
+        # A denied detail is stored as its empty value and recorded without failing the other buckets
+        self.assertIsNone(buckets[1]['PolicyStatus'])
+        self.assertEqual(buckets[1]['Errors'], {'PolicyStatus': 'AccessDenied'})
+        self.assertEqual(buckets[1]['Encryption'], {'Bucket': 'b', 'Command': 'get_bucket_encryption'})
+        self.assertNotIn('Errors', buckets[0])
+
+        # A bucket which cannot be located keeps its list_buckets keys
+        self.assertEqual(buckets[2], {'Name': 'e', 'Errors': {'BucketRegion': 'AccessDenied'}})
+
+    def test_moved_bucket(self):
+        CachedBucketRegions.regions.set(('1', 'd'), 'us-east-1')
+
+        result = get_bucket_detail('d', region='us-east-1', detail=DETAILS['Tags'], account='1')
+
+        self.assertEqual(result, {'Bucket': 'd', 'Command': 'get_bucket_tagging'})
+        self.assertEqual([call[2] for call in self.bucket.calls], ['us-east-1', 'ap-south-1'])
+        self.assertEqual(CachedBucketRegions.regions.get(('1', 'd')), 'ap-south-1')
@@ -0,0 +1,112 @@
+from CloudHarvestPluginAws.shard import merge_shards, record_name_shards, take_until, time_shards
+
+import unittest
+
+
+# Record sets in the order Route 53 returns them
+RECORD_SETS = [
+    {'Name': name, 'Type': record_type}
+    for name in ('example.com.', 'api.example.com.', 'mail.example.com.', 'www.example.com.')
+    for record_type in ('A', 'TXT')
+]
+
+
+def list_resource_record_sets(arguments: dict) -> list:
+    start = next((index for index, record in enumerate(RECORD_SETS)
+                  if record['Name'] == arguments.get('StartRecordName')
+                  and record['Type'] == arguments.get('StartRecordType', record['Type'])), 0)
+
+    return RECORD_SETS[start:]
+
+
+class TestShard(unittest.TestCase):
+    def test_time_shards(self):
+        from datetime import datetime, timezone
+
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2024, 1, 8, tzinfo=timezone.utc)
+
+        shards = time_shards({'StartTime': start, 'EndTime': end, 'SourceType': 'db-instance'}, windows=7)
+
+        self.assertEqual(len(shards), 7)
+        self.assertEqual(shards[0].arguments['StartTime'], start)
+        self.assertEqual(shards[-1].arguments['EndTime'], end)
+        self.assertEqual(shards[0].arguments['SourceType'], 'db-instance')
+
+        # The windows are contiguous
+        for previous, following in zip(shards, shards[1:]):
+            self.assertEqual(previous.arguments['EndTime'], following.arguments['StartTime'])
+
+        # Short ranges are split into fewer windows
+        self.assertEqual(len(time_shards({'StartTime': start, 'EndTime': start.replace(hour=2)}, windows=7)), 2)
+
+        # Without a start time, the listing is not split
+        self.assertEqual(len(time_shards({}, windows=7)), 1)
+
+    def test_record_name_shards(self):
+        def locate(arguments):
+            # Returns the first record at or after the start name, using the same order as RECORD_SETS
+            names = [record['Name'] for record in RECORD_SETS]
+            candidates = [record for record in RECORD_SETS if record['Name'] >= arguments['StartRecordName'] and names.index(record['Name']) > 0]
+            return candidates[0] if candidates else None
+
+        shards = record_name_shards({'HostedZoneId': 'Z1'}, zone_name='example.com', prefixes=['b', 'n', 'z'], locate=locate)
+
+        # 'z' is past the last record, so there are three shards
+        self.assertEqual(len(shards), 3)
+        self.assertNotIn('StartRecordName', shards[0].arguments)
+        self.assertEqual(shards[1].arguments['StartRecordName'], 'mail.example.com.')
+        self.assertEqual(shards[2].arguments['StartRecordName'], 'www.example.com.')
+        self.assertIsNone(shards[-1].stop)
+
+        # Every record is retrieved exactly once
+        records = merge_shards([take_until([list_resource_record_sets(shard.arguments)], stop=shard.stop) for shard in shards])
+        self.assertEqual(records, RECORD_SETS)
+
+    def test_take_until(self):
+        pages = iter([RECORD_SETS[:3], RECORD_SETS[3:6], RECORD_SETS[6:]])
+
+        self.assertEqual(take_until(pages, stop=RECORD_SETS[4]), RECORD_SETS[:4])
+
+        # The last page was not requested
+        self.assertEqual(next(pages), RECORD_SETS[6:])
+
+    def test_merge_shards(self):
+        shards = [
+            [{'DBSnapshotArn': 'a', 'SnapshotType': 'automated'}, {'DBSnapshotArn': 'b', 'SnapshotType': 'manual'}],
+            [{'DBSnapshotArn': 'b', 'SnapshotType': 'shared'}, {'DBSnapshotArn': 'c', 'SnapshotType': 'shared'}],
+        ]
+
+        merged = merge_shards(shards, keys=['DBSnapshotArn'])
+
+        self.assertEqual([record['DBSnapshotArn'] for record in merged], ['a', 'b', 'c'])
+        self.assertEqual(merged[1]['SnapshotType'], 'manual')
+
+    def test_min_size_without_size(self):
+        from botocore.stub import Stubber
+        from CloudHarvestPluginAws.clients import get_client
+        from CloudHarvestPluginAws.tasks.aws import AwsTask
+
+        task = object.__new__(AwsTask)
+        task.name = 'Instance Snapshots'
+        task.shard = {'strategy': 'values', 'name': 'SnapshotType', 'values': ['automated', 'manual'], 'min_size': 2,
+                      'keys': ['DBSnapshotArn']}
+
+        options = {'service': 'rds', 'command': 'describe_db_snapshots', 'region': 'us-east-1', 'max_retries': 0}
+
+        with Stubber(get_client('rds', 'us-east-1')) as stubber:
+            # A first page smaller than min_size is the whole listing, so it is not sharded
+            stubber.add_response('describe_db_snapshots', {'DBSnapshots': [{'DBSnapshotArn': 'a'}]})
+
+            self.assertEqual(task._query(arguments={}, options=options), [{'DBSnapshotArn': 'a'}])
+            stubber.assert_no_pending_responses()
+
+            # A full first page is discarded and the listing is sharded
+            stubber.add_response('describe_db_snapshots', {'DBSnapshots': [{'DBSnapshotArn': 'a'}, {'DBSnapshotArn': 'b'}], 'Marker': 'm'})
+            stubber.add_response('describe_db_snapshots', {'DBSnapshots': [{'DBSnapshotArn': 'a'}]})
+            stubber.add_response('describe_db_snapshots', {'DBSnapshots': [{'DBSnapshotArn': 'b'}]})
+
+            records = task._query(arguments={}, options=options)
+            stubber.assert_no_pending_responses()
+
+        self.assertEqual(sorted(record['DBSnapshotArn'] for record in records), ['a', 'b'])
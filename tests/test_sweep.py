@@ -0,0 +1,140 @@
+from CloudHarvestPluginAws.sweep import Sweep, SweepUnit, clear_history, estimate_unit, get_history, plan_sweep, record_history
+
+import unittest
+
+
+def unit(template: str, account: str = '000000000000', region: str = 'us-east-1', service: str = 'ec2') -> SweepUnit:
+    return SweepUnit(template=template, service=service, type=template, account=account, region=region)
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        clear_history()
+
+        for template, seconds in (('a', 10), ('b', 6), ('c', 4), ('d', 4)):
+            record_history(template, '000000000000', 'us-east-1', seconds=seconds, calls=seconds * 10)
+
+    def tearDown(self):
+        clear_history()
+
+    def test_history(self):
+        history = record_history('a', '000000000000', 'us-east-1', seconds=20, calls=None)
+
+        # A moving average; the calls are kept when they are unknown
+        self.assertEqual((history['seconds'], history['calls'], history['runs']), (15, 100, 2))
+
+        # Another region uses the template's history, and an unknown template uses the defaults
+        self.assertEqual(estimate_unit(unit('a', region='eu-west-1')), (15, 100, False))
+        self.assertEqual(estimate_unit(unit('e')), (30, 10, False))
+
+    def test_estimate(self):
+        units = [unit('c'), unit('a'), unit('d'), unit('b')]
+
+        estimate = Sweep(units, max_workers=2).estimate()
+
+        self.assertEqual(estimate['units'], 4)
+        self.assertEqual(estimate['calls'], 240)
+        self.assertEqual(estimate['seconds'], 24)
+        self.assertEqual(estimate['duration'], 14)
+        self.assertEqual(estimate['unknown'], 0)
+
+        # One unit at a time per account
+        self.assertEqual(Sweep(units, max_workers=2, max_per_account=1).estimate()['duration'], 24)
+
+        # A dry run does not call the runner
+        self.assertEqual(Sweep(units, max_workers=2).run(runner=None, dry_run=True), estimate)
+
+    def test_run(self):
+        from threading import Lock
+        from time import sleep
+        from CloudHarvestPluginAws.offline import offline
+        from CloudHarvestPluginAws.tasks.aws import query_aws
+
+        lock = Lock()
+        running = {}
+        peak = {}
+
+        def runner(sweep_unit: SweepUnit):
+            with lock:
+                running[sweep_unit.account] = running.get(sweep_unit.account, 0) + 1
+                peak[sweep_unit.account] = max(peak.get(sweep_unit.account, 0), running[sweep_unit.account])
+
+            try:
+                if sweep_unit.template == 'fails':
+                    raise ValueError('failed')
+
+                sleep(0.01)
+
+                return [query_aws(service='ec2', command='describe_vpcs', arguments={}, region=sweep_unit.region)
+                        for _ in range(2)]
+
+            finally:
+                with lock:
+                    running[sweep_unit.account] -= 1
+
+        units = [unit(template, account=account) for template in ('a', 'b', 'c', 'fails') for account in ('1', '2')]
+
+        with offline():
+            results = Sweep(units, max_workers=4, max_per_account=1).run(runner)
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(peak, {'1': 1, '2': 1})
+
+        failed = [result for result in results if result.error is not None]
+        self.assertEqual(len(failed), 2)
+        self.assertIsNone(get_history('fails', '1', 'us-east-1'))
+
+        history = get_history('a', '1', 'us-east-1')
+        self.assertEqual((history['calls'], history['runs']), (2, 1))
+
+    def test_incremental_state(self):
+        from CloudHarvestPluginAws.incremental import clear_state, get_state, stage_state
+
+        def runner(sweep_unit: SweepUnit):
+            stage_state(('000000000000', sweep_unit.region, sweep_unit.template), watermark=1, owner=(sweep_unit.service, sweep_unit.type))
+
+            if sweep_unit.template == 'fails':
+                raise ValueError('failed')
+
+        try:
+            Sweep([unit('a'), unit('fails')], max_workers=1).run(runner)
+
+            # The state of the unit which stored its records is stored; the failed unit's state is discarded
+            self.assertEqual(get_state(('000000000000', 'us-east-1', 'a'))['watermark'], 1)
+            self.assertIsNone(get_state(('000000000000', 'us-east-1', 'fails')))
+
+        finally:
+            clear_state()
+
+    def test_refresh_reports(self):
+        from unittest.mock import patch
+
+        def runner(sweep_unit: SweepUnit):
+            if sweep_unit.template == 'fails':
+                raise ValueError('failed')
+
+        with patch('CloudHarvestPluginAws.materialized.refresh') as refresh:
+            Sweep([unit('a'), unit('fails')], max_workers=1).run(runner)
+            refresh.assert_not_called()
+
+            Sweep([unit('a'), unit('fails')], max_workers=1).run(runner, refresh_reports=True)
+
+        # Only units which succeeded refresh their reports
+        refresh.assert_called_once_with(account='000000000000', region='us-east-1', service='ec2', type='a')
+
+    def test_plan_sweep(self):
+        units = plan_sweep(accounts=['1', '2'], regions=['us-east-1', 'us-west-2'], prune=False,
+                           templates=['services.aws.ec2.snapshots', 'services.aws.route53.hosted-zones'])
+
+        # Global templates are collected once per account
+        self.assertEqual(len(units), 6)
+        self.assertIn(SweepUnit(template='services.aws.route53.hosted-zones', service='route53', type='hosted-zones', account='1', region=None),
+                      units)
+
+        record_history('services.aws.ec2.snapshots', '2', 'us-west-2', seconds=600)
+
+        # Longest first; other snapshot units use the template's history
+        units = plan_sweep(accounts=['1', '2'], regions=['us-east-1', 'us-west-2'], prune=False,
+                           templates=['services.aws.route53.hosted-zones', 'services.aws.ec2.snapshots'])
+
+        self.assertEqual({u.template for u in units[:4]}, {'services.aws.ec2.snapshots'})
@@ -0,0 +1,43 @@
+from CloudHarvestPluginAws.tagging import get_tag_index, merge_tags, tags_to_dict
+
+import unittest
+
+
+class TestTagging(unittest.TestCase):
+    def test_get_tag_index(self):
+        from botocore.stub import Stubber
+        from CloudHarvestPluginAws.clients import get_client
+
+        client = get_client('resourcegroupstaggingapi', 'us-east-1')
+
+        with Stubber(client) as stubber:
+            stubber.add_response('get_resources',
+                                 {'ResourceTagMappingList': [{'ResourceARN': 'arn:a', 'Tags': [{'Key': 'Name', 'Value': 'a'}]}],
+                                  'PaginationToken': 'next'},
+                                 {'ResourceTypeFilters': ['sqs']})
+            stubber.add_response('get_resources',
+                                 {'ResourceTagMappingList': [{'ResourceARN': 'arn:b', 'Tags': []}],
+                                  'PaginationToken': ''},
+                                 {'ResourceTypeFilters': ['sqs'], 'PaginationToken': 'next'})
+
+            index = get_tag_index(region='us-east-1', resource_types=['sqs'], arns=['arn:%s' % i for i in range(101)])
+
+        self.assertEqual(index, {'arn:a': {'Name': 'a'}, 'arn:b': {}})
+
+        # A small number of resources is requested by ARN
+        with Stubber(client) as stubber:
+            stubber.add_response('get_resources', {'ResourceTagMappingList': []}, {'ResourceARNList': ['arn:a']})
+
+            self.assertEqual(get_tag_index(region='us-east-1', resource_types=['sqs'], arns=['arn:a']), {})
+
+    def test_merge_tags(self):
+        records = [{'QueueArn': 'arn:a'}, {'QueueArn': 'arn:b'}]
+        merge_tags(records, {'arn:a': {'Name': 'a'}}, arn_key='QueueArn')
+
+        # Resources which are missing from the index have no tags
+        self.assertEqual(records, [{'QueueArn': 'arn:a', 'Tags': {'Name': 'a'}}, {'QueueArn': 'arn:b', 'Tags': {}}])
+
+    def test_tags_to_dict(self):
+        self.assertEqual(tags_to_dict([{'TagKey': 'Name', 'TagValue': 'a'}], name_key='TagKey', value_key='TagValue'), {'Name': 'a'})
+        self.assertEqual(tags_to_dict({'Name': 'a'}), {'Name': 'a'})
+        self.assertEqual(tags_to_dict(None), {})
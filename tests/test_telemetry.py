@@ -0,0 +1,66 @@
+from CloudHarvestPluginAws import telemetry
+
+import unittest
+
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        telemetry.reset()
+
+    def test_query_aws(self):
+        from botocore.stub import Stubber
+        from CloudHarvestPluginAws.clients import get_client
+        from CloudHarvestPluginAws.tasks.aws import query_aws
+
+        with Stubber(get_client('rds', region='us-east-1')) as stubber:
+            stubber.add_response('describe_db_instances', {'DBInstances': [{'DBInstanceIdentifier': 'a'}], 'Marker': 'next'}, {})
+            stubber.add_response('describe_db_instances', {'DBInstances': [{'DBInstanceIdentifier': 'b'}]}, {'Marker': 'next'})
+
+            with telemetry.tags(account='000000000000', template='services.aws.rds.instances'):
+                query_aws(service='rds', command='describe_db_instances', arguments={}, region='us-east-1')
+
+        metrics = telemetry.snapshot(kind='call')
+
+        self.assertEqual(len(metrics), 1)
+        self.assertEqual(metrics[0]['account'], '000000000000')
+        self.assertEqual(metrics[0]['template'], 'services.aws.rds.instances')
+        self.assertEqual(metrics[0]['command'], 'describe_db_instances')
+        self.assertEqual(metrics[0]['count'], 1)
+        self.assertEqual(metrics[0]['pages'], 2)
+        self.assertEqual(sum(metrics[0]['page_latency'].values()), 2)
+
+    def test_measure(self):
+        with self.assertRaises(ValueError):
+            with telemetry.measure('get_profile', account='000000000000', role='harvest') as event:
+                event['source'] = 'assume_role'
+                raise ValueError()
+
+        metric = telemetry.snapshot(kind='get_profile')[0]
+
+        self.assertEqual(metric['source'], 'assume_role')
+        self.assertEqual(metric['errors'], 1)
+
+    def test_bind(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        def template(_):
+            return telemetry._tags.get().get('template')
+
+        with telemetry.tags(template='services.aws.ec2.instances'):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                self.assertEqual(list(executor.map(telemetry.bind(template), range(2))), ['services.aws.ec2.instances'] * 2)
+
+    def test_metrics_route(self):
+        from flask import Flask
+        from CloudHarvestPluginAws.api.blueprints.metrics.routes import metrics_bp
+
+        with telemetry.measure('refresh_credentials', account='000000000000', role='harvest', source='sts'):
+            pass
+
+        app = Flask(__name__)
+        app.register_blueprint(metrics_bp)
+
+        response = app.test_client().get('/aws/metrics?kind=refresh_credentials&limit=5')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()[0]['account'], '000000000000')